@@ -0,0 +1,222 @@
+"""
+Compact, deduplicated store of the topic models produced by the sweep.
+
+save_model() used to pickle every BERTopic model of the grid search, each with its own
+copy of the UMAP and HDBSCAN state and of the vectorizer vocabulary. ArtifactStore saves
+them in BERTopic's safetensors format instead (the format ModelFinetune loads with
+BERTopic.load(.../'safetensor')), with c-TF-IDF and a pointer to the embedding model
+rather than the model itself. Files are stored once by content: configurations that
+share a file (the vectorizer vocabulary and c-TF-IDF config, the BERTopic config with
+the embedding model name) share one blob, and each model directory is made of hard
+links to the blobs, so it loads with BERTopic.load() as is.
+
+    store = ArtifactStore('Wildfire/model')
+    store.save(topic_model, 'n30_d0.01_cs300')
+    candidates = store.candidates(embedding_model=embedding_model)
+    candidates['n30_d0.01_cs300'].get_topic_info()  # loaded on first access
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+
+from embeddings import DEFAULT_MODEL
+
+
+def file_hash(path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ArtifactStore:
+    """
+    Content-addressed store of safetensors topic models.
+
+    Layout: `blobs/<sha256>` holds every distinct file once, `models/<identifier>/` holds
+    hard links to the blobs under their BERTopic file names (copies where hard links are
+    not supported), and `models/<identifier>/manifest.json` lists them.
+
+    Args:
+        root (str): Directory of the store (created if it does not exist).
+    """
+
+    def __init__(self, root: str = 'artifacts'):
+        self.root = Path(root)
+        self.blobs = self.root / 'blobs'
+        self.models = self.root / 'models'
+        self.blobs.mkdir(parents=True, exist_ok=True)
+        self.models.mkdir(parents=True, exist_ok=True)
+
+    def path(self, identifier: str) -> Path:
+        return self.models / identifier
+
+    def _add_blob(self, path: Path) -> str:
+        digest = file_hash(path)
+        blob = self.blobs / digest
+        if not blob.exists():
+            # Another process may store the same blob; both write identical content
+            partial = self.blobs / f"{digest}.{os.getpid()}.partial"
+            shutil.copyfile(path, partial)
+            os.replace(partial, blob)
+        return digest
+
+    def _link(self, digest: str, target: Path):
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(self.blobs / digest, target)
+        except OSError:
+            shutil.copyfile(self.blobs / digest, target)
+
+    def save(self, topic_model, identifier: str, embedding_model_name: str = DEFAULT_MODEL) -> str:
+        """
+        Saves a topic model under an identifier, replacing any previous version.
+
+        Returns:
+            str: The model directory, loadable with BERTopic.load().
+        """
+        with tempfile.TemporaryDirectory(dir=self.root) as tmp:
+            topic_model.save(tmp, serialization="safetensors", save_ctfidf=True,
+                             save_embedding_model=embedding_model_name)
+            files = {}
+            for path in sorted(Path(tmp).rglob('*')):
+                if path.is_file():
+                    files[path.relative_to(tmp).as_posix()] = self._add_blob(path)
+
+        model_dir = self.path(identifier)
+        staging = self.models / f".{identifier}.{os.getpid()}.partial"
+        shutil.rmtree(staging, ignore_errors=True)
+        for name, digest in files.items():
+            self._link(digest, staging / name)
+        (staging / 'manifest.json').write_text(json.dumps({'identifier': identifier, 'files': files}, indent=2))
+        shutil.rmtree(model_dir, ignore_errors=True)
+        os.replace(staging, model_dir)
+        return str(model_dir)
+
+    def identifiers(self) -> list:
+        return sorted(p.name for p in self.models.iterdir()
+                      if not p.name.startswith('.') and (p / 'manifest.json').exists())
+
+    def manifest(self, identifier: str) -> dict:
+        return json.loads((self.path(identifier) / 'manifest.json').read_text())
+
+    def topic_representations(self, identifier: str) -> dict:
+        """Topic words and weights of a model, read from its topics.json without loading it."""
+        topics = json.loads((self.path(identifier) / 'topics.json').read_text())
+        return {int(topic): words for topic, words in topics['topic_representations'].items()}
+
+    def load(self, identifier: str, embedding_model=None):
+        from bertopic import BERTopic
+
+        return BERTopic.load(str(self.path(identifier)), embedding_model=embedding_model)
+
+    def candidates(self, identifiers=None, embedding_model=None, max_loaded: int = 8) -> 'Candidates':
+        """Lazily loaded models, e.g. the top configurations of the sweep."""
+        return Candidates(self, identifiers or self.identifiers(), embedding_model, max_loaded)
+
+    def disk_usage(self) -> dict:
+        """Bytes stored in blobs, against the bytes the model directories would take as copies."""
+        stored = sum(p.stat().st_size for p in self.blobs.iterdir() if p.is_file())
+        blob_sizes = {p.name: p.stat().st_size for p in self.blobs.iterdir() if p.is_file()}
+        logical = sum(blob_sizes.get(digest, 0) for identifier in self.identifiers()
+                      for digest in self.manifest(identifier)['files'].values())
+        return {'models': len(self.identifiers()), 'blobs': len(blob_sizes), 'stored_bytes': stored,
+                'logical_bytes': logical}
+
+    def gc(self) -> int:
+        """Removes blobs no model refers to. Returns the number removed."""
+        used = {digest for identifier in self.identifiers() for digest in self.manifest(identifier)['files'].values()}
+        removed = 0
+        for blob in self.blobs.iterdir():
+            if '.' not in blob.name and blob.name not in used:  # Leaves blobs being written
+                blob.unlink()
+                removed += 1
+        return removed
+
+
+class Candidates:
+    """
+    Mapping identifier -> BERTopic model that loads models on first access and keeps at most
+    `max_loaded` of them in memory (least recently used first out). All models share one
+    embedding model, so it is loaded once.
+    """
+
+    def __init__(self, store: ArtifactStore, identifiers, embedding_model=None, max_loaded: int = 8):
+        self.store = store
+        self.identifiers = list(identifiers)
+        self.embedding_model = embedding_model
+        self.max_loaded = max_loaded
+        self._loaded = OrderedDict()
+
+    def __len__(self):
+        return len(self.identifiers)
+
+    def __iter__(self):
+        return iter(self.identifiers)
+
+    def __contains__(self, identifier):
+        return identifier in self.identifiers
+
+    def __getitem__(self, identifier):
+        if identifier not in self.identifiers:
+            raise KeyError(identifier)
+        if identifier in self._loaded:
+            self._loaded.move_to_end(identifier)
+            return self._loaded[identifier]
+        model = self.store.load(identifier, self.embedding_model)
+        if self.embedding_model is None:
+            self.embedding_model = model.embedding_model
+        self._loaded[identifier] = model
+        while len(self._loaded) > self.max_loaded:
+            self._loaded.popitem(last=False)
+        return model
+
+    def topic_representations(self, identifier):
+        return self.store.topic_representations(identifier)
+
+
+def import_pickles(store: ArtifactStore, pickle_dir: str, embedding_model_name: str = DEFAULT_MODEL) -> list:
+    """Stores the pickled `model_<identifier>` files of an earlier grid search. Returns the identifiers."""
+    from bertopic import BERTopic
+
+    identifiers = []
+    for path in sorted(Path(pickle_dir).glob('model_*')):
+        if not path.is_file():
+            continue
+        identifier = path.name[len('model_'):]
+        store.save(BERTopic.load(str(path)), identifier, embedding_model_name)
+        identifiers.append(identifier)
+        print(f"Stored {identifier}")
+    return identifiers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduplicated safetensors store of sweep models")
+    parser.add_argument("store", help="Store directory")
+    parser.add_argument("--import-pickles", metavar="DIR",
+                        help="Store the pickled model_<identifier> files of an earlier grid search")
+    parser.add_argument("--model", default=DEFAULT_MODEL,
+                        help=f"Embedding model name saved with imported models (default: {DEFAULT_MODEL})")
+    parser.add_argument("--gc", action="store_true", help="Remove blobs no model refers to")
+    args = parser.parse_args()
+
+    store = ArtifactStore(args.store)
+    if args.import_pickles:
+        import_pickles(store, args.import_pickles, args.model)
+    if args.gc:
+        print(f"Removed {store.gc()} unused blobs")
+    usage = store.disk_usage()
+    print(f"{usage['models']} models, {usage['blobs']} blobs: {usage['stored_bytes'] / 1e6:,.1f} MB stored "
+          f"for {usage['logical_bytes'] / 1e6:,.1f} MB of model files")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
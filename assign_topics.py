@@ -0,0 +1,371 @@
+"""
+Topic assignment for new comments with the fine-tuned BERTopic model.
+
+ModelFinetune and Temporospatial only know the topics of the training comments
+(`model_ft.topics_`). TopicAssigner loads the safetensors model once and assigns topics to
+new texts in micro-batches: the texts are preprocessed as the corpus was (preprocess.py),
+embedded in one encode() call per batch and passed to transform() with their embeddings.
+Every result carries the topic's Situational Awareness, Crisis Narrative, Grief and
+Mental labels from all_final_comments_multiple_label.csv.
+
+    assigner = TopicAssigner.from_path('models/safetensor', 'datasets/reddit/all_final_comments_multiple_label.csv')
+    for record in assigner.stream(new_comments['body']):
+        ...
+    assigner.stats.summary()  # throughput and latency percentiles
+
+The CLI assigns a comments file (or stdin, one text per line) and writes JSON lines, or
+with --serve answers HTTP requests on a local port:
+
+    POST /assign  {"texts": ["...", ...]}  ->  {"results": [{...}, ...]}
+    GET  /stats                            ->  throughput and latency percentiles
+
+Requests arriving together are merged into shared batches (MicroBatcher), so concurrent
+clients are served with the same batched transform() calls.
+"""
+
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from embeddings import backend_model
+
+LABEL_COLUMNS = ['Situational Awareness', 'Crisis Narrative', 'Grief', 'Mental']
+PASSTHROUGH_COLUMNS = ['comment_id', 'post_id', 'created_utc']
+
+
+def load_topic_labels(path: str) -> dict:
+    """{topic ID: {label column: value}} from the labelled topic table (column `Topic`)."""
+    df = pd.read_csv(path).drop_duplicates('Topic')
+    df = df[['Topic'] + [column for column in LABEL_COLUMNS if column in df.columns]]
+    df = df.astype(object).where(df.notna(), None)
+    return {int(row.pop('Topic')): row for row in df.to_dict('records')}
+
+
+def topic_names(topic_model) -> dict:
+    """Topic names as ModelFinetune sets them: the OpenAI labels if the model has them."""
+    aspects = getattr(topic_model, 'topic_aspects_', None) or {}
+    if 'OpenAI' in aspects:
+        names = {topic: " | ".join(list(zip(*values))[0]) for topic, values in aspects['OpenAI'].items() if values}
+        names[-1] = "Outlier Topic"
+        return names
+    return dict(topic_model.topic_labels_)
+
+
+def batched(texts, batch_size: int):
+    batch = []
+    for text in texts:
+        batch.append(text)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class LatencyStats:
+    """
+    Thread-safe throughput and latency figures over the last `window` batches and requests.
+    """
+
+    def __init__(self, window: int = 10000):
+        self._lock = threading.Lock()
+        self._batches = deque(maxlen=window)  # (documents, seconds)
+        self._requests = deque(maxlen=window)  # seconds, queueing included
+        self.documents = 0
+        self.busy_seconds = 0.0
+        self.started = time.perf_counter()
+
+    def record_batch(self, documents: int, seconds: float):
+        with self._lock:
+            self._batches.append((documents, seconds))
+            self.documents += documents
+            self.busy_seconds += seconds
+
+    def record_request(self, seconds: float):
+        with self._lock:
+            self._requests.append(seconds)
+
+    @staticmethod
+    def _percentiles(values) -> dict:
+        if not len(values):
+            return {}
+        p50, p90, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 90, 95, 99])
+        return {'p50_ms': p50, 'p90_ms': p90, 'p95_ms': p95, 'p99_ms': p99, 'max_ms': max(values) * 1000}
+
+    def summary(self) -> dict:
+        with self._lock:
+            batches = list(self._batches)
+            requests = list(self._requests)
+            documents, busy = self.documents, self.busy_seconds
+        uptime = time.perf_counter() - self.started
+        return {
+            'documents': documents,
+            'batches': len(batches),
+            'mean_batch_size': float(np.mean([n for n, _ in batches])) if batches else 0.0,
+            'uptime_s': uptime,
+            'busy_docs_per_sec': documents / busy if busy else 0.0,
+            'docs_per_sec': documents / uptime if uptime else 0.0,
+            'batch_latency': self._percentiles([s for _, s in batches]),
+            'doc_latency': self._percentiles([s / n for n, s in batches if n]),
+            'request_latency': self._percentiles(requests),
+        }
+
+
+class TopicAssigner:
+    """
+    Assigns topics and topic labels to texts with a loaded BERTopic model.
+
+    Args:
+        topic_model: The BERTopic model, e.g. BERTopic.load('models/safetensor').
+        labels (dict): {topic ID: {label column: value}}, from load_topic_labels().
+        embedding_model: SentenceTransformer; defaults to the model's embedding backend.
+        batch_size (int): Texts per transform() call in stream().
+        encode_batch_size (int): Batch size passed to encode().
+        preprocess (bool): Apply preprocess_document() first; turn off for texts that are
+            already in `corpus` form.
+    """
+
+    def __init__(self, topic_model, labels: dict = None, embedding_model=None, batch_size: int = 256,
+                 encode_batch_size: int = 32, preprocess: bool = True):
+        self.topic_model = topic_model
+        self.labels = labels or {}
+        self.embedding_model = embedding_model if embedding_model is not None else backend_model(topic_model)
+        self.batch_size = batch_size
+        self.encode_batch_size = encode_batch_size
+        self.preprocess = preprocess
+        self.names = topic_names(topic_model)
+        self.stats = LatencyStats()
+        if preprocess:
+            from preprocess import preprocess_document
+
+            self._preprocess_document = preprocess_document
+
+    @classmethod
+    def from_path(cls, model_path: str, labels_path: str = None, embedding_model_name: str = None, **kwargs):
+        """Loads a saved model (safetensors directory or pickle) and the topic label table."""
+        from bertopic import BERTopic
+
+        embedding_model = None
+        if embedding_model_name:
+            from embeddings import load_embedding_model
+
+            embedding_model = load_embedding_model(embedding_model_name)
+        topic_model = BERTopic.load(model_path, embedding_model=embedding_model)
+        labels = load_topic_labels(labels_path) if labels_path else None
+        return cls(topic_model, labels, embedding_model, **kwargs)
+
+    def assign(self, texts) -> list:
+        """Topic records of a batch of texts, in order."""
+        start = time.perf_counter()
+        texts = ["" if text is None else str(text) for text in texts]
+        if not texts:
+            return []
+        docs = [self._preprocess_document(text) for text in texts] if self.preprocess else texts
+        embeddings = self.embedding_model.encode(docs, batch_size=self.encode_batch_size,
+                                                 show_progress_bar=False, convert_to_numpy=True)
+        topics, probs = self.topic_model.transform(docs, embeddings=embeddings)
+        if probs is not None:
+            probs = np.asarray(probs)
+            probs = probs.max(axis=1) if probs.ndim == 2 else probs
+
+        records = []
+        for i, topic in enumerate(topics):
+            topic = int(topic)
+            record = {'topic_id': topic, 'topic_name': self.names.get(topic),
+                      'probability': float(probs[i]) if probs is not None else None}
+            record.update(self.labels.get(topic, dict.fromkeys(LABEL_COLUMNS)))
+            records.append(record)
+        self.stats.record_batch(len(texts), time.perf_counter() - start)
+        return records
+
+    def stream(self, texts):
+        """Yields the topic record of every text, transforming `batch_size` texts at a time."""
+        for batch in batched(texts, self.batch_size):
+            yield from self.assign(batch)
+
+
+def check_texts(texts) -> list:
+    """The texts of a request as a list; a single string or non-string items are a TypeError."""
+    if isinstance(texts, (str, bytes)) or not isinstance(texts, (list, tuple)):
+        raise TypeError(f"Expected a list of strings, got {type(texts).__name__}")
+    if not all(isinstance(text, str) for text in texts):
+        raise TypeError("Expected a list of strings")
+    return list(texts)
+
+
+class MicroBatcher:
+    """
+    Merges texts submitted from several threads into batches of up to `batch_size`, waiting
+    at most `max_wait` seconds for a batch to fill, and assigns them on one thread.
+    """
+
+    def __init__(self, assigner: TopicAssigner, batch_size: int = None, max_wait: float = 0.02):
+        self.assigner = assigner
+        self.batch_size = batch_size or assigner.batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, texts) -> Future:
+        texts = check_texts(texts)
+        future = Future()
+        self._queue.put((texts, future, time.perf_counter()))
+        return future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            pending = [item]
+            size = len(item[0])
+            deadline = time.perf_counter() + self.max_wait
+            while size < self.batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                pending.append(item)
+                size += len(item[0])
+            self._process(pending)
+
+    def _process(self, pending):
+        try:
+            records = self.assigner.assign([text for texts, _, _ in pending for text in texts])
+        except Exception as e:
+            for _, future, _ in pending:
+                future.set_exception(e)
+            return
+        offset = 0
+        now = time.perf_counter()
+        for texts, future, submitted in pending:
+            future.set_result(records[offset:offset + len(texts)])
+            offset += len(texts)
+            self.assigner.stats.record_request(now - submitted)
+
+
+def make_handler(batcher: MicroBatcher):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, payload: dict):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self._send(200, batcher.assigner.stats.summary())
+            elif self.path == '/health':
+                self._send(200, {'status': 'ok'})
+            else:
+                self._send(404, {'error': f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != '/assign':
+                self._send(404, {'error': f"Unknown path {self.path}"})
+                return
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                texts = check_texts(payload['texts'] if 'texts' in payload else [payload['text']])
+            except (ValueError, KeyError, TypeError):
+                self._send(400, {'error': 'Expected a JSON body {"texts": ["...", ...]} (strings) or {"text": "..."}'})
+                return
+            try:
+                self._send(200, {'results': batcher.submit(texts).result()})
+            except Exception as e:
+                self._send(500, {'error': str(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(assigner: TopicAssigner, host: str = '127.0.0.1', port: int = 8000, max_wait: float = 0.02):
+    batcher = MicroBatcher(assigner, max_wait=max_wait)
+    server = ThreadingHTTPServer((host, port), make_handler(batcher))
+    print(f"Serving topic assignment on http://{host}:{port} (POST /assign, GET /stats)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+
+
+def iter_input(path: str, column: str, chunksize: int = 10000):
+    """Yields frames of texts (plus ID columns, if any) from a CSV/Parquet file, or stdin lines for '-'."""
+    if path == '-':
+        for lines in batched((line.rstrip('\n') for line in sys.stdin), chunksize):
+            yield pd.DataFrame({column: lines})
+    elif path.endswith('.parquet'):
+        yield pd.read_parquet(path)
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize, dtype={'comment_id': str, 'post_id': str})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Assign topics and topic labels to new comments")
+    parser.add_argument("model", help="Saved BERTopic model, e.g. models/safetensor")
+    parser.add_argument("-l", "--labels", help="Labelled topic table, e.g. all_final_comments_multiple_label.csv")
+    parser.add_argument("-i", "--input", default="-", help="Comments CSV/Parquet file, or - for one text per stdin line")
+    parser.add_argument("-o", "--output", help="JSON lines output (default: stdout)")
+    parser.add_argument("-c", "--column", default="body", help="Text column (default: body)")
+    parser.add_argument("--no-preprocess", action="store_true", help="Texts are already preprocessed (corpus column)")
+    parser.add_argument("--embedding-model", help="SentenceTransformer to use instead of the one saved with the model")
+    parser.add_argument("-b", "--batch-size", type=int, default=256, help="Texts per batch (default: 256)")
+    parser.add_argument("--serve", action="store_true", help="Serve HTTP requests instead of reading --input")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to bind with --serve (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Port with --serve (default: 8000)")
+    parser.add_argument("--max-wait", type=float, default=0.02,
+                        help="Seconds a batch waits for more requests with --serve (default: 0.02)")
+    args = parser.parse_args()
+
+    assigner = TopicAssigner.from_path(args.model, args.labels, args.embedding_model, batch_size=args.batch_size,
+                                       preprocess=not args.no_preprocess)
+    if args.serve:
+        serve(assigner, args.host, args.port, args.max_wait)
+        return 0
+
+    if args.input != '-' and not Path(args.input).is_file():
+        print(f"Error: {args.input} not found")
+        return 1
+    out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        for frame in iter_input(args.input, args.column):
+            ids = frame[[column for column in PASSTHROUGH_COLUMNS if column in frame.columns]]
+            ids = ids.astype(object).where(ids.notna(), None).to_dict('records')
+            for row, record in zip(ids, assigner.stream(frame[args.column].tolist())):
+                out.write(json.dumps({**row, **record}) + '\n')
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(json.dumps(assigner.stats.summary(), indent=2), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
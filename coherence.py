@@ -0,0 +1,261 @@
+"""
+Precomputed co-occurrence index for c_v topic coherence.
+
+compute_coherence() in the grid search rebuilt the analyzer tokens, a gensim Dictionary
+of 763k tokens and a bag-of-words corpus for every model, and CoherenceModel then
+re-scanned 5.2M sliding-window positions with a 95-process accumulator. CoherenceIndex
+tokenizes the corpus once and keeps it as one integer array. Sliding-window occurrence
+and co-occurrence counts are computed for the candidate vocabulary only (the topic
+words), extended incrementally when new topic words come in, and every topic list is
+then scored by lookups.
+
+The counts reproduce gensim's WordOccurrenceAccumulator exactly, including how it
+updates a window as it slides (the token leaving the window is cleared even if it occurs
+again inside it), and the score follows the c_v pipeline (one-set segmentation, NPMI
+context vectors, cosine similarity, arithmetic mean). Scores match
+CoherenceModel(coherence='c_v') up to floating-point summation order.
+
+    index = CoherenceIndex.from_topic_model(topic_model, corpus)
+    index.add_words(words for model in models for words in topic_words(model))
+    coherence = index.score(topic_words(topic_model))
+"""
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse as sps
+
+WINDOW_SIZE = 110  # gensim's default for c_v
+EPSILON = 1e-12  # gensim.topic_coherence.direct_confirmation_measure.EPSILON
+TOPN = 20  # CoherenceModel's default
+
+
+def analyzer_tokens(topic_model, corpus) -> list:
+    """The token lists compute_coherence() scores against: BERTopic's preprocessing, then the vectorizer's analyzer."""
+    cleaned_docs = topic_model._preprocess_text(corpus)
+    analyzer = topic_model.vectorizer_model.build_analyzer()
+    return [analyzer(doc) for doc in cleaned_docs]
+
+
+def topic_words(topic_model) -> list:
+    """Topic words of a BERTopic model, without the outlier topic, as compute_coherence() takes them."""
+    topics_dict = topic_model.get_topics()
+    topics_dict.pop(-1, None)
+    return [[word for word, _ in words] for words in topics_dict.values()]
+
+
+def window_flags(ids, window_size: int):
+    """
+    Presence of the indexed words in every sliding window of a text longer than the window,
+    as gensim's WordOccurrenceAccumulator tracks it.
+
+    Args:
+        ids (np.ndarray): Index word IDs of the text's tokens, -1 for other tokens.
+        window_size (int): Window size.
+
+    Returns:
+        tuple: (word IDs, bool array of shape (words, windows)).
+    """
+    num_windows = len(ids) - window_size + 1
+    positions = np.nonzero(ids >= 0)[0]
+    words, inverse = np.unique(ids[positions], return_inverse=True)
+    # A token is set when it enters the window (all of the first window at step 0) and
+    # cleared at the step after it leaves; clearing happens before setting within a step
+    set_steps = np.maximum(positions - window_size + 1, 0)
+    last_set = np.full((len(words), num_windows), -1, dtype=np.int64)
+    last_set[inverse, set_steps] = set_steps
+    remove_steps = positions + 1
+    removed = remove_steps < num_windows
+    last_remove = np.full((len(words), num_windows), -1, dtype=np.int64)
+    last_remove[inverse[removed], remove_steps[removed]] = remove_steps[removed]
+    np.maximum.accumulate(last_set, axis=1, out=last_set)
+    np.maximum.accumulate(last_remove, axis=1, out=last_remove)
+    return words, (last_set >= 0) & (last_set >= last_remove)
+
+
+def _long_text_counts(texts, rows, cols, size, window_size):
+    """(row, col, count) triplets of the window co-occurrences of texts longer than the window."""
+    row_set = np.zeros(size, dtype=bool)
+    row_set[rows] = True
+    col_set = np.zeros(size, dtype=bool)
+    col_set[cols] = True
+    out_rows, out_cols, out_counts = [], [], []
+    for ids in texts:
+        words, flags = window_flags(ids, window_size)
+        if not len(words):
+            continue
+        in_rows = row_set[words]
+        in_cols = col_set[words]
+        if not in_rows.any() or not in_cols.any():
+            continue
+        flags = flags.astype(np.float64)
+        counts = flags[in_rows] @ flags[in_cols].T
+        r, c = np.nonzero(counts)
+        out_rows.append(words[in_rows][r])
+        out_cols.append(words[in_cols][c])
+        out_counts.append(counts[r, c].astype(np.int64))
+    if not out_rows:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    return np.concatenate(out_rows), np.concatenate(out_cols), np.concatenate(out_counts)
+
+
+class CoherenceIndex:
+    """
+    Token corpus with sliding-window occurrence counts for a growing vocabulary.
+
+    Args:
+        texts (list): Token lists, e.g. from analyzer_tokens().
+        window_size (int): Sliding window size (110 for c_v).
+        workers (int): Processes for counting long texts; the pool is kept for later
+            vocabulary extensions until close() (default: 1, in-process).
+    """
+
+    def __init__(self, texts, window_size: int = WINDOW_SIZE, workers: int = 1):
+        self.window_size = window_size
+        self.token2id = {}
+        lengths = []
+        flat = []
+        for text in texts:
+            lengths.append(len(text))
+            flat.extend(self.token2id.setdefault(token, len(self.token2id)) for token in text)
+        self.tokens = np.asarray(flat, dtype=np.int32)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(self.lengths)])
+        # Every text is at least one window, even an empty one
+        self.num_windows = int(np.maximum(self.lengths - window_size + 1, 1).sum())
+
+        short = self.lengths <= window_size
+        self._short_doc = np.repeat(np.cumsum(short) - 1, self.lengths)[np.repeat(short, self.lengths)]
+        self._short_tokens = self.tokens[np.repeat(short, self.lengths)]
+        self._long_texts = np.nonzero(~short)[0]
+
+        self.vocab = {}  # word -> index word ID
+        self._token_to_word = np.full(len(self.token2id), -1, dtype=np.int64)
+        self.co_occurrences = sps.csr_matrix((0, 0), dtype=np.int64)
+        self.workers = workers
+        self._executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        logging.info(f"Coherence index: {len(self.lengths)} texts, {len(self.tokens)} positions, "
+                     f"{len(self.token2id)} unique tokens, {self.num_windows} windows")
+
+    @classmethod
+    def from_topic_model(cls, topic_model, corpus, window_size: int = WINDOW_SIZE, workers: int = 1):
+        return cls(analyzer_tokens(topic_model, corpus), window_size, workers)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    @property
+    def occurrences(self) -> np.ndarray:
+        return self.co_occurrences.diagonal()
+
+    # --------------------------
+    # Counting
+    # --------------------------
+    def _count(self, rows: np.ndarray, cols: np.ndarray) -> sps.csr_matrix:
+        """Window co-occurrence counts of index words `rows` x `cols`, over the whole corpus."""
+        size = len(self.vocab)
+        word = self._token_to_word
+
+        # Texts that fit in one window: a window is the set of their tokens
+        short_words = word[self._short_tokens]
+        relevant = short_words >= 0
+        presence = sps.csr_matrix(
+            (np.ones(relevant.sum(), dtype=np.int64), (self._short_doc[relevant], short_words[relevant])),
+            shape=(int(self._short_doc.max(initial=-1)) + 1, size))
+        presence.data[:] = 1  # Duplicates were summed
+        counts = (presence[:, rows].T @ presence[:, cols]).tocoo()
+        r, c, v = [rows[counts.row]], [cols[counts.col]], [counts.data]
+
+        # Longer texts slide the window
+        mapped = word[self.tokens]
+        texts = [mapped[self.offsets[i]:self.offsets[i + 1]] for i in self._long_texts]
+        texts = [ids for ids in texts if ids.max() >= 0]
+        if self._executor is None:
+            parts = [_long_text_counts(texts, rows, cols, size, self.window_size)]
+        else:
+            step = max(1, -(-len(texts) // (4 * self.workers)))
+            futures = [self._executor.submit(_long_text_counts, texts[i:i + step], rows, cols, size, self.window_size)
+                       for i in range(0, len(texts), step)]
+            parts = [future.result() for future in futures]
+        for part_r, part_c, part_v in parts:
+            r.append(part_r)
+            c.append(part_c)
+            v.append(part_v)
+        return sps.csr_matrix((np.concatenate(v), (np.concatenate(r), np.concatenate(c))), shape=(size, size))
+
+    def add_words(self, words) -> int:
+        """
+        Indexes words that are in the corpus but not indexed yet. Only the counts involving
+        the new words are computed.
+
+        Returns:
+            int: Number of newly indexed words.
+        """
+        new = [w for w in dict.fromkeys(words) if w in self.token2id and w not in self.vocab]
+        if not new:
+            return 0
+        old_size = len(self.vocab)
+        for w in new:
+            self.vocab[w] = len(self.vocab)
+            self._token_to_word[self.token2id[w]] = self.vocab[w]
+        size = len(self.vocab)
+        new_ids = np.arange(old_size, size)
+        all_ids = np.arange(size)
+        block = self._count(new_ids, all_ids)  # Only the rows of the new words are filled
+        new_new = block.multiply((all_ids >= old_size)[None, :]).tocsr()
+        old = self.co_occurrences.copy()
+        old.resize((size, size))
+        self.co_occurrences = (old + block + block.T - new_new).tocsr()
+        logging.info(f"Coherence index: {len(new)} new words, {size} indexed")
+        return len(new)
+
+    # --------------------------
+    # Scoring
+    # --------------------------
+    def _topic_ids(self, topics, topn: int) -> list:
+        """Topic words as index IDs, dropping words not in the corpus, as CoherenceModel does."""
+        self.add_words(w for topic in topics for w in topic)
+        ids = []
+        for topic in topics:
+            topic_ids = [self.vocab[w] for w in topic if w in self.vocab]
+            if not topic_ids:
+                raise ValueError('unable to interpret topic as either a list of tokens or a list of ids')
+            ids.append(np.array(topic_ids))
+        if len(ids[0]) > topn:
+            ids = [topic_ids[:topn] for topic_ids in ids]
+        return ids
+
+    def _npmi(self, topic_ids: np.ndarray) -> np.ndarray:
+        """NPMI of every pair of topic words (gensim's log_ratio_measure with normalize=True)."""
+        num_docs = float(self.num_windows)
+        co = self.co_occurrences[topic_ids][:, topic_ids].toarray().astype(np.float64)
+        counts = np.diag(co).copy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            numerator = (co / num_docs) + EPSILON
+            denominator = (counts[:, None] / num_docs) * (counts[None, :] / num_docs)
+            m_lr = np.log(numerator / denominator)
+            return m_lr / (-np.log(co / num_docs + EPSILON))
+
+    def score_per_topic(self, topics, topn: int = TOPN) -> list:
+        """c_v coherence of every topic (list of word lists)."""
+        coherences = []
+        for topic_ids in self._topic_ids(topics, topn):
+            npmi = self._npmi(topic_ids)
+            # Context vectors are indexed by distinct topic word; repeated words add up
+            _, slots = np.unique(topic_ids, return_inverse=True)
+            vectors = np.zeros((len(topic_ids), slots.max() + 1))
+            for j, slot in enumerate(slots):
+                vectors[:, slot] += npmi[:, j]
+            w_star = vectors.sum(axis=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                sims = (vectors @ w_star) / (np.sqrt((vectors ** 2).sum(axis=1)) * np.sqrt((w_star ** 2).sum()))
+            coherences.append(float(np.mean(sims)))
+        return coherences
+
+    def score(self, topics, topn: int = TOPN) -> float:
+        """c_v coherence of a topic model: the mean over its topics."""
+        return float(np.mean(self.score_per_topic(topics, topn)))
@@ -0,0 +1,221 @@
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+
+COMMENT_COLUMNS = ['post_id', 'comment_id', 'author', 'body', 'score', 'created_utc']
+
+
+class CrawlJournal:
+    """
+    Durable SQLite journal of a crawl, so that a restarted run only fetches what is missing.
+
+    Comment crawls record every post's comments together with its status ('done' or
+    'failed') in one transaction as soon as the post has been fetched. Incremental
+    refreshes append the comments whose IDs are not stored yet. Post searches
+    record every (query, subreddit) search together with the posts it returned. The
+    journal can be shared by concurrent workers.
+
+    Args:
+        path (str): Path to the SQLite file (created if it does not exist).
+    """
+
+    def __init__(self, path: str = 'crawl_journal.sqlite'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS post_status (
+                post_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                num_comments INTEGER,
+                error TEXT,
+                updated_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS comments (
+                comment_id TEXT PRIMARY KEY,
+                post_id TEXT NOT NULL,
+                author TEXT,
+                body TEXT,
+                score INTEGER,
+                created_utc TEXT
+            );
+            CREATE INDEX IF NOT EXISTS comments_post_id ON comments (post_id);
+            CREATE TABLE IF NOT EXISTS search_status (
+                query TEXT NOT NULL,
+                subreddit TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                num_posts INTEGER,
+                error TEXT,
+                updated_at TEXT,
+                PRIMARY KEY (query, subreddit)
+            );
+            CREATE TABLE IF NOT EXISTS search_posts (
+                query TEXT NOT NULL,
+                subreddit TEXT NOT NULL,
+                post_id TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (query, subreddit, post_id)
+            );
+        """)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _now():
+        return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+    # --------------------------
+    # Comment crawls
+    # --------------------------
+    def pending_posts(self, post_ids):
+        """
+        Returns the post IDs (in input order) that are missing from the journal or failed.
+        """
+        with self._lock:
+            done = {row[0] for row in self._conn.execute(
+                "SELECT post_id FROM post_status WHERE status = 'done'")}
+        return [post_id for post_id in post_ids if post_id not in done]
+
+    def failed_posts(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT post_id FROM post_status WHERE status = 'failed' ORDER BY post_id")]
+
+    def record_comments(self, post_id, comments):
+        """
+        Atomically store all comments of a post and mark the post as done.
+        """
+        rows = [tuple(comment[col] for col in COMMENT_COLUMNS) for comment in comments]
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM comments WHERE post_id = ?", (post_id,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO comments (post_id, comment_id, author, body, score, created_utc) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._conn.execute(
+                "INSERT INTO post_status (post_id, status, attempts, num_comments, error, updated_at) "
+                "VALUES (?, 'done', 1, ?, NULL, ?) "
+                "ON CONFLICT(post_id) DO UPDATE SET status = 'done', attempts = attempts + 1, "
+                "num_comments = excluded.num_comments, error = NULL, updated_at = excluded.updated_at",
+                (post_id, len(rows), self._now()))
+
+    def record_failure(self, post_id, error):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO post_status (post_id, status, attempts, error, updated_at) "
+                "VALUES (?, 'failed', 1, ?, ?) "
+                "ON CONFLICT(post_id) DO UPDATE SET status = 'failed', attempts = attempts + 1, "
+                "error = excluded.error, updated_at = excluded.updated_at",
+                (post_id, str(error), self._now()))
+
+    def iter_comments(self, post_ids=None, batch_size: int = 10000):
+        """
+        Yields stored comment dicts, post by post, without loading them all at once.
+
+        Args:
+            post_ids (list): Only yield comments of these posts, in this order. Defaults to all.
+            batch_size (int): Rows fetched from SQLite per round trip.
+        """
+        query = f"SELECT {', '.join(COMMENT_COLUMNS)} FROM comments"
+        if post_ids is None:
+            groups = [(query + " ORDER BY post_id, rowid", ())]
+        else:
+            groups = ((query + " WHERE post_id = ? ORDER BY rowid", (post_id,)) for post_id in post_ids)
+        for sql, params in groups:
+            with self._lock:
+                cursor = self._conn.execute(sql, params)
+                rows = cursor.fetchmany(batch_size)
+            while rows:
+                for row in rows:
+                    yield dict(zip(COMMENT_COLUMNS, row))
+                with self._lock:
+                    rows = cursor.fetchmany(batch_size)
+
+    def seen_comments(self, post_id):
+        """
+        Returns {comment_id: score} for every stored comment of a post.
+        """
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT comment_id, score FROM comments WHERE post_id = ?", (post_id,)))
+
+    def append_comments(self, post_id, comments, score_updates=()):
+        """
+        Atomically add new comments of an already crawled post, apply score updates
+        ((comment_id, score) pairs) and mark the post as done again.
+        """
+        rows = [tuple(comment[col] for col in COMMENT_COLUMNS) for comment in comments]
+        now = self._now()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO comments (post_id, comment_id, author, body, score, created_utc) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._conn.executemany(
+                "UPDATE comments SET score = ? WHERE comment_id = ?",
+                [(score, comment_id) for comment_id, score in score_updates])
+            count, = self._conn.execute(
+                "SELECT COUNT(*) FROM comments WHERE post_id = ?", (post_id,)).fetchone()
+            self._conn.execute(
+                "UPDATE post_status SET status = 'done', num_comments = ?, error = NULL, updated_at = ? "
+                "WHERE post_id = ?",
+                (count, now, post_id))
+
+    def summary(self):
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT status, COUNT(*) FROM post_status GROUP BY status").fetchall())
+
+    # --------------------------
+    # Post searches
+    # --------------------------
+    def search_done(self, query, subreddit):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status FROM search_status WHERE query = ? AND subreddit = ?",
+                (query, subreddit)).fetchone()
+        return row is not None and row[0] == 'done'
+
+    def record_search(self, query, subreddit, posts):
+        """
+        Atomically store the posts returned by a search and mark the search as done.
+        """
+        rows = [(query, subreddit, post['post_id'], json.dumps(post, default=str)) for post in posts]
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM search_posts WHERE query = ? AND subreddit = ?",
+                               (query, subreddit))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO search_posts (query, subreddit, post_id, data) VALUES (?, ?, ?, ?)",
+                rows)
+            self._conn.execute(
+                "INSERT INTO search_status (query, subreddit, status, attempts, num_posts, error, updated_at) "
+                "VALUES (?, ?, 'done', 1, ?, NULL, ?) "
+                "ON CONFLICT(query, subreddit) DO UPDATE SET status = 'done', attempts = attempts + 1, "
+                "num_posts = excluded.num_posts, error = NULL, updated_at = excluded.updated_at",
+                (query, subreddit, len(rows), self._now()))
+
+    def record_search_failure(self, query, subreddit, error):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO search_status (query, subreddit, status, attempts, error, updated_at) "
+                "VALUES (?, ?, 'failed', 1, ?, ?) "
+                "ON CONFLICT(query, subreddit) DO UPDATE SET status = 'failed', attempts = attempts + 1, "
+                "error = excluded.error, updated_at = excluded.updated_at",
+                (query, subreddit, str(error), self._now()))
+
+    def search_posts(self, query, subreddit):
+        """
+        Returns the post dicts stored for a finished search, in the order they were found.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM search_posts WHERE query = ? AND subreddit = ? ORDER BY rowid",
+                (query, subreddit)).fetchall()
+        return [json.loads(row[0]) for row in rows]
@@ -0,0 +1,165 @@
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by concurrent crawl workers.
+
+    Every API request takes one token. Tokens refill at `rate` per second up to
+    `capacity`. The bucket can be re-synced from Reddit's rate limit headers
+    (X-Ratelimit-Remaining / X-Ratelimit-Reset) so that workers slow down as the
+    remaining quota shrinks and pause entirely once it is exhausted.
+
+    Args:
+        rate (float): Tokens added per second.
+        capacity (int): Maximum number of tokens (burst size). Defaults to `rate`.
+    """
+
+    def __init__(self, rate: float = 1.5, capacity: int = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.paused_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: int = 1):
+        """
+        Block until `tokens` tokens are available, then take them.
+        """
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = max(self.paused_until - now, (tokens - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def consume(self, tokens: int):
+        """
+        Charge `tokens` already spent without waiting; the balance may go negative,
+        which delays later acquire() calls until it has been paid back.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= tokens
+
+    def update(self, remaining, reset_seconds):
+        """
+        Follow the API's remaining-quota headers.
+
+        Spreads the remaining requests evenly over the time left in the current
+        window, and pauses all workers until the window resets when nothing is left.
+
+        Args:
+            remaining (float): Requests left in the current window (X-Ratelimit-Remaining).
+            reset_seconds (float): Seconds until the window resets (X-Ratelimit-Reset).
+        """
+        if remaining is None or reset_seconds is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            reset_seconds = max(float(reset_seconds), 1.0)
+            if remaining < 1:
+                self.paused_until = now + reset_seconds
+                self.tokens = 0.0
+            else:
+                self.rate = remaining / reset_seconds
+                self.tokens = min(self.tokens, remaining)
+
+    def sync_with_reddit(self, reddit, window: int = 600):
+        """
+        Re-sync the bucket from the rate limit state PRAW keeps for `reddit`.
+
+        Older PRAW versions expose `reset_timestamp`; newer ones only report
+        `remaining`, in which case the rest of the `window` (seconds) is assumed.
+        """
+        try:
+            limits = reddit.auth.limits
+        except Exception:
+            return
+        remaining = limits.get('remaining')
+        reset_timestamp = limits.get('reset_timestamp')
+        if reset_timestamp is not None:
+            reset_seconds = reset_timestamp - time.time()
+        else:
+            reset_seconds = window - (time.time() % window)
+        self.update(remaining, reset_seconds)
+
+
+def thread_local_client(reddit):
+    """
+    Returns a zero-argument function giving each worker thread its own PRAW client.
+
+    Args:
+        reddit: A PRAW client (shared as is), or a zero-argument callable returning one,
+            which is then called once per thread since PRAW clients are not thread-safe.
+    """
+    if hasattr(reddit, 'submission'):
+        return lambda: reddit
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, 'reddit'):
+            local.reddit = reddit()
+        return local.reddit
+    return client
+
+
+def backoff_delay(attempt: int, base: float = 2.0, cap: float = 120.0) -> float:
+    """
+    Exponential backoff with full jitter for the given (0-based) retry attempt.
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CrawlStats:
+    """
+    Thread-safe counters for a crawl, reporting posts/sec and comments/sec.
+    """
+
+    def __init__(self):
+        self.posts = 0
+        self.comments = 0
+        self.failed = 0
+        self.retries = 0
+        self.start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, posts: int = 0, comments: int = 0, failed: int = 0, retries: int = 0):
+        with self._lock:
+            self.posts += posts
+            self.comments += comments
+            self.failed += failed
+            self.retries += retries
+
+    def elapsed(self) -> float:
+        return max(time.perf_counter() - self.start, 1e-9)
+
+    def summary(self) -> dict:
+        elapsed = self.elapsed()
+        return {
+            'posts': self.posts,
+            'comments': self.comments,
+            'failed': self.failed,
+            'retries': self.retries,
+            'elapsed_sec': elapsed,
+            'posts_per_sec': self.posts / elapsed,
+            'comments_per_sec': self.comments / elapsed,
+        }
+
+    def report(self, label: str = "Crawl"):
+        s = self.summary()
+        print(f"{label}: {s['posts']} posts, {s['comments']} comments, {s['failed']} failed, "
+              f"{s['retries']} retries in {s['elapsed_sec']:.1f}s "
+              f"({s['posts_per_sec']:.2f} posts/sec, {s['comments_per_sec']:.1f} comments/sec)")
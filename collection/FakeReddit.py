@@ -0,0 +1,257 @@
+"""
+Local fake Reddit endpoint for exercising the crawlers without touching the real API.
+
+Serves just enough of the OAuth API for PRAW to fetch submissions and expand their
+comment trees (`/comments/<id>/` and `/api/morechildren`) and to page through subreddit
+searches (`/r/<subreddit>/search`, `/user/<name>/about`), with configurable latency,
+random failures and X-Ratelimit-* headers. Point PRAW at it with:
+
+    reddit = praw.Reddit(client_id='fake', client_secret='fake', user_agent='fake',
+                         oauth_url='http://127.0.0.1:8765', reddit_url='http://127.0.0.1:8765',
+                         check_for_async=False)
+
+Usage:
+    python FakeReddit.py --port 8765 --comments 300 --latency 0.2
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeRedditState:
+    """
+    Deterministic fake data and rate limit bookkeeping shared by all handler threads.
+
+    Args:
+        comments_per_post (int): Number of top-level comments generated for every post.
+        inline (int): Comments returned inline with the submission; the rest sit behind
+            "more" placeholders so that replace_more has to expand them.
+        latency (float): Seconds slept before answering each request.
+        failure_rate (float): Probability of answering a request with HTTP 500.
+        quota (int): Requests allowed per rate limit window.
+        window (int): Rate limit window in seconds.
+        posts_per_search (int): Number of posts every subreddit search returns. Half of
+            them depend only on the subreddit, so different queries overlap.
+    """
+
+    def __init__(self, comments_per_post=50, inline=20, latency=0.0, failure_rate=0.0,
+                 quota=1000, window=600, base_utc=1736208000, posts_per_search=150):
+        self.comments_per_post = comments_per_post
+        self.posts_per_search = posts_per_search
+        self.inline = inline
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.quota = quota
+        self.window = window
+        self.base_utc = base_utc
+        self.requests = 0
+        self.extra_comments = {}
+        self._lock = threading.Lock()
+        self._window_start = time.time()
+        self._used = 0
+
+    def add_comments(self, post_id, n):
+        """Simulate `n` new comments arriving on `post_id` (for incremental crawls)."""
+        with self._lock:
+            self.extra_comments[post_id] = self.extra_comments.get(post_id, 0) + n
+
+    def count_request(self):
+        with self._lock:
+            now = time.time()
+            if now - self._window_start >= self.window:
+                self._window_start = now
+                self._used = 0
+            self._used += 1
+            self.requests += 1
+            remaining = max(self.quota - self._used, 0)
+            reset = int(self.window - (now - self._window_start))
+            return self._used, remaining, reset
+
+    def comment_ids(self, post_id):
+        n = self.comments_per_post + self.extra_comments.get(post_id, 0)
+        return [f"{post_id}c{i}" for i in range(n)]
+
+    def comment(self, post_id, comment_id):
+        index = int(comment_id.rsplit('c', 1)[1])
+        return {
+            'kind': 't1',
+            'data': {
+                'id': comment_id,
+                'name': f"t1_{comment_id}",
+                'parent_id': f"t3_{post_id}",
+                'link_id': f"t3_{post_id}",
+                'author': f"user{index % 37}",
+                'body': f"Fake comment {index} on {post_id} https://www.example.com/{index}",
+                'score': index % 11,
+                'created_utc': float(self.base_utc + index * 60),
+                'subreddit': 'fakefire',
+                'replies': '',
+                'depth': 0,
+            },
+        }
+
+    def search_ids(self, subreddit, query):
+        query_key = re.sub(r'\W', '', query).lower()
+        half = self.posts_per_search // 2
+        return ([f"{subreddit.lower()}s{i}" for i in range(half)]
+                + [f"{subreddit.lower()}{query_key}{i}" for i in range(self.posts_per_search - half)])
+
+    def submission(self, post_id, subreddit='fakefire'):
+        return {
+            'kind': 't3',
+            'data': {
+                'id': post_id,
+                'name': f"t3_{post_id}",
+                'title': f"Fake post {post_id}",
+                'selftext': '',
+                'author': 'poster',
+                'author_flair_text': None,
+                'subreddit': subreddit,
+                'score': 1,
+                'created_utc': float(self.base_utc),
+                'num_comments': len(self.comment_ids(post_id)),
+            },
+        }
+
+
+def listing(children, after=None):
+    return {'kind': 'Listing', 'data': {'after': after, 'before': None, 'children': children}}
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, payload, status=200):
+            used, remaining, reset = state.count_request()
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('x-ratelimit-used', str(used))
+            self.send_header('x-ratelimit-remaining', f"{remaining:.1f}")
+            self.send_header('x-ratelimit-reset', str(reset))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _maybe_fail(self):
+            if state.latency:
+                time.sleep(state.latency)
+            if state.failure_rate and random.random() < state.failure_rate:
+                self._send({'message': 'Internal Server Error', 'error': 500}, status=500)
+                return True
+            return False
+
+        def _morechildren(self, params):
+            post_id = params.get('link_id', [''])[0].split('_', 1)[-1]
+            wanted = params.get('children', [''])[0].split(',')
+            things = [state.comment(post_id, cid) for cid in wanted if cid]
+            self._send({'json': {'errors': [], 'data': {'things': things}}})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            params = parse_qs(self.rfile.read(length).decode('utf-8'))
+            path = urlparse(self.path).path.rstrip('/')
+            if path == '/api/v1/access_token':
+                self._send({'access_token': 'fake-token', 'token_type': 'bearer',
+                            'expires_in': 86400, 'scope': '*'})
+            elif path == '/api/morechildren':
+                if not self._maybe_fail():
+                    self._morechildren(params)
+            else:
+                self._send({'message': 'Not Found', 'error': 404}, status=404)
+
+        def do_GET(self):
+            if self._maybe_fail():
+                return
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            match = re.match(r'^/comments/([A-Za-z0-9]+)/?$', url.path)
+            if match:
+                post_id = match.group(1)
+                ids = state.comment_ids(post_id)
+                children = [state.comment(post_id, cid) for cid in ids[:state.inline]]
+                rest = ids[state.inline:]
+                if rest:
+                    children.append({
+                        'kind': 'more',
+                        'data': {'count': len(rest), 'name': f"t1_{rest[0]}", 'id': rest[0],
+                                 'parent_id': f"t3_{post_id}", 'depth': 0, 'children': rest},
+                    })
+                self._send([listing([state.submission(post_id)]), listing(children)])
+            elif url.path.rstrip('/') == '/api/morechildren':
+                self._morechildren(params)
+            elif re.match(r'^/user/[A-Za-z0-9_-]+/about/?$', url.path):
+                name = url.path.split('/')[2]
+                self._send({'kind': 't2', 'data': {'name': name, 'id': f"id{name}",
+                                                   'has_verified_email': True}})
+            elif re.match(r'^/r/[A-Za-z0-9_]+/search/?$', url.path):
+                subreddit = url.path.split('/')[2]
+                ids = state.search_ids(subreddit, params.get('q', [''])[0])
+                after = params.get('after', [None])[0]
+                start = ids.index(after.split('_', 1)[1]) + 1 if after else 0
+                page = ids[start:start + int(params.get('limit', ['100'])[0])]
+                next_after = f"t3_{page[-1]}" if page and start + len(page) < len(ids) else None
+                self._send(listing([state.submission(post_id, subreddit) for post_id in page], next_after))
+            else:
+                self._send({'message': 'Not Found', 'error': 404}, status=404)
+
+    return Handler
+
+
+def serve(state=None, host='127.0.0.1', port=0):
+    """
+    Start the fake endpoint on a background thread.
+
+    Returns:
+        tuple: (server, base_url). Call server.shutdown() to stop it.
+    """
+    state = state or FakeRedditState()
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def fake_reddit_factory(base_url):
+    """
+    Returns a zero-argument callable that builds PRAW clients pointed at `base_url`.
+    """
+    import praw
+
+    def factory():
+        return praw.Reddit(client_id='fake', client_secret='fake', user_agent='fake-crawler',
+                           oauth_url=base_url, reddit_url=base_url, check_for_async=False)
+    return factory
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake Reddit API endpoint")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--comments", type=int, default=50, help="Comments per post")
+    parser.add_argument("--inline", type=int, default=20, help="Comments returned before 'more'")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of latency per request")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests answered with 500")
+    args = parser.parse_args()
+
+    state = FakeRedditState(args.comments, args.inline, args.latency, args.failure_rate)
+    server, url = serve(state, port=args.port)
+    print(f"Fake Reddit endpoint running at {url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,10 +10,33 @@ reddit = praw.Reddit(client_id='',
 import time
 import pandas as pd
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
+
+from praw.models import MoreComments
+
+from CrawlUtils import TokenBucket, CrawlStats, backoff_delay, thread_local_client
+from CrawlJournal import CrawlJournal
+from ShardWriter import ShardedWriter, export_csv
+from Storage import read_table
 
 pd.set_option('max_colwidth', None)
 
 
+def comment_to_dict(post_id: str, comment):
+    """
+    Convert a PRAW comment to the row stored for it, with created_utc as a readable date.
+    """
+    return {
+        'post_id': post_id,
+        'comment_id': comment.id,
+        'author': comment.author.name if comment.author else "[deleted]",
+        'body': comment.body,
+        'score': comment.score,
+        'created_utc': datetime.utcfromtimestamp(comment.created_utc).strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
 def fetch_comments(post_id: str, reddit, retries: int = 3, retry_delay: int = 5):
     """
     Fetch all comments for a specific post with retry logic and convert created_utc to a human-readable date.
@@ -39,17 +62,7 @@ def fetch_comments(post_id: str, reddit, retries: int = 3, retry_delay: int = 5)
             print(f"[{post_id}] Flattening the comment tree...")
             all_comments = submission.comments.list()
 
-            comments_data = [
-                {
-                    'post_id': post_id,
-                    'comment_id': comment.id,
-                    'author': comment.author.name if comment.author else "[deleted]",
-                    'body': comment.body,
-                    'score': comment.score,
-                    'created_utc': datetime.utcfromtimestamp(comment.created_utc).strftime('%Y-%m-%d %H:%M:%S'),
-                }
-                for comment in all_comments
-            ]
+            comments_data = [comment_to_dict(post_id, comment) for comment in all_comments]
             return comments_data
 
         except Exception as e:
@@ -61,40 +74,96 @@ def fetch_comments(post_id: str, reddit, retries: int = 3, retry_delay: int = 5)
                 print(f"All retry attempts failed for post ID {post_id}. Raising exception.")
                 raise  # Propagate the exception instead of returning an empty list
 
-def fetch_all_comments(post_ids, reddit, rate_limit_sleep: int = 10, retries: int = 3, retry_delay: int = 5):
+def fetch_all_comments(post_ids, reddit, rate_limit_sleep: int = 10, retries: int = 3, retry_delay: int = 5,
+                       journal: CrawlJournal = None, writer: ShardedWriter = None):
     """
     Fetch comments for a list of posts with rate limit handling and retry logic.
     
     If any post fails (i.e. fetch_comments raises an exception), the failure is logged and the post ID is recorded.
     After processing all posts, if there were any failures, an exception is raised with the list of failed IDs.
     
+    With a journal, posts already marked done are skipped and each post's comments are stored
+    as soon as they are fetched, so a failure or crash does not lose the successful work.
+    With a writer, comments are streamed to rotated shards instead of being kept in memory.
+    
     Args:
         post_ids (List[str]): List of Reddit post IDs.
         reddit: An instance of the PRAW Reddit API client.
         rate_limit_sleep (int): Seconds to sleep between requests.
         retries (int): Number of retries for each post.
         retry_delay (int): Seconds to wait between retries.
+        journal (CrawlJournal): Optional crawl journal used to checkpoint and resume.
+        writer (ShardedWriter): Optional streaming output for the comments.
     
     Returns:
-        List[Dict[str, Any]]: Combined list of comment details from all posts.
+        List[Dict[str, Any]]: Combined list of comment details from all posts, or the path
+            of the shard manifest when a writer is given.
     
     Raises:
         Exception: If one or more posts fail to fetch comments.
     """
     all_comments = []
     failed_ids = []
+    stats = CrawlStats()
     
-    for post_id in post_ids:
+    for post_id in pending_post_ids(post_ids, journal, writer):
         print(f"Fetching comments for post ID: {post_id}")
         try:
             comments = fetch_comments(post_id, reddit, retries, retry_delay)
-            all_comments.extend(comments)
+            if journal is not None:
+                journal.record_comments(post_id, comments)
+            if writer is not None:
+                writer.write_post(post_id, comments)
+            if journal is None and writer is None:
+                all_comments.extend(comments)
+            stats.add(posts=1, comments=len(comments))
             print(f"Successfully fetched {len(comments)} comments for post ID: {post_id}")
         except Exception as e:
             print(f"An error occurred while processing post ID {post_id}: {e}")
             failed_ids.append(post_id)
+            stats.add(failed=1)
+            if journal is not None:
+                journal.record_failure(post_id, e)
         time.sleep(rate_limit_sleep)
     
+    stats.report("Sequential crawl")
+    manifest_path = writer.close() if writer is not None else None
+    raise_if_failed(failed_ids)
+    
+    if writer is not None:
+        return manifest_path
+    if journal is not None:
+        return list(journal.iter_comments(post_ids))
+    return all_comments
+
+
+def pending_post_ids(post_ids, journal: CrawlJournal = None, writer: ShardedWriter = None):
+    """
+    Returns the post IDs still to be fetched: all of them without a journal, otherwise
+    only those the journal has not marked as done.
+
+    With a writer, posts the journal has but the writer lost (e.g. in a shard left unfinished
+    by a crash) are re-exported from the journal; without a journal, posts already in closed
+    shards are skipped.
+    """
+    pending = list(post_ids)
+    if journal is not None:
+        pending = journal.pending_posts(pending)
+        print(f"Journal {journal.path}: {len(post_ids) - len(pending)} posts already done, {len(pending)} to fetch.")
+        if writer is not None:
+            pending_set = set(pending)
+            for post_id in post_ids:
+                if post_id not in pending_set and post_id not in writer.written_posts:
+                    writer.write_post(post_id, list(journal.iter_comments([post_id])))
+    elif writer is not None:
+        pending = [post_id for post_id in pending if post_id not in writer.written_posts]
+    return pending
+
+
+def raise_if_failed(failed_ids):
+    """
+    Writes failed post IDs to failed_ids.txt and raises if there are any.
+    """
     if failed_ids:
         error_message = f"Failed to fetch comments for the following post IDs: {failed_ids}"
         print(error_message)
@@ -103,8 +172,263 @@ def fetch_all_comments(post_ids, reddit, rate_limit_sleep: int = 10, retries: in
             for fid in failed_ids:
                 f.write(f"{fid}\n")
         raise Exception(error_message)
-    
-    return all_comments
+
+
+def fetch_comments_limited(post_id: str, reddit, limiter: TokenBucket, batch: int = 32):
+    """
+    Fetch all comments for a specific post, taking one limiter token per API request.
+
+    Instead of a single replace_more(limit=None), MoreComments placeholders are expanded
+    `batch` at a time so that every request is accounted for by the shared limiter, which
+    is re-synced from the rate limit headers after each round. No retries are done here;
+    the caller decides how to back off.
+
+    Args:
+        post_id (str): The ID of the Reddit post.
+        reddit: An instance of the PRAW Reddit API client.
+        limiter (TokenBucket): Token bucket shared by all workers.
+        batch (int): Number of MoreComments placeholders to expand per round.
+
+    Returns:
+        List[Dict[str, Any]]: List of dictionaries with comment details.
+    """
+    limiter.acquire()
+    submission = reddit.submission(id=post_id)
+    submission.comments  # Triggers the initial fetch of the submission and comment tree
+    limiter.sync_with_reddit(reddit)
+
+    remaining = [None]
+    while remaining:
+        limiter.acquire()
+        used_before = reddit.auth.limits.get('used') or 0
+        remaining = submission.comments.replace_more(limit=batch)
+        # Charge the extra requests this round made beyond the token already taken
+        extra = (reddit.auth.limits.get('used') or 0) - used_before - 1
+        if extra > 0:
+            limiter.consume(extra)
+        limiter.sync_with_reddit(reddit)
+
+    return [comment_to_dict(post_id, comment) for comment in submission.comments.list()]
+
+def fetch_all_comments_concurrent(post_ids, reddit, workers: int = 4, limiter: TokenBucket = None,
+                                  retries: int = 3, backoff_base: float = 2.0, batch: int = 32,
+                                  stats: CrawlStats = None, journal: CrawlJournal = None,
+                                  writer: ShardedWriter = None):
+    """
+    Fetch comments for a list of posts with a pool of workers sharing one rate limiter.
+
+    Replaces the fixed sleep between posts with a token bucket that follows the API's
+    remaining-quota headers, and retries each failed post with exponential backoff.
+    Failed posts, the journal and the writer are handled like in fetch_all_comments.
+
+    Args:
+        post_ids (List[str]): List of Reddit post IDs.
+        reddit: An instance of the PRAW Reddit API client, or a zero-argument callable
+            returning one. PRAW clients are not thread-safe, so prefer a callable: each
+            worker thread then builds its own client.
+        workers (int): Number of worker threads.
+        limiter (TokenBucket): Shared token bucket. Defaults to Reddit's 100 requests/minute.
+        retries (int): Number of attempts for each post.
+        backoff_base (float): Base delay in seconds for exponential backoff between attempts.
+        batch (int): Number of MoreComments placeholders expanded per request round.
+        stats (CrawlStats): Optional counters; a new one is created if omitted.
+        journal (CrawlJournal): Optional crawl journal used to checkpoint and resume.
+        writer (ShardedWriter): Optional streaming output for the comments.
+
+    Returns:
+        List[Dict[str, Any]]: Combined list of comment details from all posts, in post order,
+            or the path of the shard manifest when a writer is given.
+
+    Raises:
+        Exception: If one or more posts fail to fetch comments.
+    """
+    limiter = limiter or TokenBucket(rate=100 / 60, capacity=10)
+    stats = stats or CrawlStats()
+    client = thread_local_client(reddit)
+
+    def crawl(post_id):
+        for attempt in range(retries):
+            try:
+                return fetch_comments_limited(post_id, client(), limiter, batch)
+            except Exception as e:
+                print(f"Attempt {attempt + 1} failed for post ID {post_id}: {e}")
+                if attempt == retries - 1:
+                    raise
+                stats.add(retries=1)
+                delay = backoff_delay(attempt, backoff_base)
+                print(f"Retrying post ID {post_id} in {delay:.1f} seconds...")
+                time.sleep(delay)
+
+    results = {}
+    failed_ids = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(crawl, post_id): post_id for post_id in pending_post_ids(post_ids, journal, writer)}
+        for future in as_completed(futures):
+            post_id = futures[future]
+            try:
+                comments = future.result()
+                if journal is not None:
+                    journal.record_comments(post_id, comments)
+                if writer is not None:
+                    writer.write_post(post_id, comments)
+                if journal is None and writer is None:
+                    results[post_id] = comments
+                stats.add(posts=1, comments=len(comments))
+                print(f"Successfully fetched {len(comments)} comments for post ID: {post_id}")
+            except Exception as e:
+                print(f"An error occurred while processing post ID {post_id}: {e}")
+                failed_ids.append(post_id)
+                stats.add(failed=1)
+                if journal is not None:
+                    journal.record_failure(post_id, e)
+
+    stats.report("Concurrent crawl")
+    manifest_path = writer.close() if writer is not None else None
+    raise_if_failed(failed_ids)
+
+    if writer is not None:
+        return manifest_path
+    if journal is not None:
+        return list(journal.iter_comments(post_ids))
+    return [comment for post_id in post_ids if post_id in results for comment in results[post_id]]
+
+
+def fetch_new_comments(post_id: str, reddit, seen: dict, limiter: TokenBucket = None,
+                       update_scores: bool = False):
+    """
+    Fetch only the comments of a post that are not in `seen`, without a full replace_more.
+
+    The comment tree is loaded newest-first and walked breadth-first. A MoreComments
+    placeholder is expanded only if it hides at least one unseen comment ID, so threads
+    that have not changed since the last crawl cost nothing beyond the first request.
+    "Continue this thread" placeholders carry no IDs and are always expanded.
+
+    Args:
+        post_id (str): The ID of the Reddit post.
+        reddit: An instance of the PRAW Reddit API client.
+        seen (dict): {comment_id: score} of the comments already stored for the post.
+        limiter (TokenBucket): Optional token bucket; one token is taken per request.
+        update_scores (bool): Also return the new score of seen comments whose score changed.
+
+    Returns:
+        tuple: (new comment dicts, [(comment_id, score)] score updates, number of
+            placeholders expanded, number of placeholders skipped).
+    """
+    if limiter is not None:
+        limiter.acquire()
+    submission = reddit.submission(id=post_id)
+    submission.comment_sort = 'new'
+    queue = deque(submission.comments)
+
+    new_comments, score_updates = [], []
+    visited = set()
+    expanded = skipped = 0
+    while queue:
+        item = queue.popleft()
+        if isinstance(item, MoreComments):
+            if item.children and all(child in seen for child in item.children):
+                skipped += 1
+                continue
+            if limiter is not None:
+                limiter.acquire()
+            queue.extend(item.comments())
+            expanded += 1
+            continue
+        if item.id in visited:
+            continue
+        visited.add(item.id)
+        if item.id not in seen:
+            new_comments.append(comment_to_dict(post_id, item))
+        elif update_scores and seen[item.id] != item.score:
+            score_updates.append((item.id, item.score))
+        queue.extend(item.replies)
+
+    if limiter is not None:
+        limiter.sync_with_reddit(reddit)
+    return new_comments, score_updates, expanded, skipped
+
+def refresh_comments(post_ids, reddit, journal: CrawlJournal, update_scores: bool = False, workers: int = 4,
+                     limiter: TokenBucket = None, retries: int = 3, backoff_base: float = 2.0,
+                     writer: ShardedWriter = None, stats: CrawlStats = None):
+    """
+    Incrementally re-crawl posts already in the journal, appending only new comments.
+
+    Each post's stored comment IDs come from the journal, and new comments (and
+    optionally score updates) are appended to it. The seen IDs, not a created_utc
+    watermark, decide what is new: a new reply can sit under an old comment, so the walk
+    cannot stop at comments older than the last crawl.
+    Posts the journal has no comments of are fetched in full. Posts that fail every retry
+    are recorded as failed, and are refreshed again on the next run. Workers, limiter and
+    retries behave like in fetch_all_comments_concurrent.
+
+    Args:
+        post_ids (List[str]): List of Reddit post IDs.
+        reddit: An instance of the PRAW Reddit API client, or a zero-argument callable returning one.
+        journal (CrawlJournal): Crawl journal holding the previously fetched comments.
+        update_scores (bool): Also refresh the scores of already stored comments that were loaded.
+        workers (int): Number of worker threads.
+        limiter (TokenBucket): Shared token bucket. Defaults to Reddit's 100 requests/minute.
+        retries (int): Number of attempts for each post.
+        backoff_base (float): Base delay in seconds for exponential backoff between attempts.
+        writer (ShardedWriter): Optional streaming output for the new comments only.
+        stats (CrawlStats): Optional counters; a new one is created if omitted.
+
+    Returns:
+        int: Number of new comments appended.
+
+    Raises:
+        Exception: If one or more posts fail to refresh.
+    """
+    limiter = limiter or TokenBucket(rate=100 / 60, capacity=10)
+    stats = stats or CrawlStats()
+    client = thread_local_client(reddit)
+    done = set(post_ids) - set(journal.pending_posts(post_ids))
+
+    def refresh(post_id):
+        for attempt in range(retries):
+            try:
+                seen = journal.seen_comments(post_id)
+                if post_id not in done and not seen:
+                    return fetch_comments_limited(post_id, client(), limiter), [], None
+                print(f"[{post_id}] Refreshing comments ({len(seen)} stored)...")
+                new, updates, expanded, skipped = fetch_new_comments(post_id, client(), seen, limiter, update_scores)
+                print(f"[{post_id}] {len(new)} new comments, {len(updates)} score updates "
+                      f"({expanded} placeholders expanded, {skipped} skipped)")
+                return new, updates, seen
+            except Exception as e:
+                print(f"Attempt {attempt + 1} failed for post ID {post_id}: {e}")
+                if attempt == retries - 1:
+                    raise
+                stats.add(retries=1)
+                time.sleep(backoff_delay(attempt, backoff_base))
+
+    total_new = 0
+    failed_ids = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(refresh, post_id): post_id for post_id in post_ids}
+        for future in as_completed(futures):
+            post_id = futures[future]
+            try:
+                comments, updates, seen = future.result()
+                if seen is None:
+                    journal.record_comments(post_id, comments)
+                else:
+                    journal.append_comments(post_id, comments, updates)
+                if writer is not None and comments:
+                    writer.write_post(post_id, comments)
+                total_new += len(comments)
+                stats.add(posts=1, comments=len(comments))
+            except Exception as e:
+                print(f"An error occurred while refreshing post ID {post_id}: {e}")
+                failed_ids.append(post_id)
+                stats.add(failed=1)
+                journal.record_failure(post_id, e)
+
+    stats.report("Incremental refresh")
+    if writer is not None:
+        writer.close()
+    raise_if_failed(failed_ids)
+    return total_new
 
 
 def save_to_csv(df, filename):
@@ -123,7 +447,41 @@ def save_to_csv(df, filename):
         print(f"An error occurred while saving to CSV: {e}")
 
 
-df = pd.read_csv('all_final_posts.csv')
-post_id_list = df['post_id'].to_list()
-comment_df = pd.DataFrame(fetch_all_comments(post_id_list, reddit))
-save_to_csv(comment_df, 'all_raw_comments.csv')
\ No newline at end of file
+def make_reddit():
+    """
+    Build a new PRAW client with the API config above (one per concurrent worker).
+    """
+    return praw.Reddit(client_id='',
+                       client_secret='',
+                       user_agent='',
+                       username="",
+                       check_for_async=False)
+
+
+if __name__ == "__main__":
+    CONCURRENT = True  # Set to False to use the original sequential loop
+    REFRESH = False  # Set to True to append only new comments to an earlier crawl
+    SHARD_FORMAT = 'parquet'  # Typed shards; use 'csv' to resume a shard directory written as CSV
+
+    # Re-running resumes from the journal: only missing or failed posts are fetched.
+    journal = CrawlJournal('comments_journal.sqlite')
+
+    # Only the post_id column is decoded from the typed post table.
+    df = read_table('all_final_posts.parquet', columns=['post_id'])
+    post_id_list = df['post_id'].to_list()
+    if REFRESH:
+        # New comments (and score updates) go to the journal; the new comments alone are
+        # also written to a delta shard set.
+        delta_writer = ShardedWriter('all_raw_comments_delta', prefix='all_raw_comments_delta', shard_size=50000,
+                                     fmt=SHARD_FORMAT)
+        refresh_comments(post_id_list, make_reddit, journal, update_scores=True, writer=delta_writer)
+        export_csv(delta_writer.manifest_path, 'all_raw_comments_delta.csv')
+    else:
+        # Comments are streamed to rotated shards as they arrive instead of one big DataFrame.
+        writer = ShardedWriter('all_raw_comments', prefix='all_raw_comments', shard_size=50000, fmt=SHARD_FORMAT)
+        if CONCURRENT:
+            manifest_path = fetch_all_comments_concurrent(post_id_list, make_reddit, workers=4,
+                                                          journal=journal, writer=writer)
+        else:
+            manifest_path = fetch_all_comments(post_id_list, reddit, journal=journal, writer=writer)
+        export_csv(manifest_path, 'all_raw_comments.csv')
@@ -7,9 +7,12 @@ reddit = praw.Reddit(client_id='',
                      username="",
                      check_for_async=False)
 
-import time
 import pandas as pd
-from datetime import datetime
+
+from CrawlJournal import CrawlJournal
+from PostIndex import PostIndex
+from SearchPosts import search_matrix
+from Storage import parquet_path, write_table
 
 pd.set_option('max_colwidth', None)
 
@@ -20,34 +23,6 @@ subreddit = reddit.subreddit('all')
 # e.g., reddit = praw.Reddit(client_id='YOUR_ID', client_secret='YOUR_SECRET', user_agent='YOUR_AGENT')
 subreddit = reddit.subreddit('all')
 
-def fetch_posts(subreddit, query):
-    posts = []
-    try:
-        for i, post in enumerate(subreddit.search(query, sort='comments', limit=None, time_filter='year')):
-            # Convert UTC timestamp to human-readable format
-            readable_date = datetime.utcfromtimestamp(post.created_utc).strftime('%Y-%m-%d %H:%M:%S')
-
-            # Safely extract author details (handle cases where author is deleted)
-            author_id = getattr(post.author, 'id', None)
-            author_verified = getattr(post.author, 'has_verified_email', None)
-
-            # Append post data to our list
-            posts.append({
-                'post_id': post.id,
-                'subreddit': post.subreddit.display_name,
-                'author_id': author_id,
-                'author_verified': author_verified,
-                'flare': post.author_flair_text,
-                'title': post.title,
-                'score': post.score,
-                'date': readable_date,
-                'num_comments': post.num_comments,
-                'body': post.selftext,
-            })
-    except Exception as e:
-        print(f"An error occurred while fetching posts for '{query}': {e}")
-    return posts
-
 def save_to_csv(df, filename):
     try:
         print(f"Saving Reddit data to {filename}...")
@@ -63,9 +38,26 @@ queries = {
     "Hughes Fire": "hughes_global_posts.csv"
 }
 
-# Loop through each query, fetch posts, and save to a CSV file
+def make_reddit():
+    # One PRAW client per search worker (PRAW clients are not thread-safe)
+    return praw.Reddit(client_id='',
+                       client_secret='',
+                       user_agent='',
+                       username="",
+                       check_for_async=False)
+
+# Re-running resumes from the journal: finished searches are not repeated.
+journal = CrawlJournal('posts_journal.sqlite')
+
+# Every post found is recorded under its output file, so AppendPost can dedup against
+# the index instead of re-reading all global CSVs.
+global_index = PostIndex('global_post_index.sqlite')
+
+# Run all queries concurrently under one rate limiter and save each to its CSV file
+tasks = [(query, subreddit.display_name, filename) for query, filename in queries.items()]
+results = search_matrix(make_reddit, tasks, index=global_index, journal=journal)
 for query, filename in queries.items():
-    print(f"Fetching posts for query: {query}")
-    posts = fetch_posts(subreddit, query)
-    post_df = pd.DataFrame(posts)
-    save_to_csv(post_df, filename)
\ No newline at end of file
+    post_df = pd.DataFrame(results[filename])
+    save_to_csv(post_df, filename)
+    # Typed copy for the later steps (Filter, MergeCSV)
+    write_table(post_df, parquet_path(filename))
\ No newline at end of file
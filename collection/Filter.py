@@ -1,23 +1,31 @@
+import re
+
 import pandas as pd
 
-def contains_keywords(text, required_keywords):
+from Storage import column_names, iter_table, read_table, write_table
+
+def compile_keywords(keywords):
     """
-    Check if the text contains at least one required keyword and one optional keyword.
-    
+    Compile one or more keywords into a single alternation regex.
+
+    Keywords are lowercased and escaped, and longer keywords are tried first so that the
+    reported match is the most specific one. The pattern is meant to be run on lowercased
+    text, so matching is a case-insensitive substring search.
+
     Args:
-        text (str): The text to search.
-        required_keywords (list or str): One or more required keywords.
-    
+        keywords (list or str): One or more keywords.
+
     Returns:
-        bool: True if the text contains at least one required and one optional keyword.
+        re.Pattern: The compiled pattern.
     """
-    # Ensure required_keywords is a list
-    if isinstance(required_keywords, str):
-        required_keywords = [required_keywords]
-    
-    text_lower = str(text).lower()
-    has_required = any(keyword.lower() in text_lower for keyword in required_keywords)
-    return has_required
+    if isinstance(keywords, str):
+        keywords = [keywords]
+    escaped = sorted({re.escape(keyword.lower()) for keyword in keywords}, key=lambda k: (-len(k), k))
+    return re.compile('|'.join(escaped))
+
+def _lowered(df, col):
+    # Every cell is matched as str(value).lower()
+    return df[col].astype(str).str.lower()
 
 def filter_by_keywords(df, required_keywords, text_columns=['title', 'body']):
     """
@@ -26,17 +34,72 @@ def filter_by_keywords(df, required_keywords, text_columns=['title', 'body']):
     
     Args:
         df (pd.DataFrame): Input DataFrame.
-        required_keywords (str or list): Required keyword(s).
+        required_keywords (str, list or re.Pattern): Required keyword(s), or a pattern from compile_keywords().
         text_columns (list): List of columns to search for keywords.
     
     Returns:
         pd.Series: Boolean mask where True indicates the row meets the keyword condition.
     """
+    pattern = required_keywords if isinstance(required_keywords, re.Pattern) else compile_keywords(required_keywords)
     mask = pd.Series(False, index=df.index)
     for col in text_columns:
-        mask |= df[col].apply(lambda x: contains_keywords(x, required_keywords))
+        mask |= _lowered(df, col).str.contains(pattern, regex=True, na=False).to_numpy(dtype=bool)
     return mask
 
+def _as_list(keywords):
+    return [keywords] if isinstance(keywords, str) else list(keywords)
+
+def match_keywords(df, keyword_groups, text_columns=['title', 'body']):
+    """
+    Finds which keyword groups (e.g. fires) every row mentions, and the keyword that matched.
+
+    Each text column is lowercased once and shared by all groups. The reported keyword is
+    the first match of the combined pattern in the first text column that has one.
+
+    Args:
+        df (pd.DataFrame): Input DataFrame.
+        keyword_groups (dict): {group name: list of keywords}.
+        text_columns (list): List of columns to search for keywords.
+
+    Returns:
+        pd.DataFrame: Indexed like df, with one boolean column per group and a
+        'matched_keyword' column (missing if nothing matched).
+    """
+    pattern = compile_keywords([keyword for keywords in keyword_groups.values() for keyword in _as_list(keywords)])
+    group_patterns = {group: compile_keywords(keywords) for group, keywords in keyword_groups.items()}
+
+    matches = pd.DataFrame(False, index=df.index, columns=list(keyword_groups))
+    matched_keyword = pd.Series(None, index=df.index, dtype=object)
+    for col in text_columns:
+        text = _lowered(df, col)
+        for group, group_pattern in group_patterns.items():
+            matches[group] |= text.str.contains(group_pattern, regex=True, na=False).to_numpy(dtype=bool)
+        missing = matched_keyword.isna()
+        if missing.any():
+            first = text[missing].str.extract(f"({pattern.pattern})", expand=False)
+            matched_keyword[missing] = first.astype(object)
+    matches['matched_keyword'] = matched_keyword
+    return matches
+
+def iter_matched_chunks(global_file, keyword_groups, text_columns=['title', 'body'], chunksize=100000,
+                        **filters):
+    """
+    Reads a posts table (CSV or Parquet) in chunks and yields only the rows that mention
+    at least one keyword.
+
+    Memory use is bounded by the chunk size, so multi-GB post dumps can be filtered.
+    Keyword arguments (e.g. start='2024-12-31') are pushed down to Storage.iter_table().
+
+    Yields:
+        tuple: (matching rows of a chunk, their match_keywords() result).
+    """
+    pattern = compile_keywords([keyword for keywords in keyword_groups.values() for keyword in _as_list(keywords)])
+    for chunk in iter_table(global_file, batch_size=chunksize, **filters):
+        # The combined pattern drops non-matching rows before the per-group matching
+        chunk = chunk[filter_by_keywords(chunk, pattern, text_columns)]
+        if len(chunk):
+            yield chunk, match_keywords(chunk, keyword_groups, text_columns)
+
 def filter_by_date(df, date_column, date_cutoff):
     """
     Returns a boolean mask for rows where the date in date_column is greater than date_cutoff.
@@ -49,32 +112,19 @@ def filter_by_date(df, date_column, date_cutoff):
     Returns:
         pd.Series: Boolean mask based on the date condition.
     """
-    # Assuming the date column is in ISO string format or already comparable.
-    return df[date_column] > date_cutoff
+    # Compare real timestamps; string dates are parsed first.
+    dates = df[date_column]
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates, format='ISO8601', errors='coerce')
+    return (dates > pd.Timestamp(date_cutoff)).fillna(False).astype(bool)
 
-def filter_and_output(global_file, local_file, required_keywords,
-                      date_column, date_cutoff, text_columns, output_file):
+def combine_and_output(df_global_filtered, local_file, date_column, date_cutoff, output_file):
     """
-    Reads from the global posts CSV, filters it by keywords, appends data from the local posts CSV,
+    Appends data from the local posts CSV to the keyword-filtered global posts,
     filters the combined DataFrame by date, and writes the final data to output_file.
-    
-    Args:
-        global_file (str): Path to the global posts CSV.
-        local_file (str): Path to the local posts CSV.
-        required_keywords (list or str): Required keyword(s) for filtering global posts.
-        date_column (str): Name of the date column.
-        date_cutoff (str): Date cutoff (ISO format: 'YYYY-MM-DD').
-        text_columns (list): List of columns to search for keywords.
-        output_file (str): Output CSV file path.
     """
-    # Read the global posts CSV and filter by keywords.
-    df_global = pd.read_csv(global_file)
-    mask_keywords = filter_by_keywords(df_global, required_keywords, text_columns)
-    df_global_filtered = df_global[mask_keywords]
-    print(f"{global_file}: {len(df_global)} rows, filtered to {len(df_global_filtered)} rows by keywords.")
-    
-    # Read the local posts CSV.
-    df_local = pd.read_csv(local_file)
+    # Read the local posts (CSV or Parquet) with typed columns.
+    df_local = read_table(local_file)
     print(f"{local_file}: {len(df_local)} rows.")
     
     # Append (concatenate) the filtered global posts with the local posts.
@@ -86,10 +136,74 @@ def filter_and_output(global_file, local_file, required_keywords,
     df_final = df_combined[mask_date].sort_values(by=date_column)
     print(f"Final rows after date filter: {len(df_final)}.")
     
-    # Write the final DataFrame to the output CSV.
-    df_final.to_csv(output_file, index=False)
+    # Write the final DataFrame as Parquet, or as CSV for a '.csv' output file.
+    write_table(df_final, output_file)
     print(f"Final data saved to {output_file}.")
 
+def filter_and_output(global_file, local_file, required_keywords,
+                      date_column, date_cutoff, text_columns, output_file, chunksize=100000):
+    """
+    Reads from the global posts CSV, filters it by keywords, appends data from the local posts CSV,
+    filters the combined DataFrame by date, and writes the final data to output_file.
+    
+    Args:
+        global_file (str): Path to the global posts (CSV or Parquet).
+        local_file (str): Path to the local posts (CSV or Parquet).
+        required_keywords (list or str): Required keyword(s) for filtering global posts.
+        date_column (str): Name of the date column.
+        date_cutoff (str): Date cutoff (ISO format: 'YYYY-MM-DD').
+        text_columns (list): List of columns to search for keywords.
+        output_file (str): Output file path (.parquet or .csv).
+        chunksize (int): Number of global rows read at a time.
+    """
+    # Read the global posts in chunks and keep only the rows with a keyword. Rows before
+    # the cutoff day are skipped while reading; filter_by_date() applies the exact cutoff.
+    pattern = compile_keywords(required_keywords)
+    total = 0
+    kept = []
+    for chunk in iter_table(global_file, batch_size=chunksize, date_column=date_column, start=date_cutoff):
+        total += len(chunk)
+        kept.append(chunk[filter_by_keywords(chunk, pattern, text_columns)])
+    df_global_filtered = pd.concat(kept, ignore_index=True) if kept else pd.DataFrame(columns=column_names(global_file))
+    print(f"{global_file}: {total} rows from {date_cutoff} on, filtered to {len(df_global_filtered)} rows by keywords.")
+
+    combine_and_output(df_global_filtered, local_file, date_column, date_cutoff, output_file)
+
+def filter_and_output_by_fire(global_file, keyword_groups, outputs,
+                              date_column, date_cutoff, text_columns, chunksize=100000):
+    """
+    Produces several filtered outputs (e.g. one per fire) from a single pass over the global posts.
+
+    Every global row is matched once against the keywords of all groups. Each output then
+    takes the rows that mention one of its groups, appends its local posts CSV, filters by
+    date and is written like filter_and_output().
+
+    Args:
+        global_file (str): Path to the global posts (CSV or Parquet).
+        keyword_groups (dict): {group name: list of keywords}, e.g. one group per fire.
+        outputs (list of dict): One dict per output with 'groups' (list of group names, or None
+            for rows mentioning any group), 'local_file' and 'output_file'.
+        date_column (str): Name of the date column.
+        date_cutoff (str): Date cutoff (ISO format: 'YYYY-MM-DD').
+        text_columns (list): List of columns to search for keywords.
+        chunksize (int): Number of global rows read at a time.
+    """
+    kept = {output['output_file']: [] for output in outputs}
+    for chunk, matches in iter_matched_chunks(global_file, keyword_groups, text_columns, chunksize,
+                                              date_column=date_column, start=date_cutoff):
+        for output in outputs:
+            if output['groups'] is None:
+                kept[output['output_file']].append(chunk)
+            else:
+                kept[output['output_file']].append(chunk[matches[output['groups']].any(axis=1)])
+
+    for output in outputs:
+        frames = kept.pop(output['output_file'])
+        df_global_filtered = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=column_names(global_file))
+        print(f"{global_file}: {len(df_global_filtered)} rows kept by keywords for {output['output_file']}.")
+        combine_and_output(df_global_filtered, output['local_file'], date_column, date_cutoff,
+                           output['output_file'])
+
 # --------------------------
 # Set common parameters
 # --------------------------
@@ -97,63 +211,30 @@ date_column = 'date'
 date_cutoff = '2024-12-31'  # Adjust as needed
 text_columns = ['title', 'body']
 
-# # --------------------------
-# # For Eaton Fire
-# # --------------------------
-# eaton_required = ['eaton fire', 'eaton wildfire']
-# filter_and_output(
-#     global_file='eaton_global_posts.csv',
-#     local_file='eaton_local_posts.csv',
-#     required_keywords=eaton_required,
-#     date_column=date_column,
-#     date_cutoff=date_cutoff,
-#     text_columns=text_columns,
-#     output_file='eaton_final_posts.csv'
-# )
-
-# # --------------------------
-# # For Palisades Fire
-# # --------------------------
-# palisades_required = ['palisades fire', 'palisades wildfire']
-# filter_and_output(
-#     global_file='palisades_global_posts.csv',
-#     local_file='palisades_local_posts.csv',
-#     required_keywords=palisades_required,
-#     date_column=date_column,
-#     date_cutoff=date_cutoff,
-#     text_columns=text_columns,
-#     output_file='palisades_final_posts.csv'
-# )
-
-# # --------------------------
-# # For Hughes Fire
-# # --------------------------
-# hughes_required = ['hughes fire', 'hughes wildfire']
-# filter_and_output(
-#     global_file='hughes_global_posts.csv',
-#     local_file='hughes_local_posts.csv',
-#     required_keywords=hughes_required,
-#     date_column=date_column,
-#     date_cutoff=date_cutoff,
-#     text_columns=text_columns,
-#     output_file='hughes_final_posts.csv'
-# )
+# --------------------------
+# Keywords for each fire
+# --------------------------
+fire_keywords = {
+    'eaton': ['eaton fire', 'eaton wildfire'],
+    'palisades': ['palisades fire', 'palisades wildfire'],
+    'hughes': ['hughes fire', 'hughes wildfire'],
+    'ca': ['la county fire', 'la fire', 'la wildfire',
+           'california fire', 'california wildfire', 'calfire'],
+}
 
 # --------------------------
-# For ALL Fire
+# For ALL Fire and each fire, in one pass over the global posts
 # --------------------------
-all_required = ['palisades fire', 'palisades wildfire', 
-                'eaton fire', 'eaton wildfire', 
-                'hughes fire', 'hughes wildfire', 
-                'la county fire', 'la fire', 'la wildfire',
-                'california fire', 'california wildfire', 'calfire']
-filter_and_output(
-    global_file='ca_global_posts.csv',
-    local_file='ca_local_posts.csv',
-    required_keywords=all_required,
+filter_and_output_by_fire(
+    global_file='ca_global_posts.parquet',
+    keyword_groups=fire_keywords,
+    outputs=[
+        {'groups': None, 'local_file': 'ca_local_posts.csv', 'output_file': 'ca_final_posts.parquet'},
+        # {'groups': ['eaton'], 'local_file': 'eaton_local_posts.csv', 'output_file': 'eaton_final_posts.parquet'},
+        # {'groups': ['palisades'], 'local_file': 'palisades_local_posts.csv', 'output_file': 'palisades_final_posts.parquet'},
+        # {'groups': ['hughes'], 'local_file': 'hughes_local_posts.csv', 'output_file': 'hughes_final_posts.parquet'},
+    ],
     date_column=date_column,
     date_cutoff=date_cutoff,
-    text_columns=text_columns,
-    output_file='ca_final_posts.csv'
+    text_columns=text_columns
 )
-
@@ -1,28 +1,259 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
 import pandas as pd
 
-def merge_csv_files(file_paths, output_path):
+from Storage import DATE_FORMAT, column_names, export_csv, is_parquet, iter_table
+
+def _key_frame(chunk, key):
+    # Keys are compared as strings, so e.g. IDs read from CSV and Parquet still match
+    return pd.DataFrame({col: chunk[col].astype('string') for col in key})
+
+def _chunk_schema(chunk):
+    """
+    Arrow schema of a chunk. Columns without any value get the null type, so that e.g. a
+    column that is empty in one input (read as float NaN) does not fix the output type.
+    """
+    import pyarrow as pa
+
+    schema = pa.Schema.from_pandas(chunk, preserve_index=False).remove_metadata()
+    empty = chunk.columns[chunk.isna().all().to_numpy()]
+    return pa.schema([pa.field(field.name, pa.null()) if field.name in empty else field for field in schema])
+
+def _unify_schemas(schemas, columns):
+    """
+    Output schema of the union of the inputs' columns, like pd.concat: null types give way
+    to the others, numeric types are widened, and columns whose types cannot be
+    reconciled (e.g. numbers in one input, text in another) are written as strings.
+    """
+    import pyarrow as pa
+
+    first, fields = {}, {}
+    for schema in schemas:
+        for field in schema:
+            first.setdefault(field.name, field)
+            current = fields.get(field.name)
+            if pa.types.is_null(field.type) or (current is not None and current.type == field.type):
+                continue
+            if current is None:
+                fields[field.name] = field
+                continue
+            try:
+                fields[field.name] = pa.unify_schemas([pa.schema([current]), pa.schema([field])],
+                                                      promote_options='permissive').field(0)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                fields[field.name] = pa.field(field.name, pa.string())
+    # Columns empty everywhere keep the type pandas gave them (e.g. double for NaN)
+    return pa.schema([fields.get(col) or first.get(col) or pa.field(col, pa.null()) for col in columns])
+
+def _partition_keys(file_paths, key, num_partitions, chunksize, spill_dir, schemas=None):
+    """
+    First pass: spills (key, source, row) of every input row to hash partitions on disk.
+
+    Args:
+        schemas (list): If given, all columns are read and the _chunk_schema() of every
+            chunk is appended to it.
+
+    Returns:
+        list of int: Number of rows in each input.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(col, pa.string()) for col in key] + [('_source', pa.int32()), ('_row', pa.int64())])
+    writers = {}
+    row_counts = []
+    try:
+        for source, file in enumerate(file_paths):
+            rows = 0
+            for chunk in iter_table(file, columns=None if schemas is not None else key, batch_size=chunksize):
+                if schemas is not None:
+                    schemas.append(_chunk_schema(chunk))
+                keys = _key_frame(chunk, key)
+                keys['_source'] = np.int32(source)
+                keys['_row'] = np.arange(rows, rows + len(keys), dtype=np.int64)
+                rows += len(keys)
+                partitions = pd.util.hash_pandas_object(keys[key], index=False).to_numpy() % num_partitions
+                for partition, part in keys.groupby(partitions, sort=True):
+                    if partition not in writers:
+                        path = os.path.join(spill_dir, f"keys-{partition:04d}.parquet")
+                        writers[partition] = pq.ParquetWriter(path, schema)
+                    writers[partition].write_table(pa.Table.from_pandas(part, schema=schema, preserve_index=False))
+            row_counts.append(rows)
+            print(f"Partitioned {rows} rows of {file}.")
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return row_counts
+
+def _select_winners(key, row_counts, num_partitions, spill_dir):
+    """
+    Second pass: dedups one partition at a time and marks the winning row of every key.
+
+    Rows were spilled in (source, row) order, so keeping the first occurrence means the
+    earliest input wins, and within an input its first row wins.
+
+    Returns:
+        list of np.ndarray: One boolean mask per input, True for the rows to keep.
+    """
+    winners = [np.zeros(rows, dtype=bool) for rows in row_counts]
+    for partition in range(num_partitions):
+        path = os.path.join(spill_dir, f"keys-{partition:04d}.parquet")
+        if not os.path.exists(path):
+            continue
+        keys = pd.read_parquet(path)
+        keys = keys.drop_duplicates(subset=key, keep='first')
+        for source, rows in keys.groupby('_source')['_row']:
+            winners[source][rows.to_numpy()] = True
+    return winners
+
+class _OutputWriter:
     """
-    Merges multiple CSV files with the same columns into a single CSV file.
+    Appends DataFrame chunks to a single CSV or Parquet output file.
+
+    Chunks are written to a temporary file next to the output, which only replaces the
+    output in commit(), so a failed merge leaves no partial file behind.
+
+    Args:
+        output_path (str): The .csv or .parquet output.
+        columns (list): Output columns; missing ones are filled with nulls.
+        schema (pa.Schema): Parquet output schema (see _unify_schemas()).
+    """
+
+    def __init__(self, output_path, columns, schema=None):
+        self.output_path = output_path
+        self.parquet = is_parquet(output_path)
+        self.columns = list(columns)
+        self.schema = schema
+        self.rows = 0
+        self._tmp_path = output_path + '.tmp'
+        self._file = None
+        self._writer = None
+
+    def _conform(self, chunk):
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        arrays = []
+        for field in self.schema:
+            column = table.column(field.name)
+            if column.null_count == len(column):
+                arrays.append(pa.nulls(len(column), field.type))
+            else:
+                arrays.append(column.cast(field.type))
+        return pa.Table.from_arrays(arrays, schema=self.schema)
+
+    def write(self, chunk):
+        chunk = chunk.reindex(columns=self.columns)
+        if self.parquet:
+            import pyarrow.parquet as pq
+
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self._tmp_path, self.schema)
+            self._writer.write_table(self._conform(chunk))
+        else:
+            if self._file is None:
+                self._file = open(self._tmp_path, 'w', newline='', encoding='utf-8')
+                chunk.to_csv(self._file, index=False, date_format=DATE_FORMAT)
+            else:
+                chunk.to_csv(self._file, index=False, header=False, date_format=DATE_FORMAT)
+        self.rows += len(chunk)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def commit(self):
+        if self.rows == 0:
+            self.write(pd.DataFrame(columns=self.columns))  # Header (or schema) only
+        self.close()
+        os.replace(self._tmp_path, self.output_path)
+
+    def abort(self):
+        self.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+def merge_csv_files(file_paths, output_path, key='post_id', source_column=None,
+                    num_partitions=64, chunksize=100000, tmp_dir=None):
+    """
+    Merges multiple CSV or Parquet files with the same columns into a single file,
+    keeping one full row per key.
+
+    The merge runs in bounded memory: the keys of all inputs are hash-partitioned and
+    spilled to disk, each partition is deduplicated on its own, and the inputs are then
+    streamed a second time to write the winning rows. When a key appears several times,
+    the input listed first wins, and within an input its first row wins. The output keeps
+    the input order, exactly like concatenating the inputs and dropping duplicates.
 
     Parameters:
-        file_paths (list of str): List of file paths to the CSV files to merge.
-        output_path (str): The file path where the merged CSV will be saved.
+        file_paths (list of str): List of file paths to the CSV or Parquet files to merge.
+        output_path (str): The file path where the merged data will be saved (.parquet or .csv).
+        key (str or list of str): Column(s) identifying a row.
+        source_column (str): Optional column to record the input file each row came from.
+        num_partitions (int): Number of on-disk hash partitions; only one is in memory at a time.
+        chunksize (int): Number of rows read from an input at a time.
+        tmp_dir (str): Directory for the spilled partitions. Defaults to the system temp dir.
 
     Returns:
         None
+
+    Raises:
+        Exception: Any read or write error; the output is then left untouched.
     """
+    key = [key] if isinstance(key, str) else list(key)
+    missing = [file for file in file_paths if not os.path.exists(file)]
+    for file in missing:
+        print(f"Error processing {file}: file not found, skipping it.")
+    file_paths = [file for file in file_paths if file not in missing]
+    if not file_paths:
+        raise FileNotFoundError("None of the files to merge exist")
+
+    # Union of the inputs' columns, in order of appearance, as pd.concat would give
+    columns = list(dict.fromkeys(col for file in file_paths for col in column_names(file)))
+    if source_column is not None and source_column not in columns:
+        columns.append(source_column)
+    schemas = [] if is_parquet(output_path) else None
+
+    spill_dir = tempfile.mkdtemp(prefix='merge-', dir=tmp_dir)
+    writer = None
     try:
-        # Read and concatenate all CSV files
-        dataframes = [pd.read_csv(file) for file in file_paths]
-        merged_df = pd.concat(dataframes, ignore_index=True)
-        
-        merged_df.drop_duplicates(subset=['post_id'], inplace=True)
-        
-        # Save the merged data to the output file
-        merged_df.to_csv(output_path, index=False)
-        print(f"Files merged successfully into {output_path}!")
-    except Exception as e:
-        print(f"An error occurred: {e}")
+        row_counts = _partition_keys(file_paths, key, num_partitions, chunksize, spill_dir, schemas)
+        winners = _select_winners(key, row_counts, num_partitions, spill_dir)
+        schema = None
+        if schemas is not None:
+            if source_column is not None:
+                schemas.append(_chunk_schema(pd.DataFrame({source_column: ['']})))
+            schema = _unify_schemas(schemas, columns)
+
+        # Stream the inputs again and keep only the winning rows
+        writer = _OutputWriter(output_path, columns, schema)
+        for source, file in enumerate(file_paths):
+            rows = 0
+            for chunk in iter_table(file, batch_size=chunksize):
+                keep = winners[source][rows:rows + len(chunk)]
+                rows += len(chunk)
+                if not keep.any():
+                    continue
+                chunk = chunk[keep]
+                if source_column is not None:
+                    chunk = chunk.assign(**{source_column: os.path.basename(file)})
+                writer.write(chunk)
+            print(f"{file}: kept {int(winners[source].sum())} of {row_counts[source]} rows.")
+        writer.commit()
+        print(f"Files merged successfully into {output_path} ({writer.rows} unique rows)!")
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
 
 # # Example usage
 # file_paths = [
@@ -34,14 +265,23 @@ def merge_csv_files(file_paths, output_path):
 
 # for in_file, out_file in zip(file_paths, output_path):
 #     merge_csv_files(in_file, out_file)
-    
+
 # Example usage
-# file_paths = ['eaton_global_posts.csv', 'palisades_global_posts.csv', 'hughes_global_posts.csv']
-# output_path = 'ca_global_posts.csv'
+# file_paths = ['eaton_global_posts.parquet', 'palisades_global_posts.parquet', 'hughes_global_posts.parquet']
+# output_path = 'ca_global_posts.parquet'
 
 # merge_csv_files(file_paths, output_path)
 
-file_paths = ['ca_final_posts.csv', 'palisades_final_posts.csv', 'eaton_final_posts.csv', 'hughes_final_posts.csv']
-output_path = 'all_final_posts.csv'
+if __name__ == "__main__":
+    file_paths = ['ca_final_posts.parquet', 'palisades_final_posts.parquet', 'eaton_final_posts.parquet', 'hughes_final_posts.parquet']
+    output_path = 'all_final_posts.parquet'
+
+    try:
+        merge_csv_files(file_paths, output_path)
+    except Exception as e:
+        # Nothing to publish: the previous merge (if any) is left as it was
+        print(f"An error occurred: {e}")
+        exit(1)
 
-merge_csv_files(file_paths, output_path)
\ No newline at end of file
+    # CSV copy for publishing, only of a complete merge
+    export_csv(output_path, 'all_final_posts.csv')
@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import pandas as pd
+
+
+class PostIndex:
+    """
+    Persistent on-disk index of collected post IDs, keyed by (post_id, source).
+
+    `source` is whatever produced the post, e.g. the search query or the output CSV.
+    Posts are added in atomic transactions as searches finish, so the index is always
+    consistent with what has been collected and later runs can dedup against it
+    without re-reading every historical CSV.
+
+    Args:
+        path (str): Path to the SQLite file (created if it does not exist).
+    """
+
+    def __init__(self, path: str = 'post_index.sqlite'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS post_index (
+                post_id TEXT NOT NULL,
+                source TEXT NOT NULL,
+                added_at TEXT,
+                PRIMARY KEY (post_id, source)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS post_index_post_id ON post_index (post_id);
+            CREATE TABLE IF NOT EXISTS imported_files (
+                path TEXT PRIMARY KEY,
+                mtime REAL,
+                size INTEGER
+            );
+        """)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __contains__(self, post_id):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM post_index WHERE post_id = ? LIMIT 1", (post_id,)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(DISTINCT post_id) FROM post_index").fetchone()[0]
+
+    def add_many(self, post_ids, source: str):
+        """
+        Atomically add post IDs under `source`.
+
+        Returns:
+            list: The post IDs that were not yet indexed for this source, in input order.
+        """
+        now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        added = []
+        with self._lock, self._conn:
+            for post_id in post_ids:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO post_index (post_id, source, added_at) VALUES (?, ?, ?)",
+                    (post_id, source, now))
+                if cursor.rowcount:
+                    added.append(post_id)
+        return added
+
+    def sources(self, post_id):
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT source FROM post_index WHERE post_id = ?", (post_id,))]
+
+    def import_csvs(self, files, chunksize: int = 100000):
+        """
+        One-time bootstrap from CSV files written before the index existed.
+
+        Only the post_id column is read, in chunks. Files already imported (same path,
+        size and modification time) are skipped, so calling this on every run is cheap.
+
+        Args:
+            files (dict): {source: csv_path}.
+        """
+        for source, file in files.items():
+            try:
+                stat = os.stat(file)
+            except OSError as e:
+                print(f"Error reading {file}: {e}")
+                continue
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT mtime, size FROM imported_files WHERE path = ?", (os.path.abspath(file),)).fetchone()
+            if row == (stat.st_mtime, stat.st_size):
+                continue
+            total = 0
+            for chunk in pd.read_csv(file, usecols=['post_id'], dtype={'post_id': str}, chunksize=chunksize):
+                total += len(self.add_many(chunk['post_id'].dropna().tolist(), source))
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO imported_files (path, mtime, size) VALUES (?, ?, ?)",
+                    (os.path.abspath(file), stat.st_mtime, stat.st_size))
+            print(f"Indexed {total} new post IDs from {file}.")
@@ -0,0 +1,129 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import prawcore
+
+from CrawlUtils import TokenBucket, CrawlStats, backoff_delay, thread_local_client
+from CrawlJournal import CrawlJournal
+from PostIndex import PostIndex
+
+
+def post_to_dict(post):
+    """
+    Convert a PRAW submission to the row stored for it, with the date in a readable format.
+    """
+    # Safely extract author details (handle cases where author is deleted)
+    author_id = getattr(post.author, 'id', None)
+    author_verified = getattr(post.author, 'has_verified_email', None)
+    return {
+        'post_id': post.id,
+        'subreddit': post.subreddit.display_name,
+        'author_id': author_id,
+        'author_verified': author_verified,
+        'flare': post.author_flair_text,
+        'title': post.title,
+        'score': post.score,
+        'date': datetime.utcfromtimestamp(post.created_utc).strftime('%Y-%m-%d %H:%M:%S'),
+        'num_comments': post.num_comments,
+        'body': post.selftext,
+    }
+
+
+def search_subreddit(reddit, query, subreddit_name, limiter: TokenBucket = None, page_size: int = 100,
+                     sort='comments', time_filter='year'):
+    """
+    Run one search, taking a limiter token for every page of results.
+
+    Returns:
+        List[Dict[str, Any]]: Post details in the order returned by the search.
+    """
+    posts = []
+    results = reddit.subreddit(subreddit_name).search(query, sort=sort, limit=None, time_filter=time_filter)
+    for i, post in enumerate(results):
+        if limiter is not None and i % page_size == page_size - 1:
+            limiter.acquire()  # The next item may need the next page
+        posts.append(post_to_dict(post))
+    return posts
+
+
+def search_matrix(reddit, tasks, index: PostIndex = None, skip_index: PostIndex = None,
+                  limiter: TokenBucket = None, workers: int = 4, retries: int = 3,
+                  backoff_base: float = 2.0, journal: CrawlJournal = None):
+    """
+    Run a query x subreddit search matrix concurrently under a shared rate limiter.
+
+    Every task is a (query, subreddit, source) triple; results are grouped by source
+    (e.g. the output CSV). Within a source, posts found by several tasks are kept once.
+    Posts already in `skip_index` are dropped, and new posts are added to `index` under
+    their source in one atomic transaction as soon as their task finishes.
+
+    Args:
+        reddit: A PRAW client, or a zero-argument callable returning one per worker thread.
+        tasks (list): (query, subreddit, source) triples.
+        index (PostIndex): Optional persistent index the found posts are recorded in.
+        skip_index (PostIndex): Optional persistent index of posts to skip.
+        limiter (TokenBucket): Shared token bucket. Defaults to Reddit's 100 requests/minute.
+        workers (int): Number of worker threads.
+        retries (int): Number of attempts for each search.
+        backoff_base (float): Base delay in seconds for exponential backoff between attempts.
+        journal (CrawlJournal): Optional journal; finished searches are read back from it.
+
+    Returns:
+        dict: {source: list of post dicts}, sources in task order.
+    """
+    limiter = limiter or TokenBucket(rate=100 / 60, capacity=10)
+    client = thread_local_client(reddit)
+    stats = CrawlStats()
+
+    def run(query, sub):
+        if journal is not None and journal.search_done(query, sub):
+            return journal.search_posts(query, sub)
+        for attempt in range(retries):
+            try:
+                limiter.acquire()
+                posts = search_subreddit(client(), query, sub, limiter)
+                if journal is not None:
+                    journal.record_search(query, sub, posts)
+                return posts
+            except prawcore.exceptions.NotFound as nf:
+                # This exception is raised if the subreddit is not found.
+                print(f"Subreddit r/{sub} raised a NotFound exception: {nf}")
+                return []
+            except Exception as e:
+                print(f"Attempt {attempt + 1} failed while searching r/{sub} for '{query}': {type(e).__name__}: {e}")
+                if attempt == retries - 1:
+                    if journal is not None:
+                        journal.record_search_failure(query, sub, e)
+                    raise
+                stats.add(retries=1)
+                time.sleep(backoff_delay(attempt, backoff_base))
+
+    results = {source: [] for _, _, source in tasks}
+    seen = {source: set() for source in results}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run, query, sub): (query, sub, source) for query, sub, source in tasks}
+        for future in as_completed(futures):
+            query, sub, source = futures[future]
+            try:
+                posts = future.result()
+            except Exception as e:
+                print(f"An error occurred while searching in r/{sub}: {type(e).__name__}: {e}")
+                stats.add(failed=1)
+                continue
+            kept = []
+            for post in posts:
+                if post['post_id'] in seen[source]:
+                    continue
+                if skip_index is not None and post['post_id'] in skip_index:
+                    continue  # Skip posts already in the skip index
+                seen[source].add(post['post_id'])
+                kept.append(post)
+            if index is not None:
+                index.add_many([post['post_id'] for post in kept], source)
+            results[source].extend(kept)
+            stats.add(posts=len(kept))
+            print(f"r/{sub} '{query}': {len(posts)} posts found, {len(kept)} kept for {source}.")
+
+    stats.report("Search")
+    return results
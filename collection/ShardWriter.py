@@ -0,0 +1,180 @@
+import csv
+import json
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from CrawlJournal import COMMENT_COLUMNS
+from Storage import coerce_types, DATE_FORMAT
+
+
+class ShardedWriter:
+    """
+    Streams crawled rows to disk as fixed-size, rotated CSV or Parquet shards.
+
+    Rows are written post by post as they arrive, so memory stays flat no matter how many
+    posts are crawled. A post is never split across shards; a shard is rotated once it
+    holds at least `shard_size` rows. Every closed shard is listed in `manifest.json`
+    (path, row count and post IDs), which later steps read lazily with iter_frames().
+    Re-opening an existing directory resumes it: shards in the manifest are kept and a
+    shard left half-written by a crash is discarded.
+
+    Args:
+        out_dir (str): Directory for the shards and manifest.
+        prefix (str): File name prefix of the shards.
+        shard_size (int): Number of rows after which a shard is rotated.
+        fmt (str): 'csv' or 'parquet' (typed columns, requires pyarrow).
+        columns (list): Column order of the shards.
+    """
+
+    def __init__(self, out_dir, prefix='comments', shard_size=50000, fmt='csv', columns=COMMENT_COLUMNS):
+        if fmt not in ('csv', 'parquet'):
+            raise ValueError(f"Unsupported shard format: {fmt}")
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.fmt = fmt
+        self.columns = list(columns)
+        self.manifest_path = os.path.join(out_dir, 'manifest.json')
+        os.makedirs(out_dir, exist_ok=True)
+
+        if os.path.exists(self.manifest_path):
+            self.manifest = read_manifest(self.manifest_path)
+            if self.manifest['format'] != fmt or self.manifest['columns'] != self.columns:
+                raise ValueError(f"{self.manifest_path} was written with a different format or columns")
+        else:
+            self.manifest = {'format': fmt, 'columns': self.columns, 'total_rows': 0, 'shards': []}
+        self.written_posts = {post_id for shard in self.manifest['shards'] for post_id in shard['posts']}
+
+        self._file = None
+        self._writer = None
+        self._buffer = []
+        self._shard_rows = 0
+        self._shard_posts = []
+        self._shard_path = None
+
+    def _open_shard(self):
+        index = len(self.manifest['shards'])
+        self._shard_path = os.path.join(self.out_dir, f"{self.prefix}-{index:05d}.{self.fmt}")
+        self._shard_rows = 0
+        self._shard_posts = []
+        if self.fmt == 'csv':
+            self._file = open(self._shard_path, 'w', newline='', encoding='utf-8')
+            self._writer = csv.DictWriter(self._file, fieldnames=self.columns, extrasaction='ignore')
+            self._writer.writeheader()
+
+    def _flush_parquet(self):
+        if not self._buffer:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Parquet shards are typed (timestamps, integer scores), see Storage.coerce_types
+        frame = coerce_types(pd.DataFrame(self._buffer, columns=self.columns))
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._shard_path, table.schema)
+        else:
+            table = table.cast(self._writer.schema)
+        self._writer.write_table(table)
+        self._buffer = []
+
+    def _close_shard(self):
+        if self._shard_path is None:
+            return
+        if self.fmt == 'csv':
+            self._file.close()
+        else:
+            self._flush_parquet()
+            if self._writer is not None:
+                self._writer.close()
+        self._file = None
+        self._writer = None
+        self.manifest['shards'].append({
+            'path': os.path.basename(self._shard_path),
+            'rows': self._shard_rows,
+            'posts': self._shard_posts,
+            'closed_at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+        })
+        self.manifest['total_rows'] += self._shard_rows
+        self._shard_path = None
+        self._write_manifest()
+
+    def _write_manifest(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def write_post(self, post_id, rows):
+        """
+        Append all rows of one post, rotating the shard afterwards if it is full.
+        """
+        if self._shard_path is None:
+            self._open_shard()
+        if self.fmt == 'csv':
+            self._writer.writerows(rows)
+        else:
+            self._buffer.extend({col: row.get(col) for col in self.columns} for row in rows)
+            if len(self._buffer) >= 10000:
+                self._flush_parquet()
+        self._shard_rows += len(rows)
+        self._shard_posts.append(post_id)
+        self.written_posts.add(post_id)
+        if self._shard_rows >= self.shard_size:
+            self._close_shard()
+
+    def close(self):
+        """
+        Close the current shard and write the final manifest.
+
+        Returns:
+            str: Path of the manifest.
+        """
+        self._close_shard()
+        self._write_manifest()
+        return self.manifest_path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_manifest(manifest_path):
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def iter_frames(manifest_path, columns=None):
+    """
+    Lazily yields one DataFrame per shard listed in the manifest.
+
+    Args:
+        manifest_path (str): Path to the manifest written by ShardedWriter.
+        columns (list): Optional subset of columns to load.
+    """
+    manifest = read_manifest(manifest_path)
+    base_dir = os.path.dirname(manifest_path)
+    for shard in manifest['shards']:
+        path = os.path.join(base_dir, shard['path'])
+        if manifest['format'] == 'csv':
+            yield pd.read_csv(path, usecols=columns)
+        else:
+            yield pd.read_parquet(path, columns=columns)
+
+
+def export_csv(manifest_path, output_file, columns=None):
+    """
+    Concatenates all shards into a single CSV file, one shard in memory at a time.
+    """
+    header = True
+    rows = 0
+    with open(output_file, 'w', newline='', encoding='utf-8') as f:
+        for frame in iter_frames(manifest_path, columns):
+            frame.to_csv(f, index=False, header=header, date_format=DATE_FORMAT)
+            header = False
+            rows += len(frame)
+    print(f"Exported {rows} rows from {manifest_path} to {output_file}.")
@@ -0,0 +1,219 @@
+import os
+import shutil
+
+import pandas as pd
+
+# Column types of the datasets exchanged by the collection scripts. Columns that are not
+# listed here are kept as they are.
+COLUMN_TYPES = {
+    'post_id': 'string',
+    'comment_id': 'string',
+    'subreddit': 'category',
+    'author_id': 'string',
+    'author': 'string',
+    'author_verified': 'boolean',
+    'flare': 'string',
+    'title': 'string',
+    'body': 'string',
+    'score': 'Int64',
+    'num_comments': 'Int64',
+}
+TIMESTAMP_COLUMNS = ['date', 'created_utc']
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def is_parquet(path):
+    """
+    True for a Parquet file or a (partitioned) Parquet dataset directory.
+    """
+    return path.endswith('.parquet') or os.path.isdir(path)
+
+
+def parquet_path(path):
+    """
+    Returns the Parquet counterpart of a CSV path, e.g. 'ca_final_posts.parquet'.
+    """
+    return os.path.splitext(path)[0] + '.parquet'
+
+
+def column_names(path):
+    """
+    Returns the column names of a dataset without reading its rows.
+    """
+    if is_parquet(path):
+        import pyarrow.dataset as ds
+
+        return ds.dataset(path, format='parquet', partitioning='hive').schema.names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def coerce_types(df):
+    """
+    Gives the known columns their real types: timestamps, a categorical subreddit and
+    nullable integer scores. Unparseable timestamps become NaT.
+
+    Args:
+        df (pd.DataFrame): Input DataFrame, e.g. as read from a CSV.
+
+    Returns:
+        pd.DataFrame: The DataFrame with typed columns (a new object, the input is not modified).
+    """
+    df = df.copy()
+    for col in df.columns:
+        if col in TIMESTAMP_COLUMNS:
+            if not pd.api.types.is_datetime64_any_dtype(df[col]):
+                df[col] = pd.to_datetime(df[col], format='ISO8601', errors='coerce')
+        elif col in COLUMN_TYPES:
+            dtype = COLUMN_TYPES[col]
+            if dtype == 'Int64':
+                df[col] = pd.to_numeric(df[col], errors='coerce').round().astype('Int64')
+            elif dtype == 'category' and isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].cat.remove_unused_categories()
+            else:
+                df[col] = df[col].astype(dtype)
+    return df
+
+
+def _filter_expression(date_column=None, start=None, end=None, subreddits=None):
+    import pyarrow.dataset as ds
+
+    expression = None
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field(date_column) >= pd.Timestamp(start))
+    if end is not None:
+        conditions.append(ds.field(date_column) < pd.Timestamp(end))
+    if subreddits is not None:
+        conditions.append(ds.field('subreddit').isin(list(subreddits)))
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def _filter_frame(df, date_column=None, start=None, end=None, subreddits=None):
+    mask = pd.Series(True, index=df.index)
+    if start is not None:
+        mask &= (df[date_column] >= pd.Timestamp(start)).fillna(False).to_numpy(dtype=bool)
+    if end is not None:
+        mask &= (df[date_column] < pd.Timestamp(end)).fillna(False).to_numpy(dtype=bool)
+    if subreddits is not None:
+        mask &= df['subreddit'].isin(list(subreddits)).to_numpy(dtype=bool)
+    return df[mask]
+
+
+def iter_table(path, columns=None, date_column='date', start=None, end=None, subreddits=None,
+               batch_size=100000):
+    """
+    Lazily yields a dataset as typed DataFrame batches, with projection and predicate pushdown.
+
+    For Parquet only the requested columns are decoded, and row groups or partitions that
+    cannot match the date range or subreddits are skipped. CSV files are read in chunks and
+    filtered after parsing, so both formats give the same rows.
+
+    Args:
+        path (str): A .csv file, a .parquet file or a Parquet dataset directory.
+        columns (list): Columns to load. Defaults to all.
+        date_column (str): Timestamp column the date range applies to.
+        start (str): Keep rows on or after this timestamp (e.g. '2025-01-01').
+        end (str): Keep rows before this timestamp.
+        subreddits (list): Keep rows from these subreddits.
+        batch_size (int): Maximum number of rows per batch.
+
+    Yields:
+        pd.DataFrame: Typed batches.
+    """
+    has_filter = start is not None or end is not None or subreddits is not None
+    if is_parquet(path):
+        import pyarrow.dataset as ds
+
+        dataset = ds.dataset(path, format='parquet', partitioning='hive')
+        expression = _filter_expression(date_column, start, end, subreddits)
+        for batch in dataset.to_batches(columns=columns, filter=expression, batch_size=batch_size):
+            if batch.num_rows:
+                yield coerce_types(batch.to_pandas())
+        return
+
+    # Filter columns are parsed as well, then projected away again
+    usecols = None
+    if columns is not None:
+        usecols = list(columns)
+        if (start is not None or end is not None) and date_column not in usecols:
+            usecols.append(date_column)
+        if subreddits is not None and 'subreddit' not in usecols:
+            usecols.append('subreddit')
+    for chunk in pd.read_csv(path, usecols=usecols, chunksize=batch_size):
+        chunk = coerce_types(chunk)
+        if has_filter:
+            chunk = _filter_frame(chunk, date_column, start, end, subreddits)
+        if columns is not None:
+            chunk = chunk[list(columns)]
+        if len(chunk):
+            yield chunk
+
+
+def read_table(path, columns=None, date_column='date', start=None, end=None, subreddits=None):
+    """
+    Reads a whole dataset (CSV or Parquet) into one typed DataFrame.
+
+    Takes the same projection and filter arguments as iter_table().
+
+    Returns:
+        pd.DataFrame: The typed rows, in file order.
+    """
+    if is_parquet(path):
+        import pyarrow.dataset as ds
+
+        dataset = ds.dataset(path, format='parquet', partitioning='hive')
+        expression = _filter_expression(date_column, start, end, subreddits)
+        return coerce_types(dataset.to_table(columns=columns, filter=expression).to_pandas())
+
+    frames = list(iter_table(path, columns, date_column, start, end, subreddits))
+    if not frames:
+        return coerce_types(pd.read_csv(path, usecols=columns, nrows=0))
+    return pd.concat(frames, ignore_index=True)
+
+
+def write_table(df, path, partition_cols=None, row_group_size=100000):
+    """
+    Writes a DataFrame with typed columns as Parquet, or as CSV if the path ends in '.csv'.
+
+    Args:
+        df (pd.DataFrame): Data to write.
+        path (str): Output .parquet file, dataset directory (with partition_cols) or .csv file.
+        partition_cols (list): Optional columns to partition the Parquet dataset by, e.g.
+            ['subreddit']. An existing dataset at the path is replaced.
+        row_group_size (int): Rows per Parquet row group; smaller groups make date filters
+            skip more data.
+    """
+    df = coerce_types(df)
+    if not is_parquet(path) and partition_cols is None:
+        df.to_csv(path, index=False, encoding='utf-8', date_format=DATE_FORMAT)
+        print(f"Saved {len(df)} rows to {path}.")
+        return
+    if partition_cols:
+        if os.path.isdir(path):
+            shutil.rmtree(path)  # Partitioned writes add files, they would not replace old ones
+        df.to_parquet(path, index=False, partition_cols=partition_cols)
+    else:
+        df.to_parquet(path, index=False, row_group_size=row_group_size)
+    print(f"Saved {len(df)} rows to {path}.")
+
+
+def export_csv(path, output_file, columns=None, **filters):
+    """
+    Exports a dataset (e.g. for publishing) to a single CSV file, one batch in memory at a time.
+
+    Timestamps are written in the '%Y-%m-%d %H:%M:%S' format used by the collection scripts.
+    Keyword arguments are passed to iter_table() as filters.
+    """
+    header = True
+    rows = 0
+    with open(output_file, 'w', newline='', encoding='utf-8') as f:
+        for frame in iter_table(path, columns, **filters):
+            frame.to_csv(f, index=False, header=header, date_format=DATE_FORMAT)
+            header = False
+            rows += len(frame)
+    if header:
+        # Nothing matched: still write the header
+        pd.DataFrame(columns=columns or column_names(path)).to_csv(output_file, index=False)
+    print(f"Exported {rows} rows from {path} to {output_file}.")
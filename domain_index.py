@@ -0,0 +1,311 @@
+"""
+Persistent index of the domains linked in Reddit comments.
+
+Every linked domain is counted per (domain, post_id, hour bucket, fire) in a SQLite file,
+so link-source questions such as "which sources spiked during Eaton's first 48 hours"
+are answered with one query instead of re-parsing every comment body. The index is
+built once from the comment store and then updated incrementally: comments that are
+already indexed are skipped.
+
+Domains are resolved exactly as in url.py. A post's fire follows the notebooks: 'eaton'
+or 'palisades' if the post is in that fire's final posts, 'common' if it is in several,
+'other' otherwise.
+"""
+
+import argparse
+import os
+import sqlite3
+from collections import Counter
+from pathlib import Path
+
+import pandas as pd
+
+from url import DomainResolver, DOMAIN_MAPPINGS, extract_urls_from_text
+
+
+def fire_name(fires: list) -> str:
+    """Fire label of a post from the fires whose posts contain it."""
+    if len(fires) > 1:
+        return 'common'
+    elif len(fires) == 1:
+        return fires[0]
+    return 'other'
+
+
+def read_post_ids(path: str) -> list:
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=['post_id'])['post_id'].dropna().astype(str).tolist()
+    return pd.read_csv(path, usecols=['post_id'], dtype={'post_id': str})['post_id'].dropna().tolist()
+
+
+def iter_comment_chunks(path: str, chunksize: int = 50000):
+    """Yields (comment_id, post_id, body, created_utc) chunks of a comments CSV or Parquet file."""
+    columns = ['comment_id', 'post_id', 'body', 'created_utc']
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, dtype={'comment_id': str, 'post_id': str}, chunksize=chunksize)
+
+
+class DomainIndex:
+    """
+    SQLite index of domain mentions keyed by (domain, post_id, hour, fire).
+
+    Args:
+        path (str): Path to the SQLite file (created if it does not exist).
+        domain_mappings (dict): Domain aliases used for normalization, as in url.py.
+    """
+
+    def __init__(self, path: str = 'domain_index.sqlite', domain_mappings: dict = DOMAIN_MAPPINGS):
+        self.path = path
+        self.resolver = DomainResolver(domain_mappings)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS domain_hits (
+                domain TEXT NOT NULL,
+                post_id TEXT NOT NULL,
+                hour TEXT NOT NULL,
+                fire TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (domain, post_id, hour, fire)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS domain_hits_hour ON domain_hits (hour);
+            CREATE INDEX IF NOT EXISTS domain_hits_fire_hour ON domain_hits (fire, hour);
+            CREATE INDEX IF NOT EXISTS domain_hits_post ON domain_hits (post_id);
+            CREATE TABLE IF NOT EXISTS indexed_comments (
+                comment_id TEXT PRIMARY KEY
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS post_fire (
+                post_id TEXT PRIMARY KEY,
+                fire TEXT NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS index_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    # --------------------------
+    # Fires
+    # --------------------------
+    def set_fire_posts(self, fire_posts: dict):
+        """
+        Replaces the fire labels of all posts and relabels the hits already indexed.
+
+        Posts that are no longer in any fire's list go back to 'other'.
+
+        Args:
+            fire_posts (dict): {fire name: iterable of post IDs}.
+        """
+        fires_of = {}
+        for fire, post_ids in fire_posts.items():
+            for post_id in post_ids:
+                fires_of.setdefault(post_id, []).append(fire)
+        labels = [(post_id, fire_name(fires)) for post_id, fires in fires_of.items()]
+        with self._conn:
+            self._conn.execute("DELETE FROM post_fire")
+            self._conn.executemany("INSERT INTO post_fire (post_id, fire) VALUES (?, ?)", labels)
+            # A post has a single label, so relabelling cannot collide with another row
+            self._conn.execute("""
+                UPDATE domain_hits SET fire = COALESCE(
+                    (SELECT fire FROM post_fire WHERE post_fire.post_id = domain_hits.post_id), 'other')
+            """)
+        print(f"Labelled {len(labels)} posts.")
+
+    def _fires(self, post_ids):
+        fires = {}
+        unique = list(set(post_ids))
+        for i in range(0, len(unique), 900):  # Stay below SQLite's bound-parameter limit
+            part = unique[i:i + 900]
+            fires.update(self._conn.execute(
+                f"SELECT post_id, fire FROM post_fire WHERE post_id IN ({','.join('?' * len(part))})", part))
+        return fires
+
+    # --------------------------
+    # Updates
+    # --------------------------
+    def _indexed_comment_ids(self, comment_ids):
+        seen = set()
+        for i in range(0, len(comment_ids), 900):
+            part = comment_ids[i:i + 900]
+            seen.update(row[0] for row in self._conn.execute(
+                f"SELECT comment_id FROM indexed_comments WHERE comment_id IN ({','.join('?' * len(part))})", part))
+        return seen
+
+    def add_comments(self, comments: pd.DataFrame) -> int:
+        """
+        Indexes the domains linked in comments that are not indexed yet.
+
+        Args:
+            comments (pd.DataFrame): Columns comment_id, post_id, body and created_utc.
+
+        Returns:
+            int: Number of newly indexed comments.
+        """
+        comments = comments.dropna(subset=['comment_id'])
+        comments = comments.drop_duplicates(subset=['comment_id'])
+        seen = self._indexed_comment_ids(comments['comment_id'].tolist())
+        comments = comments[~comments['comment_id'].isin(seen)]
+        if comments.empty:
+            return 0
+
+        hours = pd.to_datetime(comments['created_utc'], format='ISO8601', errors='coerce').dt.floor('h')
+        hours = hours.dt.strftime('%Y-%m-%d %H:%M:%S')
+        fires = self._fires(comments['post_id'].tolist())
+
+        hits = Counter()
+        for post_id, body, hour in zip(comments['post_id'], comments['body'], hours):
+            if not isinstance(body, str) or pd.isna(hour):
+                continue
+            for url in extract_urls_from_text(body):
+                domain = self.resolver.resolve(url)
+                if domain is not None:
+                    hits[(domain, post_id, hour, fires.get(post_id, 'other'))] += 1
+
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO domain_hits (domain, post_id, hour, fire, count) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(domain, post_id, hour, fire) DO UPDATE SET count = count + excluded.count",
+                [(*key, count) for key, count in hits.items()])
+            self._conn.executemany("INSERT OR IGNORE INTO indexed_comments (comment_id) VALUES (?)",
+                                   [(comment_id,) for comment_id in comments['comment_id']])
+        return len(comments)
+
+    def update_from_file(self, path: str, chunksize: int = 50000) -> int:
+        """Indexes the new comments of a comments CSV or Parquet file, chunk by chunk."""
+        total = 0
+        for chunk in iter_comment_chunks(path, chunksize):
+            total += self.add_comments(chunk)
+        print(f"Indexed {total} new comments from {path}.")
+        return total
+
+    def update_from_journal(self, journal_path: str, chunksize: int = 50000) -> int:
+        """
+        Indexes the comments added to a crawl journal (collection/CrawlJournal.py) since the
+        last update, using the journal's rowid as watermark.
+        """
+        key = f"journal:{os.path.abspath(journal_path)}"
+        row = self._conn.execute("SELECT value FROM index_meta WHERE key = ?", (key,)).fetchone()
+        last_rowid = int(row[0]) if row else 0
+        journal = sqlite3.connect(journal_path)
+        total = 0
+        try:
+            while True:
+                rows = journal.execute(
+                    "SELECT rowid, comment_id, post_id, body, created_utc FROM comments "
+                    "WHERE rowid > ? ORDER BY rowid LIMIT ?", (last_rowid, chunksize)).fetchall()
+                if not rows:
+                    break
+                chunk = pd.DataFrame(rows, columns=['rowid', 'comment_id', 'post_id', 'body', 'created_utc'])
+                total += self.add_comments(chunk)
+                last_rowid = int(chunk['rowid'].iloc[-1])
+                with self._conn:
+                    self._conn.execute("INSERT OR REPLACE INTO index_meta (key, value) VALUES (?, ?)",
+                                       (key, str(last_rowid)))
+        finally:
+            journal.close()
+        print(f"Indexed {total} new comments from {journal_path}.")
+        return total
+
+    # --------------------------
+    # Queries
+    # --------------------------
+    @staticmethod
+    def _where(start=None, end=None, fire=None, domain=None):
+        conditions, params = [], []
+        if start is not None:
+            conditions.append("hour >= ?")
+            params.append(pd.Timestamp(start).floor('h').strftime('%Y-%m-%d %H:%M:%S'))
+        if end is not None:
+            conditions.append("hour < ?")
+            params.append(pd.Timestamp(end).strftime('%Y-%m-%d %H:%M:%S'))
+        if fire is not None:
+            conditions.append("fire = ?")
+            params.append(fire)
+        if domain is not None:
+            conditions.append("domain = ?")
+            params.append(domain)
+        return (" WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+    def top_domains(self, k: int = 10, start=None, end=None, fire: str = None) -> pd.DataFrame:
+        """
+        Returns the k most linked domains in [start, end) (hour buckets), optionally for one fire.
+
+        Returns:
+            pd.DataFrame: Columns domain, count (links) and posts (distinct posts linking it).
+        """
+        where, params = self._where(start, end, fire)
+        return pd.read_sql_query(
+            f"SELECT domain, SUM(count) AS count, COUNT(DISTINCT post_id) AS posts FROM domain_hits{where} "
+            "GROUP BY domain ORDER BY count DESC, domain LIMIT ?", self._conn, params=params + [k])
+
+    def domain_timeline(self, domain: str, fire: str = None, start=None, end=None) -> pd.DataFrame:
+        """Returns the hourly link counts of one domain."""
+        where, params = self._where(start, end, fire, domain)
+        return pd.read_sql_query(
+            f"SELECT hour, SUM(count) AS count FROM domain_hits{where} GROUP BY hour ORDER BY hour",
+            self._conn, params=params)
+
+    def summary(self) -> dict:
+        hits, domains = self._conn.execute("SELECT COALESCE(SUM(count), 0), COUNT(DISTINCT domain) FROM domain_hits").fetchone()
+        comments = self._conn.execute("SELECT COUNT(*) FROM indexed_comments").fetchone()[0]
+        return {'comments': comments, 'links': hits, 'domains': domains}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build, update and query the persistent comment domain index")
+    parser.add_argument("--index", default="domain_index.sqlite", help="Index file (default: domain_index.sqlite)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    update = subparsers.add_parser("update", help="Index new comments (the first run builds the index)")
+    update.add_argument("comments", nargs="*", help="Comments CSV or Parquet files")
+    update.add_argument("--journal", help="Crawl journal SQLite file to index new comments from")
+    update.add_argument("--fire-posts", nargs="+", default=[], metavar="FIRE=PATH",
+                        help="Final posts file of each fire, e.g. eaton=eaton_final_posts.csv. Replaces the labels "
+                             "of earlier updates, so give every fire")
+
+    top = subparsers.add_parser("top", help="Top-k domains in a time window")
+    top.add_argument("-k", type=int, default=10, help="Number of domains (default: 10)")
+    top.add_argument("--fire", help="Only this fire label (eaton, palisades, common, other)")
+    top.add_argument("--start", help="Window start, e.g. '2025-01-07 18:00'")
+    top.add_argument("--end", help="Window end (exclusive)")
+    top.add_argument("--hours", type=float, help="Window length from --start, instead of --end")
+
+    args = parser.parse_args()
+    index = DomainIndex(args.index)
+
+    if args.command == "update":
+        if args.fire_posts:
+            fire_posts = {}
+            for item in args.fire_posts:
+                fire, _, path = item.partition("=")
+                fire_posts[fire] = read_post_ids(path)
+            index.set_fire_posts(fire_posts)
+        for path in args.comments:
+            if not Path(path).is_file():
+                print(f"Error: {path} not found")
+                return 1
+            index.update_from_file(path)
+        if args.journal:
+            index.update_from_journal(args.journal)
+        print(index.summary())
+    else:
+        end = args.end
+        if args.hours is not None and args.start:
+            end = pd.Timestamp(args.start) + pd.Timedelta(hours=args.hours)
+        print(index.top_domains(args.k, args.start, end, args.fire).to_string(index=False))
+
+    index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,216 @@
+"""
+Persistent sentence-embedding store shared by ModelSelect, ModelFinetune and Temporospatial.
+
+BERTopic encodes every document again on each fit_transform() and transform() call. The
+grid search alone re-encoded the 77k long comments for each of its 64 configurations.
+EmbeddingStore encodes a corpus once, in batches, and keeps the result as a .npy file
+keyed by the embedding model name and a hash of the corpus content. Later calls
+memory-map the file instead of encoding, and the array is passed to BERTopic as
+`embeddings=`:
+
+    store = EmbeddingStore('embeddings')
+    embeddings = store.get(corpus, 'all-mpnet-base-v2', embedding_model)
+    topics, probs = topic_model.fit_transform(corpus, embeddings=embeddings)
+    topics, probs = transform(model_ft, corpus, store)  # ModelFinetune, Temporospatial
+
+Embeddings are computed exactly as BERTopic's SentenceTransformer backend does
+(encode() without normalization), so with the default float32 storage results do not
+change. float16 storage halves the disk and page-cache footprint but keeps only about
+three significant digits; it is converted back to float32 when loaded, and documents
+close to a cluster boundary may then be assigned differently.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+import numpy as np
+
+DEFAULT_MODEL = 'all-mpnet-base-v2'
+
+
+def corpus_hash(texts) -> str:
+    """SHA-256 of the documents, in order; each is length-prefixed so boundaries count."""
+    h = hashlib.sha256()
+    for text in texts:
+        data = str(text).encode('utf-8')
+        h.update(len(data).to_bytes(8, 'little'))
+        h.update(data)
+    return h.hexdigest()
+
+
+def _safe_name(model_name: str) -> str:
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', model_name)
+
+
+def embedding_model_name(embedding_model):
+    """
+    Store key of an embedding model: the name a SentenceTransformer (or the BERTopic
+    backend wrapping one) was loaded from, without the 'sentence-transformers/' prefix,
+    so 'all-mpnet-base-v2' and a loaded BERTopic model share entries. None if unknown.
+    """
+    name = embedding_model
+    if not isinstance(name, str):
+        # BERTopic's backend keeps the name it loaded; sentence-transformers >= 3 its model card
+        name = getattr(embedding_model, '_hf_model', None)
+        if name is None:
+            model = getattr(embedding_model, 'embedding_model', embedding_model)
+            name = getattr(getattr(model, 'model_card_data', None), 'base_model', None)
+    if not name:
+        return None
+    return name[len('sentence-transformers/'):] if name.startswith('sentence-transformers/') else name
+
+
+def load_embedding_model(model_name: str):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name)
+
+
+class EmbeddingStore:
+    """
+    Directory of embedding matrices keyed by (model name, corpus hash).
+
+    Each entry is a .npy file (one row per document, in corpus order) and a .json file with
+    its metadata.
+
+    Args:
+        root (str): Directory of the store (created if it does not exist).
+        dtype (str): Storage type of new entries, 'float32' or 'float16'.
+    """
+
+    def __init__(self, root: str = 'embeddings', dtype: str = 'float32'):
+        if dtype not in ('float32', 'float16'):
+            raise ValueError(f"Unsupported dtype {dtype!r}, expected 'float32' or 'float16'")
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.dtype = dtype
+        self._models = {}
+
+    def path(self, model_name: str, digest: str) -> Path:
+        return self.root / f"{_safe_name(model_name)}_{digest[:24]}.npy"
+
+    def _model(self, model_name: str, embedding_model):
+        if embedding_model is not None:
+            return embedding_model
+        if model_name not in self._models:
+            self._models[model_name] = load_embedding_model(model_name)
+        return self._models[model_name]
+
+    def get(self, texts, model_name: str = DEFAULT_MODEL, embedding_model=None, batch_size: int = 1024,
+            encode_batch_size: int = 32) -> np.ndarray:
+        """
+        Returns the embeddings of the documents, encoding them only if they are not stored yet.
+
+        Args:
+            texts (list): The documents, in order.
+            model_name (str): Name of the SentenceTransformer model, part of the key.
+            embedding_model: The loaded model; loaded from `model_name` if not given.
+            batch_size (int): Documents encoded and written per step.
+            encode_batch_size (int): Batch size passed to encode().
+
+        Returns:
+            np.ndarray: float32 array of shape (len(texts), dim); a read-only memory map when
+            stored as float32.
+        """
+        texts = [str(text) for text in texts]
+        digest = corpus_hash(texts)
+        path = self.path(model_name, digest)
+        if not path.exists():
+            self._encode(texts, model_name, digest, path, self._model(model_name, embedding_model),
+                         batch_size, encode_batch_size)
+        return self.load(path)
+
+    @staticmethod
+    def load(path) -> np.ndarray:
+        embeddings = np.load(path, mmap_mode='r')
+        if embeddings.dtype != np.float32:
+            embeddings = embeddings.astype(np.float32)
+        return embeddings
+
+    def _encode(self, texts, model_name, digest, path, embedding_model, batch_size, encode_batch_size):
+        start = time.perf_counter()
+        partial = path.with_suffix('.partial.npy')
+        out = None
+        for i in range(0, len(texts), batch_size):
+            batch = embedding_model.encode(texts[i:i + batch_size], batch_size=encode_batch_size,
+                                           show_progress_bar=False, convert_to_numpy=True)
+            if out is None:
+                out = np.lib.format.open_memmap(partial, mode='w+', dtype=self.dtype,
+                                                shape=(len(texts), batch.shape[1]))
+            out[i:i + len(batch)] = batch
+        if out is None:
+            raise ValueError("Cannot embed an empty corpus")
+        out.flush()
+        del out
+        os.replace(partial, path)
+
+        meta = {'model': model_name, 'corpus_hash': digest, 'documents': len(texts), 'dtype': self.dtype}
+        path.with_suffix('.json').write_text(json.dumps(meta, indent=2))
+        seconds = time.perf_counter() - start
+        print(f"Encoded {len(texts)} documents with {model_name} in {seconds:.1f}s "
+              f"({len(texts) / max(seconds, 1e-9):,.0f} docs/sec) -> {path}")
+
+    def entries(self) -> list:
+        """Metadata of every stored entry."""
+        return [json.loads(meta.read_text()) for meta in sorted(self.root.glob('*.json'))]
+
+
+def transform(topic_model, docs, store: EmbeddingStore, model_name: str = None, embedding_model=None):
+    """
+    topic_model.transform(docs) with the embeddings taken from the store.
+
+    The store key is the name of `embedding_model`, or else of the topic model's own
+    backend (see embedding_model_name()). Pass `model_name` when it cannot be told, e.g.
+    for a SentenceTransformer loaded from a local directory.
+    """
+    docs = list(docs)
+    if model_name is None:
+        model_name = embedding_model_name(embedding_model if embedding_model is not None
+                                          else getattr(topic_model, 'embedding_model', None))
+        if model_name is None:
+            raise ValueError("Cannot tell the name of the embedding model, pass model_name")
+    if embedding_model is None and getattr(topic_model, 'embedding_model', None) is not None:
+        embedding_model = backend_model(topic_model)
+    embeddings = store.get(docs, model_name, embedding_model)
+    return topic_model.transform(docs, embeddings=np.asarray(embeddings))
+
+
+def backend_model(topic_model):
+    """The SentenceTransformer inside a BERTopic embedding backend, if any."""
+    backend = topic_model.embedding_model
+    return getattr(backend, 'embedding_model', backend)
+
+
+def main():
+    from preprocess import add_min_length_argument, long_comments, read_comments
+
+    parser = argparse.ArgumentParser(description="Encode a corpus once into the persistent embedding store")
+    parser.add_argument("input", help="Comments CSV or Parquet file")
+    parser.add_argument("-c", "--column", default="corpus", help="Text column (default: corpus)")
+    add_min_length_argument(parser)
+    parser.add_argument("--store", default="embeddings", help="Store directory (default: embeddings)")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help=f"SentenceTransformer model (default: {DEFAULT_MODEL})")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"],
+                        help="Storage type (default: float32)")
+    parser.add_argument("--batch-size", type=int, default=1024, help="Documents per write (default: 1024)")
+    args = parser.parse_args()
+
+    input_path = Path(args.input)
+    if not input_path.is_file():
+        print(f"Error: {input_path} not found")
+        return 1
+    df = long_comments(read_comments(input_path), args.min_length)
+
+    store = EmbeddingStore(args.store, args.dtype)
+    embeddings = store.get(df[args.column].to_list(), args.model, batch_size=args.batch_size)
+    print(f"Embeddings: {embeddings.shape[0]} x {embeddings.shape[1]} ({embeddings.dtype})")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -2,14 +2,26 @@
 Script to hash-protect sensitive ID columns in CSV files.
 Uses HMAC-SHA256 with a user-specified password for consistent, deterministic hashing.
 Same input + same password = same hash output (allows joining on IDs).
+
+Each distinct value is hashed only once (IDs repeat heavily), large files can be
+streamed in chunks, and files or chunks are hashed in a process pool. The output is
+identical to hashing every cell with hash_value().
 """
 
 import pandas as pd
+import numpy as np
 import hmac
 import hashlib
 import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+KEY_SENTINEL = "hash_ids mapping key"
+KEY_LINE = "# key: "
+
 
 def hash_value(value, password: str) -> str:
     """
@@ -30,29 +42,252 @@ def hash_value(value, password: str) -> str:
     return hash_bytes[:16]
 
 
-def hash_columns(df: pd.DataFrame, columns: list, password: str) -> pd.DataFrame:
+class HmacHasher:
+    """
+    Memoized version of hash_value() for one password.
+
+    The keyed HMAC state is computed once and copied for every value, and every distinct
+    value is hashed only once. `mapping` (value -> hash) can seed the memo, e.g. with the
+    hashes of earlier files; values hashed for the first time are collected in `new`.
+    """
+
+    def __init__(self, password: str, mapping: dict = None):
+        self._base = hmac.new(password.encode('utf-8'), digestmod=hashlib.sha256)
+        self.memo = dict(mapping) if mapping else {}
+        self.new = {}
+
+    def _digest(self, value_str: str) -> str:
+        h = self._base.copy()
+        h.update(value_str.encode('utf-8'))
+        return h.hexdigest()[:16]
+
+    def fingerprint(self) -> str:
+        """Hash of a fixed sentinel: tells mappings of different passwords apart."""
+        return self._digest(KEY_SENTINEL)
+
+    def hash_str(self, value_str: str) -> str:
+        digest = self.memo.get(value_str)
+        if digest is None:
+            digest = self._digest(value_str)
+            self.memo[value_str] = digest
+            self.new[value_str] = digest
+        return digest
+
+    def hash_series(self, series: pd.Series) -> pd.Series:
+        """Hash a column; missing values stay missing."""
+        present = series.notna().to_numpy()
+        values = series[present]
+        if not len(values):
+            return series
+        if not pd.api.types.is_string_dtype(values):
+            values = values.map(str)  # Same text as str(value) in hash_value()
+        codes, uniques = pd.factorize(values)
+        hashes = np.array([self.hash_str(value) for value in uniques], dtype=object)
+        result = series.astype(object)
+        result[present] = hashes[codes]
+        return result
+
+
+def hash_columns(df: pd.DataFrame, columns: list, password: str, hasher: HmacHasher = None) -> pd.DataFrame:
     """Hash specified columns in a DataFrame."""
+    hasher = hasher or HmacHasher(password)
     df = df.copy()
     for col in columns:
         if col in df.columns:
-            df[col] = df[col].apply(lambda x: hash_value(x, password))
+            df[col] = hasher.hash_series(df[col])
         else:
             print(f"Warning: Column '{col}' not found in DataFrame")
     return df
 
 
-def process_file(input_path: str, output_path: str, columns: list, password: str):
+def report(label: str, rows: int, seconds: float):
+    print(f"  {label}: {rows} rows in {seconds:.1f}s ({rows / max(seconds, 1e-9):,.0f} rows/sec)")
+
+
+def process_file(input_path: str, output_path: str, columns: list, password: str, hasher: HmacHasher = None):
     """Read CSV, hash specified columns, and save to output."""
     print(f"Processing: {input_path}")
+    start = time.perf_counter()
     df = pd.read_csv(input_path)
 
     # Show which columns will be hashed
     existing_cols = [c for c in columns if c in df.columns]
     print(f"  Hashing columns: {existing_cols}")
 
-    df_hashed = hash_columns(df, columns, password)
+    df_hashed = hash_columns(df, columns, password, hasher)
     df_hashed.to_csv(output_path, index=False)
     print(f"  Saved to: {output_path}")
+    report(Path(input_path).name, len(df), time.perf_counter() - start)
+    return len(df)
+
+
+# --------------------------
+# Chunked streaming
+# --------------------------
+def merged_dtypes(input_path: str, chunksize: int) -> dict:
+    """
+    Scan a CSV in chunks and return the column types pandas would infer for the whole file.
+
+    Reading every chunk with these types makes chunked output identical to reading the
+    file at once (e.g. an integer column with gaps is float in every chunk).
+    """
+    seen = {}
+    for chunk in pd.read_csv(input_path, chunksize=chunksize):
+        for col, dtype in chunk.dtypes.items():
+            seen.setdefault(col, set()).add(str(dtype))
+    dtypes = {}
+    for col, kinds in seen.items():
+        if len(kinds) == 1:
+            kind = kinds.pop()
+            dtypes[col] = object if kind in ('object', 'str') else kind
+        elif kinds <= {'int64', 'float64'}:
+            dtypes[col] = 'float64'
+        else:
+            dtypes[col] = object
+    return dtypes
+
+
+def iter_chunks(input_path: str, chunksize: int):
+    dtypes = merged_dtypes(input_path, chunksize)
+    yield from pd.read_csv(input_path, chunksize=chunksize, dtype=dtypes)
+
+
+def hash_chunk(chunk: pd.DataFrame, columns: list, password: str, hasher: HmacHasher, header: bool) -> str:
+    """Hash one chunk and return it as CSV text."""
+    hashed = hash_columns(chunk, [c for c in columns if c in chunk.columns], password, hasher)
+    return hashed.to_csv(index=False, header=header)
+
+
+def process_file_chunked(input_path: str, output_path: str, columns: list, password: str, chunksize: int,
+                         hasher: HmacHasher = None, executor: ProcessPoolExecutor = None, workers: int = 1):
+    """Stream a CSV in chunks, hash them (in parallel if an executor is given) and write them in order."""
+    print(f"Processing: {input_path} (chunks of {chunksize} rows)")
+    start = time.perf_counter()
+    print(f"  Hashing columns: {[c for c in columns if c in pd.read_csv(input_path, nrows=0).columns]}")
+    rows = 0
+    pending = deque()
+    with open(output_path, 'w', newline='', encoding='utf-8') as f:
+        for i, chunk in enumerate(iter_chunks(input_path, chunksize)):
+            rows += len(chunk)
+            if executor is None:
+                f.write(hash_chunk(chunk, columns, password, hasher, header=i == 0))
+                continue
+            pending.append(executor.submit(_hash_chunk_worker, chunk, columns, i == 0))
+            # Keep a bounded number of chunks in flight
+            while len(pending) > 2 * workers:
+                f.write(_collect(pending.popleft().result(), hasher))
+        while pending:
+            f.write(_collect(pending.popleft().result(), hasher))
+    print(f"  Saved to: {output_path}")
+    report(Path(input_path).name, rows, time.perf_counter() - start)
+    return rows
+
+
+# --------------------------
+# Process pool workers
+# --------------------------
+_worker = {}
+
+
+def _init_worker(password: str, mapping: dict):
+    _worker['password'] = password
+    _worker['hasher'] = HmacHasher(password, mapping)
+
+
+def _take_new(hasher: HmacHasher) -> dict:
+    new, hasher.new = hasher.new, {}
+    return new
+
+
+def _collect(result, hasher: HmacHasher):
+    text, new = result
+    if hasher is not None:
+        hasher.memo.update(new)
+    return text
+
+
+def _hash_chunk_worker(chunk, columns, header):
+    hasher = _worker['hasher']
+    return hash_chunk(chunk, columns, _worker['password'], hasher, header), _take_new(hasher)
+
+
+def _process_file_worker(input_path, output_path, columns):
+    hasher = _worker['hasher']
+    rows = process_file(input_path, output_path, columns, _worker['password'], hasher)
+    return rows, _take_new(hasher)
+
+
+# --------------------------
+# Shared value -> hash mapping
+# --------------------------
+def load_mapping(path: str, hasher: HmacHasher) -> dict:
+    """
+    Read a value -> hash mapping written by save_mapping().
+
+    Its first line holds the fingerprint of the password it was written with; a mapping of
+    another password raises ValueError instead of leaking its hashes into the output.
+    Mappings without that line are checked by rehashing their first value.
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        first = f.readline().rstrip('\n')
+    key = first[len(KEY_LINE):] if first.startswith(KEY_LINE) else None
+    df = pd.read_csv(path, dtype=str, keep_default_na=False, skiprows=1 if key is not None else 0)
+    mapping = dict(zip(df['value'], df['hash']))
+    if key is not None:
+        matches = key == hasher.fingerprint()
+    else:
+        matches = not mapping or hasher._digest(df['value'].iat[0]) == df['hash'].iat[0]
+    if not matches:
+        raise ValueError(f"{path} was written with a different password; use another --mapping file")
+    return mapping
+
+
+def save_mapping(mapping: dict, path: str, hasher: HmacHasher):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        f.write(f"{KEY_LINE}{hasher.fingerprint()}\n")
+        pd.DataFrame({'value': list(mapping.keys()), 'hash': list(mapping.values())}).to_csv(f, index=False)
+    print(f"Saved {len(mapping)} value -> hash pairs to {path}")
+
+
+def run(jobs: list, columns: list, password: str, workers: int = 1, chunksize: int = None, mapping_path: str = None):
+    """
+    Hash a list of (input_path, output_path) jobs.
+
+    Whole files are hashed in parallel across files; with a chunk size, each file is
+    streamed and its chunks are hashed in parallel. All files share one value -> hash
+    memo, which is loaded from and saved to `mapping_path` if given. A mapping written
+    with another password raises ValueError.
+    """
+    start = time.perf_counter()
+    hasher = HmacHasher(password)
+    hasher.memo.update(load_mapping(mapping_path, hasher))
+    total = 0
+    if workers <= 1:
+        for input_path, output_path in jobs:
+            if chunksize:
+                total += process_file_chunked(input_path, output_path, columns, password, chunksize, hasher)
+            else:
+                total += process_file(input_path, output_path, columns, password, hasher)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(password, hasher.memo)) as executor:
+            if chunksize:
+                for input_path, output_path in jobs:
+                    total += process_file_chunked(input_path, output_path, columns, password, chunksize,
+                                                  hasher, executor, workers)
+            else:
+                futures = [executor.submit(_process_file_worker, input_path, output_path, columns)
+                           for input_path, output_path in jobs]
+                for future in futures:
+                    rows, new = future.result()
+                    hasher.memo.update(new)
+                    total += rows
+    report("Total", total, time.perf_counter() - start)
+    if mapping_path:
+        save_mapping(hasher.memo, mapping_path, hasher)
+    return total
 
 
 def main():
@@ -68,6 +303,14 @@ def main():
         default=["post_id", "author_id", "comment_id", "author"],
         help="Columns to hash (default: post_id author_id comment_id author)"
     )
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="Worker processes, across files or across chunks (default: 1)")
+    parser.add_argument("--chunksize", type=int, default=None,
+                        help="Stream files in chunks of this many rows (default: read whole files)")
+    parser.add_argument("--mapping",
+                        help="CSV of value -> hash pairs shared across files and runs; it is created or "
+                             "extended. It only works with the password it was written with. Keep it private: it "
+                             "links hashes back to the original IDs")
 
     args = parser.parse_args()
     input_path = Path(args.input)
@@ -78,20 +321,25 @@ def main():
             output_path = args.output
         else:
             output_path = input_path.parent / f"{input_path.stem}_hashed{input_path.suffix}"
-        process_file(str(input_path), str(output_path), args.columns, args.password)
+        jobs = [(str(input_path), str(output_path))]
 
     elif input_path.is_dir():
         # Directory - process all CSVs
         output_dir = Path(args.output) if args.output else input_path / "hashed"
         output_dir.mkdir(exist_ok=True)
 
-        for csv_file in input_path.glob("*.csv"):
-            output_path = output_dir / f"{csv_file.stem}_hashed.csv"
-            process_file(str(csv_file), str(output_path), args.columns, args.password)
+        jobs = [(str(csv_file), str(output_dir / f"{csv_file.stem}_hashed.csv"))
+                for csv_file in input_path.glob("*.csv")]
     else:
         print(f"Error: {input_path} not found")
         return 1
 
+    try:
+        run(jobs, args.columns, args.password, args.workers, args.chunksize, args.mapping)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+
     print("\nDone!")
     return 0
 
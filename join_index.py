@@ -0,0 +1,229 @@
+"""
+Indexed post -> fire and topic -> label joins for the comment analyses.
+
+ModelFinetune and Temporospatial label every comment's fire with get_fire_name(), which
+tests `post_id in eaton_posts` against Python lists once per comment (comments x posts),
+and attach topic labels with a pd.merge whose result, comments_join_multiple_label.csv,
+is written and re-read as untyped CSV. JoinIndex builds both maps once:
+
+- post -> fire as a categorical Series indexed by post_id ('eaton', 'palisades',
+  'common' if the post is in several fires' final posts, 'other' otherwise), as
+  domain_index.fire_name() labels posts;
+- topic -> labels as the labelled topic table indexed by Topic, with the label columns
+  stored as categoricals.
+
+attach() adds both to any comment frame by hash-index lookups (Index.get_indexer), with
+the same rows and columns as the notebooks' merge (inner join on topic_id = Topic), and
+save_joined() writes the result as Parquet so downstream notebooks read it typed.
+The saved index records a hash of the files it was built from, and load_or_build()
+rebuilds it when they change. ModelFinetune builds and saves the index once, and
+Temporospatial loads it:
+
+    index = JoinIndex.load_or_build(dataset_path)  # datasets/reddit/join_index
+    long_comments['topic_id'] = model_ft.topics_
+    join_comments = index.attach(long_comments)
+    index.attach_fire(long_comments)
+    save_joined(join_comments, 'datasets/reddit/comments_join_multiple_label.parquet')
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from domain_index import fire_name, read_post_ids
+
+INDEX_DIR = 'reddit/join_index'
+FIRE_POSTS_FILES = {'eaton': 'reddit/eaton_final_posts.csv', 'palisades': 'reddit/palisades_final_posts.csv'}
+TOPIC_LABELS_FILE = 'reddit/all_final_comments_multiple_label.csv'
+FIRE_CATEGORIES_EXTRA = ['common', 'other']
+
+
+def source_hash(dataset_path: str, fire_files: dict = None, labels_file: str = TOPIC_LABELS_FILE) -> str:
+    """Hash of the contents of the dataset files an index is built from."""
+    fire_files = fire_files or FIRE_POSTS_FILES
+    h = hashlib.sha256()
+    for path in [*fire_files.values(), labels_file]:
+        h.update(path.encode('utf-8'))
+        with open(os.path.join(dataset_path, path), 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    return h.hexdigest()
+
+
+class JoinIndex:
+    """
+    Post -> fire and topic -> label maps.
+
+    Args:
+        post_fire (pd.Series): Categorical fire label indexed by post_id (str).
+        topic_labels (pd.DataFrame): Labelled topic table indexed by Topic (int).
+        sources (str): source_hash() of the files the maps were built from, if known.
+    """
+
+    def __init__(self, post_fire: pd.Series, topic_labels: pd.DataFrame, sources: str = None):
+        self.post_fire = post_fire
+        self.topic_labels = topic_labels
+        self.sources = sources
+
+    @staticmethod
+    def build_post_fire(fire_posts: dict) -> pd.Series:
+        """
+        Args:
+            fire_posts (dict): {fire name: iterable of post IDs}, in the label order of the
+                notebooks, e.g. {'eaton': ..., 'palisades': ...}.
+        """
+        fires_of = {}
+        for fire, post_ids in fire_posts.items():
+            for post_id in dict.fromkeys(str(post_id) for post_id in post_ids):
+                fires_of.setdefault(post_id, []).append(fire)
+        categories = list(fire_posts) + FIRE_CATEGORIES_EXTRA
+        return pd.Series(pd.Categorical([fire_name(fires) for fires in fires_of.values()], categories=categories),
+                         index=pd.Index(list(fires_of), name='post_id'), name='fire_name')
+
+    @staticmethod
+    def build_topic_labels(labels: pd.DataFrame) -> pd.DataFrame:
+        """
+        The labelled topic table indexed by Topic, text columns as categoricals.
+
+        Raises:
+            ValueError: If a Topic has several rows; the merge would repeat its comments.
+        """
+        duplicated = labels['Topic'][labels['Topic'].duplicated()].unique()
+        if len(duplicated):
+            raise ValueError(f"Topics with several label rows: {sorted(duplicated.tolist())}")
+        labels = labels.set_index('Topic')
+        labels.index = labels.index.astype(np.int64)
+        for column in labels.columns:
+            if labels[column].dtype == object or pd.api.types.is_string_dtype(labels[column]):
+                labels[column] = labels[column].astype('category')
+        return labels
+
+    @classmethod
+    def from_dataset(cls, dataset_path: str, fire_files: dict = None, labels_file: str = TOPIC_LABELS_FILE):
+        """Builds the maps from the Hugging Face dataset layout (datasets/reddit/...)."""
+        fire_files = fire_files or FIRE_POSTS_FILES
+        fire_posts = {fire: read_post_ids(os.path.join(dataset_path, path)) for fire, path in fire_files.items()}
+        labels = pd.read_csv(os.path.join(dataset_path, labels_file))
+        return cls(cls.build_post_fire(fire_posts), cls.build_topic_labels(labels),
+                   source_hash(dataset_path, fire_files, labels_file))
+
+    @classmethod
+    def load_or_build(cls, dataset_path: str, path: str = None):
+        """
+        The index saved under `path` (default: <dataset>/reddit/join_index), built from the
+        dataset and saved there if it does not exist yet or the dataset files changed.
+        """
+        path = path or os.path.join(dataset_path, INDEX_DIR)
+        if (Path(path) / 'post_fire.parquet').exists():
+            index = cls.load(path)
+            if index.sources == source_hash(dataset_path):
+                return index
+            print(f"The dataset changed since {path} was built, rebuilding it")
+        index = cls.from_dataset(dataset_path)
+        index.save(path)
+        return index
+
+    def save(self, path: str):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        self.post_fire.to_frame().to_parquet(path / 'post_fire.parquet')
+        self.topic_labels.to_parquet(path / 'topic_labels.parquet')
+        (path / 'meta.json').write_text(json.dumps({'sources': self.sources}))
+
+    @classmethod
+    def load(cls, path: str):
+        path = Path(path)
+        post_fire = pd.read_parquet(path / 'post_fire.parquet')['fire_name']
+        meta = json.loads((path / 'meta.json').read_text()) if (path / 'meta.json').exists() else {}
+        return cls(post_fire, pd.read_parquet(path / 'topic_labels.parquet'), meta.get('sources'))
+
+    # --------------------------
+    # Lookups
+    # --------------------------
+    def fire_names(self, post_ids, labels: dict = None) -> pd.Categorical:
+        """
+        Fire label of every post ID ('other' for unknown posts).
+
+        Args:
+            labels (dict): Renames labels, e.g. {'eaton': 'Eaton', 'palisades': 'Palisades'}
+                as in Temporospatial.
+        """
+        positions = self.post_fire.index.get_indexer(pd.Index(post_ids).astype(str))
+        categories = self.post_fire.cat.categories
+        codes = np.where(positions >= 0, self.post_fire.cat.codes.to_numpy()[positions],
+                         categories.get_loc('other')).astype(np.int8)
+        fires = pd.Categorical.from_codes(codes, categories=categories)
+        return fires.rename_categories(labels) if labels else fires
+
+    def attach_fire(self, comments: pd.DataFrame, column: str = 'fire_name', labels: dict = None) -> pd.DataFrame:
+        """Adds the fire label of each comment's post, in place, as get_fire_name() did."""
+        comments[column] = self.fire_names(comments['post_id'], labels)
+        return comments
+
+    def attach(self, comments: pd.DataFrame, topic_column: str = 'topic_id', fire: bool = False) -> pd.DataFrame:
+        """
+        Comments joined with the labels of their topic: the rows and columns of
+        pd.merge(comments, labels, left_on=topic_column, right_on='Topic', how='inner').
+
+        Args:
+            fire (bool): Also add the `fire_name` column.
+        """
+        positions = self.topic_labels.index.get_indexer(comments[topic_column].to_numpy())
+        keep = positions >= 0
+        joined = comments.iloc[np.nonzero(keep)[0]].reset_index(drop=True)
+        labels = self.topic_labels.iloc[positions[keep]].reset_index()
+        labels.index = joined.index
+        overlap = joined.columns.intersection(labels.columns)
+        joined = pd.concat([joined.rename(columns={c: f"{c}_x" for c in overlap}),
+                            labels.rename(columns={c: f"{c}_y" for c in overlap})], axis=1)
+        if fire:
+            self.attach_fire(joined)
+        return joined
+
+
+def save_joined(joined: pd.DataFrame, path: str):
+    """Writes a joined frame as Parquet (typed) or, for a .csv path, as the notebooks' CSV."""
+    if str(path).endswith('.csv'):
+        joined.to_csv(path, index=False)
+    else:
+        joined.to_parquet(path, index=False)
+
+
+def main():
+    from preprocess import add_min_length_argument, long_comments, read_comments
+
+    parser = argparse.ArgumentParser(description="Build the post -> fire and topic -> label index and join comments")
+    parser.add_argument("dataset", help="Dataset directory (the snapshot of Dragmoon/2025CalifoniaWildfire)")
+    parser.add_argument("-o", "--index", default=None, help="Index directory (default: <dataset>/reddit/join_index)")
+    parser.add_argument("--comments", help="Comments file with a topic_id column to join")
+    parser.add_argument("--topics", help=".npy of topic IDs (model_ft.topics_) for the comments with "
+                                         "corpus_length >= --min-length, instead of a topic_id column")
+    add_min_length_argument(parser)
+    parser.add_argument("--output", help="Joined output, .parquet or .csv "
+                                         "(default: <dataset>/reddit/comments_join_multiple_label.parquet)")
+    args = parser.parse_args()
+
+    index = JoinIndex.from_dataset(args.dataset)
+    index_path = args.index or os.path.join(args.dataset, INDEX_DIR)
+    index.save(index_path)
+    print(f"Indexed {len(index.post_fire)} posts and {len(index.topic_labels)} topics -> {index_path}")
+    print(index.post_fire.value_counts().to_string())
+
+    if args.comments:
+        comments = long_comments(read_comments(args.comments), args.min_length)
+        if args.topics:
+            comments = comments.assign(topic_id=np.load(args.topics))
+        joined = index.attach(index.attach_fire(comments.copy()))
+        output = args.output or os.path.join(args.dataset, 'reddit', 'comments_join_multiple_label.parquet')
+        save_joined(joined, output)
+        print(f"Joined {len(joined)} of {len(comments)} comments -> {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
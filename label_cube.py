@@ -0,0 +1,227 @@
+"""
+Pre-aggregated hour x fire x label cube for the Temporospatial figures.
+
+Temporospatial builds every figure from the raw post and comment rows: it parses `Date`
+again, floors it to the day, classifies `time_of_day` with a per-row apply, splits and
+explodes `Crisis Narrative` and runs a new groupby, and the cutoff variants repeat all
+of it. LabelCube aggregates the rows once, in one vectorized pass, into counts per
+
+    hour x fire x Situational Awareness x Crisis Narrative
+
+with the number of rows and of Grief and Mental rows in each cell. The label dimensions
+keep the label sets as stored (e.g. 'Rumor,Support'), so single-label counts are derived
+from the few distinct sets. Every Temporospatial aggregate (daily counts, Grief/Mental
+percentages per day or time of day, the Crisis Narrative stacks, their cutoff variants)
+is a sum over the cube:
+
+    cube = LabelCube.build(join_comments, posts_df, join_index)
+    cube.save('datasets/reddit/label_cube.parquet')
+    summary_by_time = cube.emotion_summary('time_of_day')
+    stack_cut = cube.label_counts('Day', end='2025-01-16')
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from join_index import JoinIndex
+
+SA_COLUMN = 'Situational Awareness'
+CN_COLUMN = 'Crisis Narrative'
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+TIME_OF_DAY = ['Morning', 'Afternoon', 'Evening', 'Night']
+DIMENSIONS = ['hour', 'fire', SA_COLUMN, CN_COLUMN]
+MEASURES = ['count', 'grief', 'mental']
+
+
+def time_of_day(hours) -> pd.Categorical:
+    """Temporospatial's classify_time_of_day() for an array of hours of the day."""
+    hours = np.asarray(hours)
+    # Night 0-5, Morning 6-11, Afternoon 12-17, Evening 18-20, Night 21-23
+    codes = np.select([hours < 6, hours < 12, hours < 18, hours < 21], [3, 0, 1, 2], 3)
+    return pd.Categorical.from_codes(codes, categories=TIME_OF_DAY, ordered=True)
+
+
+def split_labels(label_set) -> list:
+    """Labels of a stored label set, as the notebooks split them: str(), split(','), strip()."""
+    return [label.strip() for label in str(label_set).split(',') if label.strip()]
+
+
+def checked(values) -> np.ndarray:
+    """Grief/Mental flags: 'checked' in the label exports, booleans once converted."""
+    values = pd.Series(values)
+    if pd.api.types.is_bool_dtype(values):
+        return values.to_numpy()
+    return (values.astype(object) == 'checked').to_numpy()
+
+
+class LabelCube:
+    """
+    Row, Grief and Mental counts per (hour, fire, SA label set, CN label set).
+
+    Args:
+        cells (pd.DataFrame): One row per non-empty cell, DIMENSIONS + MEASURES columns.
+    """
+
+    def __init__(self, cells: pd.DataFrame):
+        self.cells = cells
+
+    @staticmethod
+    def aggregate(frame: pd.DataFrame, date_column: str, fires=None) -> pd.DataFrame:
+        """Cube cells of one frame of labelled rows (posts or comments)."""
+        hours = pd.to_datetime(frame[date_column], format=DATE_FORMAT).dt.floor('h')
+        rows = pd.DataFrame({
+            'hour': hours.to_numpy(),
+            'fire': pd.Categorical(fires if fires is not None else np.full(len(frame), 'other')),
+            SA_COLUMN: frame[SA_COLUMN].astype(object).to_numpy(),
+            CN_COLUMN: frame[CN_COLUMN].astype(object).to_numpy(),
+            'count': 1,
+            'grief': checked(frame['Grief']).astype(np.int64),
+            'mental': checked(frame['Mental']).astype(np.int64),
+        })
+        return rows.groupby(DIMENSIONS, dropna=False, observed=True, sort=False)[MEASURES].sum().reset_index()
+
+    @classmethod
+    def from_cells(cls, parts) -> 'LabelCube':
+        """Sums cells of several parts (e.g. posts, comments, a new crawl) into one cube."""
+        cells = pd.concat(parts, ignore_index=True)
+        cells['fire'] = cells['fire'].astype(str)
+        cells = cells.groupby(DIMENSIONS, dropna=False, sort=True)[MEASURES].sum().reset_index()
+        for column in ['fire', SA_COLUMN, CN_COLUMN]:
+            cells[column] = cells[column].astype('category')
+        return cls(cells)
+
+    @classmethod
+    def build(cls, comments: pd.DataFrame = None, posts: pd.DataFrame = None, join_index=None,
+              comment_date: str = 'created_utc', post_date: str = 'Date') -> 'LabelCube':
+        """
+        Aggregates the labelled comments (comments_join_multiple_label) and posts
+        (all_final_posts_multiple_label). With a JoinIndex, rows get their post's fire.
+        """
+        parts = []
+        for frame, date_column in [(comments, comment_date), (posts, post_date)]:
+            if frame is None:
+                continue
+            fires = None
+            if join_index is not None and 'post_id' in frame.columns:
+                fires = join_index.fire_names(frame['post_id'])
+            parts.append(cls.aggregate(frame, date_column, fires))
+        return cls.from_cells(parts)
+
+    def add(self, frame: pd.DataFrame, date_column: str, fires=None) -> 'LabelCube':
+        """A cube with the rows of `frame` added; only the new rows are aggregated."""
+        return LabelCube.from_cells([self.cells, self.aggregate(frame, date_column, fires)])
+
+    def save(self, path: str):
+        self.cells.to_parquet(path, index=False)
+
+    @classmethod
+    def load(cls, path: str) -> 'LabelCube':
+        return cls(pd.read_parquet(path))
+
+    # --------------------------
+    # Rollups
+    # --------------------------
+    def select(self, start=None, end=None, fires=None, require_cn: bool = True) -> pd.DataFrame:
+        """
+        Cells in [start, end), of the given fires. `require_cn` drops rows without a Crisis
+        Narrative label, as Temporospatial does before every figure. `start` and `end` must
+        fall on hour boundaries, the cube's resolution.
+        """
+        cells = self.cells
+        mask = np.ones(len(cells), dtype=bool)
+        for bound in (start, end):
+            if bound is not None and pd.Timestamp(bound) != pd.Timestamp(bound).floor('h'):
+                raise ValueError(f"{bound} is not on an hour boundary")
+        if start is not None:
+            mask &= (cells['hour'] >= pd.Timestamp(start)).to_numpy()
+        if end is not None:
+            mask &= (cells['hour'] < pd.Timestamp(end)).to_numpy()
+        if fires is not None:
+            mask &= cells['fire'].isin([fires] if isinstance(fires, str) else fires).to_numpy()
+        if require_cn:
+            mask &= cells[CN_COLUMN].notna().to_numpy()
+        return cells[mask]
+
+    @staticmethod
+    def _keys(cells: pd.DataFrame, by) -> pd.DataFrame:
+        """Grouping columns: 'Day', 'time_of_day', 'hour' or any cube dimension."""
+        keys = pd.DataFrame(index=cells.index)
+        for key in [by] if isinstance(by, str) else by:
+            if key == 'Day':
+                keys[key] = cells['hour'].dt.floor('D')
+            elif key == 'time_of_day':
+                keys[key] = time_of_day(cells['hour'].dt.hour)
+            else:
+                keys[key] = cells[key]
+        return keys
+
+    def rollup(self, by, **select) -> pd.DataFrame:
+        """Summed measures grouped by `by` (see _keys()), over the cells select() keeps."""
+        cells = self.select(**select)
+        keys = self._keys(cells, by)
+        grouped = cells[MEASURES].groupby([keys[column] for column in keys.columns], observed=True, sort=True).sum()
+        return grouped.reset_index()
+
+    def counts(self, by='Day', **select) -> pd.DataFrame:
+        """Row counts, e.g. Temporospatial's daily_counts (column `Count`)."""
+        totals = self.rollup(by, **select)
+        return totals.drop(columns=MEASURES).assign(Count=totals['count'])
+
+    def emotion_summary(self, by='Day', **select) -> pd.DataFrame:
+        """Total_Posts, Grief_Percent and Mental_Percent per group, as Temporospatial's summary_df."""
+        totals = self.rollup(by, **select)
+        return pd.DataFrame({
+            **{column: totals[column] for column in totals.columns if column not in MEASURES},
+            'Total_Posts': totals['count'],
+            'Grief_Percent': totals['grief'] / totals['count'] * 100,
+            'Mental_Percent': totals['mental'] / totals['count'] * 100,
+        })
+
+    def label_counts(self, by='time_of_day', label_column: str = CN_COLUMN, **select) -> pd.DataFrame:
+        """
+        Counts per group and single label, each row counted once per label in its set: the
+        notebooks' split, explode and groupby (the Crisis Narrative stacks).
+        """
+        group_by = [by] if isinstance(by, str) else list(by)
+        totals = self.rollup(group_by + [label_column], **select)
+        sets = totals[label_column].astype(object)
+        memberships = {label_set: split_labels(label_set) for label_set in pd.unique(sets)}
+        repeats = np.array([len(memberships[label_set]) for label_set in sets])
+        exploded = totals.loc[totals.index.repeat(repeats), group_by + ['count']].reset_index(drop=True)
+        exploded[label_column] = [label for label_set in sets for label in memberships[label_set]]
+        return (exploded.groupby(group_by + [label_column], observed=True, sort=True)['count'].sum()
+                .reset_index())
+
+
+def main():
+    from preprocess import read_comments
+
+    parser = argparse.ArgumentParser(description="Build the hour x fire x label cube of the Temporospatial analyses")
+    parser.add_argument("dataset", help="Dataset directory (the snapshot of Dragmoon/2025CalifoniaWildfire)")
+    parser.add_argument("--comments", help="Joined comments (default: <dataset>/reddit/comments_join_multiple_label.csv)")
+    parser.add_argument("--posts", help="Labelled posts (default: <dataset>/reddit/all_final_posts_multiple_label.csv)")
+    parser.add_argument("--join-index", help="JoinIndex directory, to split the cube by fire")
+    parser.add_argument("-o", "--output", help="Cube file (default: <dataset>/reddit/label_cube.parquet)")
+    args = parser.parse_args()
+
+    reddit = Path(args.dataset) / 'reddit'
+    comments_path = Path(args.comments or reddit / 'comments_join_multiple_label.csv')
+    posts_path = Path(args.posts or reddit / 'all_final_posts_multiple_label.csv')
+    for path in (comments_path, posts_path):
+        if not path.is_file():
+            print(f"Error: {path} not found")
+            return 1
+
+    join_index = JoinIndex.load(args.join_index) if args.join_index else None
+    cube = LabelCube.build(read_comments(comments_path), read_comments(posts_path), join_index)
+    output = args.output or reddit / 'label_cube.parquet'
+    cube.save(output)
+    print(f"{len(cube.cells)} cells for {int(cube.cells['count'].sum())} rows -> {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,192 @@
+"""
+Bitmask encoding of the multi-label Situational Awareness and Crisis Narrative columns.
+
+generate_upset_plot() in Upsetplot and the Temporospatial stacked charts split the label
+strings into Python lists, build a boolean MultiIndex with upsetplot.from_memberships()
+and group over all of its levels. LabelSets encodes every document's label set as one
+integer, bit i standing for vocabulary[i]: each distinct label string is parsed once and
+the column becomes a NumPy array. Combination counts, per-label counts, intersection
+queries and threshold filters are then array operations (np.unique, np.bincount, bitwise
+ands), weighted by e.g. the `Count` column of the labelled topic table:
+
+    sa = LabelSets.from_strings(pd.concat([posts_df[SA], comments_df[SA]]))
+    weights = np.concatenate([np.ones(len(posts_df)), comments_df['Count']])
+    data = sa.upset_series(weights, threshold=24)  # what generate_upset_plot() plots
+    UpSet(data, show_counts=True).plot()
+
+The vocabulary is sorted, as from_memberships() orders its levels, so upset_series()
+gives the same index as the notebook.
+"""
+
+import numpy as np
+import pandas as pd
+
+MASK_TYPES = [(8, np.uint8), (16, np.uint16), (32, np.uint32), (64, np.uint64)]
+
+
+def mask_dtype(n_labels: int):
+    for bits, dtype in MASK_TYPES:
+        if n_labels <= bits:
+            return dtype
+    raise ValueError(f"{n_labels} labels do not fit in a 64-bit mask")
+
+
+def parse_labels(value, strip: bool = False) -> list:
+    """
+    Labels of one stored label string. Missing values have no labels. With `strip`,
+    labels are stripped and empty ones dropped, as Temporospatial does; without it the
+    labels are str.split(',') as in Upsetplot.
+    """
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return []
+    labels = str(value).split(',')
+    return [label.strip() for label in labels if label.strip()] if strip else labels
+
+
+class LabelSets:
+    """
+    Label sets as bitmasks.
+
+    Args:
+        masks (np.ndarray): One mask per document; bit i is set if it has vocabulary[i].
+        vocabulary (list): Label names, in bit order.
+    """
+
+    def __init__(self, masks: np.ndarray, vocabulary: list):
+        self.masks = masks
+        self.vocabulary = list(vocabulary)
+        self._bits = {label: i for i, label in enumerate(self.vocabulary)}
+
+    @classmethod
+    def from_strings(cls, values, vocabulary: list = None, strip: bool = False) -> 'LabelSets':
+        """
+        Encodes a column of comma-separated label strings. Each distinct string is parsed
+        once. Without a vocabulary, it is every label found, sorted.
+        """
+        codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+        parsed = [parse_labels(value, strip) for value in uniques]
+        return cls._from_codes(codes, parsed, vocabulary)
+
+    @classmethod
+    def from_lists(cls, sets, vocabulary: list = None) -> 'LabelSets':
+        """Encodes label lists (or other iterables), e.g. a column already split."""
+        keys = [tuple(labels) if isinstance(labels, (list, tuple, set, frozenset)) else () for labels in sets]
+        codes, uniques = pd.factorize(pd.Series(keys, dtype=object))
+        return cls._from_codes(codes, [list(labels) for labels in uniques], vocabulary)
+
+    @classmethod
+    def _from_codes(cls, codes, parsed, vocabulary):
+        if vocabulary is None:
+            vocabulary = sorted({label for labels in parsed for label in labels})
+        dtype = mask_dtype(len(vocabulary))
+        bits = {label: dtype(1) << dtype(i) for i, label in enumerate(vocabulary)}
+        unknown = {label for labels in parsed for label in labels} - set(bits)
+        if unknown:
+            raise ValueError(f"Labels not in the vocabulary: {sorted(unknown)}")
+        unique_masks = np.zeros(len(parsed) + 1, dtype=dtype)  # Last slot: missing values
+        for i, labels in enumerate(parsed):
+            for label in labels:
+                unique_masks[i] |= bits[label]
+        return cls(unique_masks[np.asarray(codes)], vocabulary)
+
+    def __len__(self):
+        return len(self.masks)
+
+    def __getitem__(self, index) -> 'LabelSets':
+        return LabelSets(self.masks[index], self.vocabulary)
+
+    def concat(self, other: 'LabelSets') -> 'LabelSets':
+        if other.vocabulary != self.vocabulary:
+            raise ValueError("Cannot concatenate label sets with different vocabularies")
+        return LabelSets(np.concatenate([self.masks, other.masks]), self.vocabulary)
+
+    # --------------------------
+    # Masks
+    # --------------------------
+    def mask(self, labels) -> int:
+        """Mask of a collection of labels."""
+        labels = [labels] if isinstance(labels, str) else labels
+        return int(sum(1 << self._bits[label] for label in set(labels)))
+
+    def decode(self, mask) -> list:
+        mask = int(mask)
+        return [label for i, label in enumerate(self.vocabulary) if mask >> i & 1]
+
+    def membership(self) -> np.ndarray:
+        """Boolean matrix (documents x labels)."""
+        shifts = np.arange(len(self.vocabulary), dtype=self.masks.dtype)
+        return ((self.masks[:, None] >> shifts) & 1).astype(bool)
+
+    def _weights(self, weights):
+        return np.ones(len(self.masks)) if weights is None else np.asarray(weights, dtype=np.float64)
+
+    # --------------------------
+    # Counts
+    # --------------------------
+    def combination_counts(self, weights=None) -> tuple:
+        """(distinct masks, total weight of each), masks in increasing order."""
+        unique, inverse = np.unique(self.masks, return_inverse=True)
+        return unique, np.bincount(inverse.ravel(), weights=self._weights(weights), minlength=len(unique))
+
+    def label_counts(self, weights=None) -> pd.Series:
+        """Total weight of the documents having each label."""
+        unique, totals = self.combination_counts(weights)
+        shifts = np.arange(len(self.vocabulary), dtype=unique.dtype)
+        present = ((unique[:, None] >> shifts) & 1).astype(np.float64)
+        return pd.Series(totals @ present, index=self.vocabulary)
+
+    def matches(self, required=(), excluded=(), exact: bool = False) -> np.ndarray:
+        """
+        Documents with all `required` labels and none of the `excluded` ones (only the
+        required labels with `exact`).
+        """
+        required = self.mask(required)
+        dtype = self.masks.dtype.type
+        if exact:
+            return self.masks == dtype(required)
+        excluded = self.mask(excluded)
+        return ((self.masks & dtype(required)) == dtype(required)) & ((self.masks & dtype(excluded)) == 0)
+
+    def intersection_count(self, required=(), excluded=(), exact: bool = False, weights=None) -> float:
+        """Total weight of the documents matches() selects."""
+        return float(self._weights(weights)[self.matches(required, excluded, exact)].sum())
+
+    def grouped_label_counts(self, groups, weights=None) -> pd.DataFrame:
+        """
+        Weight per group and label, each document counted once per label it has: the
+        Temporospatial split/explode/groupby stacks. Returns a long frame (group, label,
+        count) without zero rows.
+        """
+        codes, group_values = pd.factorize(pd.Series(groups), sort=True)
+        unique_masks, mask_codes = np.unique(self.masks, return_inverse=True)
+        keys = codes.astype(np.int64) * len(unique_masks) + mask_codes.ravel()
+        keys, inverse = np.unique(keys, return_inverse=True)
+        totals = np.bincount(inverse.ravel(), weights=self._weights(weights), minlength=len(keys))
+        group_codes, masks = keys // len(unique_masks), unique_masks[keys % len(unique_masks)]
+        n_groups = len(group_values)
+        shifts = np.arange(len(self.vocabulary), dtype=masks.dtype)
+        present = ((masks[:, None] >> shifts) & 1).astype(np.float64)
+        table = np.zeros((n_groups, len(self.vocabulary)))
+        np.add.at(table, group_codes, present * totals[:, None])
+        frame = pd.DataFrame(table, index=pd.Index(group_values, name='group'),
+                             columns=pd.Index(self.vocabulary, name='label'))
+        long = frame.stack().rename('count').reset_index()
+        return long[long['count'] > 0].reset_index(drop=True)
+
+    # --------------------------
+    # UpSet
+    # --------------------------
+    def upset_series(self, weights=None, threshold: float = None) -> pd.Series:
+        """
+        Weight per label combination with upsetplot's boolean MultiIndex (one level per
+        label), keeping combinations whose weight is >= threshold.
+        """
+        unique, totals = self.combination_counts(weights)
+        if threshold is not None:
+            keep = totals >= threshold
+            unique, totals = unique[keep], totals[keep]
+        shifts = np.arange(len(self.vocabulary), dtype=unique.dtype)
+        present = ((unique[:, None] >> shifts) & 1).astype(bool)
+        index = pd.MultiIndex.from_arrays([present[:, i] for i in range(len(self.vocabulary))],
+                                          names=self.vocabulary)
+        return pd.Series(totals, index=index).sort_index()
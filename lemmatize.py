@@ -0,0 +1,216 @@
+"""
+Bulk spaCy lemmatization for the LDA and topic-modeling notebooks.
+
+lemmatize_texts() gives the same lemma lists as PostLDA's clean_review(), applied row by
+row, but:
+- texts are streamed through nlp.pipe() in batches, optionally on several processes;
+- the parser and NER are disabled. clean_review() only used the parse to split sentences
+  and then concatenated the tokens of every sentence, which is every token of the doc;
+- the custom infix tokenizer of PostLDA is kept;
+- lemma lists are cached in a SQLite file keyed by the SHA-256 of the text and the
+  pipeline version (model name and version, POS tags), so re-running the LDA sweep, or
+  extending it from the 385 posts to the comments, only parses texts not seen before.
+
+In the notebook:
+
+    nlp = load_nlp()
+    posts_df['lemma_text'] = lemmatize_texts(posts_df['Clean Text'], nlp, cache=LemmaCache())
+"""
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+import pandas as pd
+import spacy
+from spacy.lang.char_classes import ALPHA, ALPHA_LOWER, ALPHA_UPPER, CONCAT_QUOTES, LIST_ELLIPSES, LIST_ICONS
+from spacy.tokenizer import Tokenizer
+from spacy.util import compile_infix_regex
+
+POSTAGS = ('NOUN', 'ADJ', 'VERB', 'ADV', 'PROPN')
+
+# Components clean_review() does not need: lemmas only depend on the tagger,
+# attribute_ruler and lemmatizer
+DISABLED_COMPONENTS = ('parser', 'ner')
+
+LEMMA_VERSION = "1"
+
+
+def custom_tokenizer(nlp):
+    """The tokenizer of PostLDA, overriding how it splits tokens in the middle of strings."""
+    infixes = (
+        LIST_ELLIPSES
+        + LIST_ICONS
+        + [
+            r"(?<=[0-9])[+\-\*^](?=[0-9-])",  # Split on arithmetic operators when they appear between numbers
+            r"(?<=[{al}{q}])\.(?=[{au}{q}])".format(
+                al=ALPHA_LOWER, au=ALPHA_UPPER, q=CONCAT_QUOTES  # "U.S.A.", "Dr.Smith"
+            ),
+            r"(?<=[{a}]),(?=[{a}])".format(a=ALPHA),  # "word,another" → "word", ",", "another"
+            r"(?<=[{a}0-9])[:<>=/](?=[{a}])".format(a=ALPHA),  # : < > = / between letters or digits
+        ]
+    )
+
+    infix_re = compile_infix_regex(infixes)
+
+    return Tokenizer(nlp.vocab, prefix_search=nlp.tokenizer.prefix_search,
+                     suffix_search=nlp.tokenizer.suffix_search,
+                     infix_finditer=infix_re.finditer,
+                     token_match=nlp.tokenizer.token_match,
+                     rules=nlp.Defaults.tokenizer_exceptions)
+
+
+def load_nlp(model: str = "en_core_web_sm", disable=DISABLED_COMPONENTS):
+    """Loads a spaCy pipeline without the unneeded components and with the custom tokenizer."""
+    nlp = spacy.load(model, disable=list(disable))
+    nlp.tokenizer = custom_tokenizer(nlp)
+    return nlp
+
+
+def pipeline_version(nlp, postags=POSTAGS) -> str:
+    """Identifies everything the lemma lists depend on, for the cache keys."""
+    return f"{nlp.meta['lang']}_{nlp.meta['name']}-{nlp.meta['version']}|{','.join(postags)}|{LEMMA_VERSION}"
+
+
+def doc_lemmas(doc, postags=POSTAGS) -> list:
+    """Lowercased lemmas of the tokens with one of the POS tags that are not stop words."""
+    vocab = doc.vocab
+    return [token.lemma_.lower() for token in doc if token.pos_ in postags and not vocab[token.text].is_stop]
+
+
+def text_key(text: str, version: str) -> str:
+    h = hashlib.sha256(version.encode('utf-8'))
+    h.update(b'\0')
+    h.update(text.encode('utf-8'))
+    return h.hexdigest()
+
+
+class LemmaCache:
+    """
+    SQLite cache of lemma lists: key (text_key()) -> JSON list of lemmas.
+
+    Args:
+        path (str): Path to the SQLite file (created if it does not exist).
+    """
+
+    def __init__(self, path: str = 'lemma_cache.sqlite'):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS lemmas (
+                key TEXT PRIMARY KEY,
+                lemmas TEXT NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def get_many(self, keys: list) -> dict:
+        found = {}
+        for i in range(0, len(keys), 900):  # Stay below SQLite's bound-parameter limit
+            part = keys[i:i + 900]
+            for key, lemmas in self._conn.execute(
+                    f"SELECT key, lemmas FROM lemmas WHERE key IN ({','.join('?' * len(part))})", part):
+                found[key] = json.loads(lemmas)
+        return found
+
+    def put_many(self, items: list):
+        """Stores (key, lemma list) pairs."""
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO lemmas (key, lemmas) VALUES (?, ?)",
+                                   [(key, json.dumps(lemmas, ensure_ascii=False)) for key, lemmas in items])
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM lemmas").fetchone()[0]
+
+
+def lemmatize_texts(texts, nlp, postags=POSTAGS, cache: LemmaCache = None, batch_size: int = 256,
+                    n_process: int = 1, output_list: bool = True) -> list:
+    """
+    Lemmatizes a column of texts, like clean_review() applied to every string.
+
+    Args:
+        texts (pd.Series or list): The texts; values that are not strings are returned as is.
+        nlp: Pipeline from load_nlp().
+        postags (tuple): POS tags to keep.
+        cache (LemmaCache): Cache to read from and extend (default: no cache).
+        batch_size (int): Texts per nlp.pipe() batch.
+        n_process (int): Processes of nlp.pipe().
+        output_list (bool): Lemma lists if True, else lemmas joined with spaces.
+
+    Returns:
+        list: One entry per text, in order.
+    """
+    texts = list(texts)
+    version = pipeline_version(nlp, postags)
+    unique = list(dict.fromkeys(text for text in texts if isinstance(text, str)))
+    keys = {text: text_key(text, version) for text in unique}
+    cached = cache.get_many(list(keys.values())) if cache is not None else {}
+    results = {text: cached[keys[text]] for text in unique if keys[text] in cached}
+    missing = [text for text in unique if text not in results]
+
+    start = time.perf_counter()
+    pending = []
+    for text, doc in zip(missing, nlp.pipe(missing, batch_size=batch_size, n_process=n_process)):
+        results[text] = doc_lemmas(doc, postags)
+        pending.append((keys[text], results[text]))
+        if cache is not None and len(pending) >= 10 * batch_size:
+            cache.put_many(pending)
+            pending = []
+    if cache is not None and pending:
+        cache.put_many(pending)
+    seconds = time.perf_counter() - start
+    print(f"Lemmatized {len(missing)} of {len(unique)} distinct texts "
+          f"({len(unique) - len(missing)} cached) in {seconds:.1f}s")
+
+    if output_list:
+        return [results[text] if isinstance(text, str) else text for text in texts]
+    return [' '.join(results[text]) if isinstance(text, str) else text for text in texts]
+
+
+def main():
+    from preprocess import read_comments
+
+    parser = argparse.ArgumentParser(description="Lemmatize a text column with spaCy and cache the lemma lists")
+    parser.add_argument("input", help="CSV or Parquet file")
+    parser.add_argument("-o", "--output",
+                        help="Output file; Parquet keeps lemma lists, CSV joins them with spaces "
+                             "(default: only fill the cache)")
+    parser.add_argument("-c", "--column", default="Clean Text", help="Text column (default: 'Clean Text')")
+    parser.add_argument("--model", default="en_core_web_sm", help="spaCy model (default: en_core_web_sm)")
+    parser.add_argument("--cache", default="lemma_cache.sqlite", help="Cache file (default: lemma_cache.sqlite)")
+    parser.add_argument("--batch-size", type=int, default=256, help="Texts per nlp.pipe() batch (default: 256)")
+    parser.add_argument("--n-process", type=int, default=1, help="Processes of nlp.pipe() (default: 1)")
+    args = parser.parse_args()
+
+    input_path = Path(args.input)
+    if not input_path.is_file():
+        print(f"Error: {input_path} not found")
+        return 1
+    df = read_comments(input_path)
+
+    nlp = load_nlp(args.model)
+    cache = LemmaCache(args.cache)
+    to_parquet = args.output is not None and args.output.endswith('.parquet')
+    df['lemma_text'] = lemmatize_texts(df[args.column], nlp, cache=cache, batch_size=args.batch_size,
+                                       n_process=args.n_process, output_list=to_parquet)
+    print(f"Cache: {len(cache)} texts in {args.cache}")
+    cache.close()
+
+    if args.output:
+        if to_parquet:
+            df.to_parquet(args.output, index=False)
+        else:
+            df.to_csv(args.output, index=False)
+        print(f"Saved to: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
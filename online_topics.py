@@ -0,0 +1,382 @@
+"""
+Incremental topic modeling: new comment batches update the topic model without a refit.
+
+ModelFinetune fits BERTopic on the whole corpus with UMAP and HDBSCAN, so every new
+batch of comments means a full refit whose cost grows with the corpus. OnlineTopicModel
+uses BERTopic's partial_fit() with components that learn incrementally:
+
+- IncrementalPCA instead of UMAP for the reduction, fitted on the first batch and then
+  frozen (FrozenReducer), so that the centroids keep their coordinates;
+- OnlineClusterer instead of HDBSCAN: a centroid clustering that starts from the seed
+  topics (SEED_TOPIC_LIST, as in the sweep and ModelFinetune) and k-means on the first
+  batch, moves centroids towards new documents, creates a topic when enough documents
+  fall far from every centroid and merges topics whose centroids meet;
+- OnlineCountVectorizer with decay, so the vocabulary follows the newest comments and
+  rare terms are dropped, with c-TF-IDF recomputed on the per-topic counts.
+
+Guided topic modeling applies to every batch as in fit(). An update costs time in the
+size of the batch (plus the number of topics and the vocabulary), not of the corpus.
+
+    online = OnlineTopicModel.load_or_create('online_model', embedding_model)
+    online.update(new_comments['corpus'].tolist())
+    online.save()
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from embeddings import DEFAULT_MODEL, EmbeddingStore, corpus_hash, load_embedding_model
+from topic_sweep import SEED_TOPIC_LIST, VECTORIZER_PARAMS
+
+
+class FrozenReducer:
+    """
+    A reducer that partial_fit() fits on the first batch only.
+
+    OnlineClusterer keeps its centroids and outliers in the reduced space. Refitting
+    IncrementalPCA on every batch would rotate its basis and leave them (and the
+    distance thresholds) in the coordinates of an older batch.
+
+    Args:
+        reducer: Reduction model with partial_fit() and transform(), e.g. IncrementalPCA.
+    """
+
+    def __init__(self, reducer):
+        self.reducer = reducer
+        self.fitted_ = False
+
+    def partial_fit(self, X, y=None):
+        if not self.fitted_:
+            self.reducer.partial_fit(X)
+            self.fitted_ = True
+        return self
+
+    def transform(self, X):
+        return self.reducer.transform(X)
+
+
+class OnlineClusterer:
+    """
+    Centroid clustering with partial_fit(), as BERTopic's online mode expects of its
+    cluster model (`labels_` holds the labels of the last batch).
+
+    Args:
+        n_clusters (int): k-means centroids added on the first batch, next to the seeds.
+        seed_embeddings (np.ndarray): Seed topic embeddings in the original space; they are
+            reduced with `reducer` on the first batch and become the first centroids.
+        reducer: The reduction model, already fitted when partial_fit() runs. Its basis must
+            not change afterwards (see FrozenReducer).
+        new_topic_distance (float): Distance to the nearest centroid beyond which a document
+            is an outlier (default: the `outlier_quantile` of the first batch's distances).
+        merge_distance (float): Centroids closer than this merge (default: half of
+            `new_topic_distance`).
+        min_topic_size (int): Outliers that form a group of this size become a new topic.
+        decay (float): Fraction of a centroid's weight forgotten per batch, so topics follow
+            the newest documents.
+        max_outliers (int): Outliers kept for new topics (the oldest are dropped).
+    """
+
+    def __init__(self, n_clusters: int = 20, seed_embeddings=None, reducer=None, new_topic_distance: float = None,
+                 merge_distance: float = None, outlier_quantile: float = 0.95, min_topic_size: int = 50,
+                 decay: float = 0.01, max_outliers: int = 10000, random_state: int = 42):
+        self.n_clusters = n_clusters
+        self.seed_embeddings = seed_embeddings
+        self.reducer = reducer
+        self.new_topic_distance = new_topic_distance
+        self.merge_distance = merge_distance
+        self.outlier_quantile = outlier_quantile
+        self.min_topic_size = min_topic_size
+        self.decay = decay
+        self.max_outliers = max_outliers
+        self.random_state = random_state
+
+        self.centroids_ = None
+        self.weights_ = None
+        self.cluster_ids_ = None  # label of every centroid row; labels are never reused
+        self._next_label = 0
+        self.merged_ = {}  # retired label -> label it was merged into
+        self.labels_ = None
+        self._outliers = None
+
+    def _initialize(self, X):
+        from sklearn.cluster import KMeans
+
+        centroids = []
+        if self.seed_embeddings is not None and self.reducer is not None:
+            centroids.append(self.reducer.transform(np.asarray(self.seed_embeddings)))
+        n_clusters = min(self.n_clusters, len(X))
+        if n_clusters:
+            km = KMeans(n_clusters=n_clusters, n_init=3, random_state=self.random_state).fit(X)
+            centroids.append(km.cluster_centers_)
+        self.centroids_ = np.vstack(centroids).astype(np.float64)
+        self.weights_ = np.zeros(len(self.centroids_))
+        self.cluster_ids_ = np.arange(len(self.centroids_))
+        self._next_label = len(self.centroids_)
+        self._outliers = np.zeros((0, X.shape[1]))
+        if self.new_topic_distance is None:
+            self.new_topic_distance = float(np.quantile(self._nearest(X)[1], self.outlier_quantile))
+        if self.merge_distance is None:
+            self.merge_distance = self.new_topic_distance / 2
+
+    def _nearest(self, X):
+        distances = np.sqrt(((X[:, None, :] - self.centroids_[None, :, :]) ** 2).sum(axis=2))
+        rows = distances.argmin(axis=1)
+        return rows, distances[np.arange(len(X)), rows]
+
+    def partial_fit(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if self.centroids_ is None:
+            self._initialize(X)
+        self.weights_ *= 1 - self.decay
+
+        rows, distances = self._nearest(X)
+        inlier = distances <= self.new_topic_distance
+        labels = np.where(inlier, self.cluster_ids_[rows], -1)
+        self._update_centroids(X[inlier], rows[inlier])
+        self._create_topics(X, labels)
+        labels = self._merge(labels)
+        self.labels_ = labels
+        return self
+
+    def _update_centroids(self, X, rows):
+        if not len(X):
+            return
+        counts = np.bincount(rows, minlength=len(self.centroids_)).astype(np.float64)
+        sums = np.zeros_like(self.centroids_)
+        np.add.at(sums, rows, X)
+        touched = counts > 0
+        total = self.weights_[touched] + counts[touched]
+        self.centroids_[touched] += (sums[touched] - counts[touched, None] * self.centroids_[touched]) / total[:, None]
+        self.weights_[touched] = total
+
+    def _create_topics(self, X, labels):
+        """Groups the batch's outliers with the ones kept from earlier batches into new topics."""
+        batch_outliers = np.nonzero(labels == -1)[0]
+        pool = np.vstack([self._outliers, X[batch_outliers]])
+        if len(pool) < self.min_topic_size:
+            self._outliers = pool[-self.max_outliers:]
+            return
+        # Leader clustering of the pool: every point joins the first leader within reach
+        leaders, members = [], []
+        for i, point in enumerate(pool):
+            if leaders:
+                d = np.sqrt(((np.asarray(leaders) - point) ** 2).sum(axis=1))
+                j = int(d.argmin())
+                if d[j] <= self.new_topic_distance:
+                    members[j].append(i)
+                    continue
+            leaders.append(point)
+            members.append([i])
+        used = np.zeros(len(pool), dtype=bool)
+        offset = len(self._outliers)
+        for group in members:
+            if len(group) < self.min_topic_size:
+                continue
+            group = np.asarray(group)
+            label = self._next_label
+            self._next_label += 1
+            self.centroids_ = np.vstack([self.centroids_, pool[group].mean(axis=0)])
+            self.weights_ = np.append(self.weights_, float(len(group)))
+            self.cluster_ids_ = np.append(self.cluster_ids_, label)
+            in_batch = group[group >= offset] - offset
+            labels[batch_outliers[in_batch]] = label
+            used[group] = True
+            logging.info(f"Online clustering: new topic from {len(group)} outliers")
+        self._outliers = pool[~used][-self.max_outliers:]
+
+    def _merge(self, labels):
+        """Merges centroids closer than merge_distance into the heavier one."""
+        while len(self.centroids_) > 1:
+            d = np.sqrt(((self.centroids_[:, None, :] - self.centroids_[None, :, :]) ** 2).sum(axis=2))
+            np.fill_diagonal(d, np.inf)
+            i, j = np.unravel_index(d.argmin(), d.shape)
+            if d[i, j] > self.merge_distance:
+                break
+            keep, drop = (i, j) if self.weights_[i] >= self.weights_[j] else (j, i)
+            total = self.weights_[keep] + self.weights_[drop]
+            if total > 0:
+                self.centroids_[keep] = (self.centroids_[keep] * self.weights_[keep]
+                                         + self.centroids_[drop] * self.weights_[drop]) / total
+            self.weights_[keep] = total
+            kept, dropped = int(self.cluster_ids_[keep]), int(self.cluster_ids_[drop])
+            self.merged_[dropped] = kept
+            labels[labels == dropped] = kept
+            self.centroids_ = np.delete(self.centroids_, drop, axis=0)
+            self.weights_ = np.delete(self.weights_, drop)
+            self.cluster_ids_ = np.delete(self.cluster_ids_, drop)
+            logging.info(f"Online clustering: merged cluster {dropped} into {kept}")
+        return labels
+
+    def predict(self, X):
+        rows, distances = self._nearest(np.asarray(X, dtype=np.float64))
+        return np.where(distances <= self.new_topic_distance, self.cluster_ids_[rows], -1)
+
+
+class OnlineTopicModel:
+    """
+    A BERTopic model updated batch by batch, with its state kept in a directory:
+    `model.joblib` (the whole model, to resume updates), `batches.json` (hashes of the
+    batches already absorbed, which update() skips) and `safetensor/`, a snapshot that
+    BERTopic.load() and TopicAssigner read.
+
+    Args:
+        root (str): State directory.
+        topic_model: BERTopic model built by create_model().
+        embedding_model_name (str): Name saved with the snapshot.
+    """
+
+    def __init__(self, root: str, topic_model, embedding_model_name: str = DEFAULT_MODEL):
+        self.root = Path(root)
+        self.topic_model = topic_model
+        self.embedding_model_name = embedding_model_name
+        self.batches = []
+
+    @staticmethod
+    def create_model(embedding_model, seed_topic_list=SEED_TOPIC_LIST, n_components: int = 5, n_clusters: int = 20,
+                     min_topic_size: int = 50, cluster_decay: float = 0.01, vocabulary_decay: float = 0.01,
+                     delete_min_df: float = 1.0, top_n_words: int = 10, representation_model=None,
+                     random_state: int = 42):
+        """
+        A BERTopic model with incremental components. `representation_model` is off by
+        default: MaximalMarginalRelevance can return fewer than `top_n_words` words for a
+        small topic, which BERTopic's partial_fit() does not handle.
+        """
+        from bertopic import BERTopic
+        from bertopic.vectorizers import ClassTfidfTransformer, OnlineCountVectorizer
+        from sklearn.decomposition import IncrementalPCA
+
+        seed_embeddings = None
+        if seed_topic_list:
+            seed_embeddings = embedding_model.encode([" ".join(seed_topic) for seed_topic in seed_topic_list],
+                                                     show_progress_bar=False, convert_to_numpy=True)
+        reducer = FrozenReducer(IncrementalPCA(n_components=n_components))
+        cluster_model = OnlineClusterer(n_clusters=n_clusters, seed_embeddings=seed_embeddings, reducer=reducer,
+                                        min_topic_size=min_topic_size, decay=cluster_decay, random_state=random_state)
+        return BERTopic(
+            seed_topic_list=seed_topic_list,
+            umap_model=reducer,
+            hdbscan_model=cluster_model,
+            embedding_model=embedding_model,
+            vectorizer_model=OnlineCountVectorizer(decay=vocabulary_decay, delete_min_df=delete_min_df,
+                                                   **VECTORIZER_PARAMS),
+            top_n_words=top_n_words,
+            language='english',
+            verbose=True,
+            ctfidf_model=ClassTfidfTransformer(reduce_frequent_words=True),
+            representation_model=representation_model
+        )
+
+    @classmethod
+    def load_or_create(cls, root: str, embedding_model=None, embedding_model_name: str = DEFAULT_MODEL, **model_params):
+        """Resumes the model saved in `root`, or creates a new one (model_params go to create_model())."""
+        import joblib
+
+        root = Path(root)
+        if embedding_model is None:
+            embedding_model = load_embedding_model(embedding_model_name)
+        if (root / 'model.joblib').exists():
+            topic_model = joblib.load(root / 'model.joblib')
+            topic_model.embedding_model = None
+            online = cls(root, topic_model, embedding_model_name)
+            online._set_embedding_model(embedding_model)
+            online.batches = json.loads((root / 'batches.json').read_text())
+            return online
+        return cls(root, cls.create_model(embedding_model, **model_params), embedding_model_name)
+
+    def _set_embedding_model(self, embedding_model):
+        from bertopic.backend._utils import select_backend
+
+        self.topic_model.embedding_model = select_backend(embedding_model)
+
+    def update(self, docs, embeddings=None) -> dict:
+        """
+        Absorbs a batch of documents (in `corpus` form). A batch that was absorbed before is
+        skipped.
+
+        Returns:
+            dict: Batch size, seconds, topic counts and the cluster merges so far.
+        """
+        docs = [str(doc) for doc in docs]
+        digest = corpus_hash(docs)
+        if digest in self.batches:
+            logging.info(f"Batch {digest[:12]} already absorbed, skipping")
+            return {'documents': len(docs), 'skipped': True}
+        start = time.perf_counter()
+        if embeddings is not None:
+            # BERTopic modifies the embeddings in place for guided topic modeling
+            embeddings = np.array(embeddings, dtype=np.float32)
+        self.topic_model.partial_fit(docs, embeddings=embeddings)
+        self.batches.append(digest)
+        topics = np.asarray(self.topic_model.topics_)
+        cluster_model = self.topic_model.hdbscan_model
+        summary = {
+            'documents': len(docs),
+            'seconds': time.perf_counter() - start,
+            'topics': len(self.topic_model.topic_representations_) - (-1 in self.topic_model.topic_representations_),
+            'active_clusters': len(cluster_model.cluster_ids_),
+            'outliers': int((topics == -1).sum()),
+            'merged_clusters': dict(cluster_model.merged_),
+        }
+        logging.info(f"Absorbed {len(docs)} documents in {summary['seconds']:.1f}s: {summary['topics']} topics")
+        return summary
+
+    def topic_words(self) -> dict:
+        return {int(topic): [word for word, _ in words]
+                for topic, words in self.topic_model.topic_representations_.items()}
+
+    def save(self):
+        """Saves the resumable model, the absorbed batches and a safetensors snapshot."""
+        import joblib
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        embedding_model = self.topic_model.embedding_model
+        self.topic_model.embedding_model = None  # Stored by name with the snapshot, not in the pickle
+        try:
+            joblib.dump(self.topic_model, self.root / 'model.partial.joblib')
+            os.replace(self.root / 'model.partial.joblib', self.root / 'model.joblib')
+        finally:
+            self.topic_model.embedding_model = embedding_model
+        (self.root / 'batches.json').write_text(json.dumps(self.batches))
+        # BERTopic cannot save the configuration of an OnlineCountVectorizer, so the
+        # snapshot has no c-TF-IDF; the joblib model keeps it for further updates
+        self.topic_model.save(str(self.root / 'safetensor'), serialization="safetensors", save_ctfidf=False,
+                              save_embedding_model=self.embedding_model_name)
+
+
+def main():
+    from preprocess import add_min_length_argument, long_comments, read_comments
+
+    parser = argparse.ArgumentParser(description="Update the online topic model with a new batch of comments")
+    parser.add_argument("input", nargs="+", help="Comments CSV/Parquet files, absorbed in order")
+    parser.add_argument("-m", "--model-dir", default="online_model", help="State directory (default: online_model)")
+    parser.add_argument("-c", "--column", default="corpus", help="Text column (default: corpus)")
+    add_min_length_argument(parser)
+    parser.add_argument("--batch-size", type=int, default=5000, help="Documents per update (default: 5000)")
+    parser.add_argument("--embeddings", help="EmbeddingStore directory to take the embeddings from")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help=f"SentenceTransformer model (default: {DEFAULT_MODEL})")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    embedding_model = load_embedding_model(args.model)
+    online = OnlineTopicModel.load_or_create(args.model_dir, embedding_model, args.model)
+    store = EmbeddingStore(args.embeddings) if args.embeddings else None
+    for path in args.input:
+        df = long_comments(read_comments(path), args.min_length)
+        docs = df[args.column].astype(str).tolist()
+        for i in range(0, len(docs), args.batch_size):
+            batch = docs[i:i + args.batch_size]
+            embeddings = store.get(batch, args.model, embedding_model) if store is not None else None
+            summary = online.update(batch, embeddings)
+            print(json.dumps(summary))
+        online.save()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,232 @@
+"""
+Batch preprocessing of the comment corpus for topic modeling.
+
+preprocess_document() is the notebooks' step: clean_texts(), lowercase, NLTK
+word_tokenize() and join with spaces. preprocess_corpus() applies it to a whole column
+and returns `corpus` and `corpus_length` together:
+- every distinct body is processed once;
+- results are cached in a SQLite file keyed by the SHA-256 of the body and
+  PIPELINE_VERSION, so re-runs and newly crawled comments only process new bodies;
+- cache misses are processed in chunks on a process pool.
+
+The output is identical to
+
+    comments['corpus'] = comments['body'].apply(preprocess_document)
+    comments['corpus_length'] = comments['corpus'].apply(lambda x: len(x.split()) if isinstance(x, str) else 0)
+
+Bump PIPELINE_VERSION whenever clean_texts() or the tokenization changes, so that stale
+cache entries are not reused.
+"""
+
+import argparse
+import hashlib
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+from nltk.tokenize import word_tokenize
+
+from text_clean import clean_texts
+
+PIPELINE_VERSION = "clean_texts+word_tokenize:1"
+
+
+def preprocess_document(doc):
+    """
+    Cleans, lowercases and tokenizes a document, as in the notebooks.
+
+    Returns:
+        str: The tokens joined with spaces, or None if doc is None.
+    """
+    if doc is None:
+        return None
+    doc_str_raw = doc if isinstance(doc, str) else str(doc)
+    doc_str = clean_texts(doc_str_raw)
+    tokens = word_tokenize(doc_str.lower())
+    return ' '.join(tokens)
+
+
+def corpus_length(corpus) -> int:
+    return len(corpus.split()) if isinstance(corpus, str) else 0
+
+
+def text_key(text: str, version: str = PIPELINE_VERSION) -> str:
+    """Cache key of a document's text for a pipeline version."""
+    h = hashlib.sha256(version.encode('utf-8'))
+    h.update(b'\0')
+    h.update(text.encode('utf-8'))
+    return h.hexdigest()
+
+
+def _preprocess_chunk(texts: list) -> list:
+    """(corpus, corpus_length) of every text of a chunk."""
+    results = []
+    for text in texts:
+        corpus = preprocess_document(text)
+        results.append((corpus, corpus_length(corpus)))
+    return results
+
+
+class PreprocessCache:
+    """
+    SQLite cache of preprocessed documents: key (text_key()) -> corpus, corpus_length.
+
+    Args:
+        path (str): Path to the SQLite file (created if it does not exist).
+    """
+
+    def __init__(self, path: str = 'preprocess_cache.sqlite'):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                key TEXT PRIMARY KEY,
+                corpus TEXT NOT NULL,
+                corpus_length INTEGER NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def get_many(self, keys: list) -> dict:
+        found = {}
+        for i in range(0, len(keys), 900):  # Stay below SQLite's bound-parameter limit
+            part = keys[i:i + 900]
+            for key, corpus, length in self._conn.execute(
+                    f"SELECT key, corpus, corpus_length FROM documents WHERE key IN ({','.join('?' * len(part))})",
+                    part):
+                found[key] = (corpus, length)
+        return found
+
+    def put_many(self, items: list):
+        """Stores (key, corpus, corpus_length) rows."""
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO documents (key, corpus, corpus_length) VALUES (?, ?, ?)", items)
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+
+def preprocess_corpus(texts, cache: PreprocessCache = None, workers: int = 1, chunksize: int = 2000,
+                      version: str = PIPELINE_VERSION) -> pd.DataFrame:
+    """
+    Preprocesses a column of documents.
+
+    Args:
+        texts (pd.Series or list): The documents, e.g. comments['body'].
+        cache (PreprocessCache): Cache to read from and extend (default: no cache).
+        workers (int): Worker processes for the cache misses (default: 1, in-process).
+        chunksize (int): Documents per task sent to a worker.
+        version (str): Pipeline version the cache keys are bound to.
+
+    Returns:
+        pd.DataFrame: Columns corpus and corpus_length, with the index of `texts`.
+    """
+    texts = texts if isinstance(texts, pd.Series) else pd.Series(list(texts), dtype=object)
+    # Same text as preprocess_document() sees; None stays None
+    docs = [None if text is None else (text if isinstance(text, str) else str(text)) for text in texts]
+
+    unique = list(dict.fromkeys(doc for doc in docs if doc is not None))
+    keys = {doc: text_key(doc, version) for doc in unique}
+    cached = cache.get_many(list(keys.values())) if cache is not None else {}
+    results = {doc: cached[keys[doc]] for doc in unique if keys[doc] in cached}
+    missing = [doc for doc in unique if doc not in results]
+
+    start = time.perf_counter()
+    chunks = (missing[i:i + chunksize] for i in range(0, len(missing), chunksize))
+
+    def store(chunk, chunk_results):
+        results.update(zip(chunk, chunk_results))
+        if cache is not None:
+            cache.put_many([(keys[doc], corpus, length) for doc, (corpus, length) in zip(chunk, chunk_results)])
+
+    if workers <= 1 or len(missing) <= chunksize:
+        for chunk in chunks:
+            store(chunk, _preprocess_chunk(chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for chunk in chunks:
+                pending.append((chunk, executor.submit(_preprocess_chunk, chunk)))
+                # Keep a bounded number of chunks in flight
+                while len(pending) > 2 * workers:
+                    chunk_done, future = pending.popleft()
+                    store(chunk_done, future.result())
+            while pending:
+                chunk_done, future = pending.popleft()
+                store(chunk_done, future.result())
+
+    seconds = time.perf_counter() - start
+    print(f"Preprocessed {len(missing)} of {len(unique)} distinct documents "
+          f"({len(unique) - len(missing)} cached) in {seconds:.1f}s")
+
+    corpus = [None if doc is None else results[doc][0] for doc in docs]
+    lengths = [0 if doc is None else results[doc][1] for doc in docs]
+    return pd.DataFrame({'corpus': corpus, 'corpus_length': lengths}, index=texts.index)
+
+
+MIN_CORPUS_LENGTH = 10
+
+
+def read_comments(path) -> pd.DataFrame:
+    """Reads a comments file, Parquet or CSV."""
+    if str(path).endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+
+def long_comments(df: pd.DataFrame, min_length: int = MIN_CORPUS_LENGTH) -> pd.DataFrame:
+    """The rows topic models are fitted on: corpus_length >= min_length (all rows without that column)."""
+    if 'corpus_length' not in df.columns:
+        return df
+    return df[df['corpus_length'] >= min_length]
+
+
+def add_min_length_argument(parser: argparse.ArgumentParser):
+    """--min-length option of the scripts that read a preprocessed comments file (see long_comments())."""
+    parser.add_argument("--min-length", type=int, default=MIN_CORPUS_LENGTH,
+                        help=f"Keep rows with corpus_length >= this (default: {MIN_CORPUS_LENGTH})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocess a comment corpus (clean, tokenize) with a cache")
+    parser.add_argument("input", help="Comments CSV or Parquet file")
+    parser.add_argument("-o", "--output", help="Output file (default: adds '_corpus' suffix)")
+    parser.add_argument("-c", "--column", default="body", help="Text column (default: body)")
+    parser.add_argument("--cache", default="preprocess_cache.sqlite",
+                        help="Cache file (default: preprocess_cache.sqlite)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the cache")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Worker processes (default: 1)")
+    parser.add_argument("--chunksize", type=int, default=2000, help="Documents per worker task (default: 2000)")
+    args = parser.parse_args()
+
+    input_path = Path(args.input)
+    if not input_path.is_file():
+        print(f"Error: {input_path} not found")
+        return 1
+    output_path = args.output or str(input_path.parent / f"{input_path.stem}_corpus{input_path.suffix}")
+
+    df = read_comments(str(input_path))
+    cache = None if args.no_cache else PreprocessCache(args.cache)
+    df[['corpus', 'corpus_length']] = preprocess_corpus(df[args.column], cache, args.workers, args.chunksize)
+    if cache is not None:
+        print(f"Cache: {len(cache)} documents in {args.cache}")
+        cache.close()
+
+    if output_path.endswith('.parquet'):
+        df.to_parquet(output_path, index=False)
+    else:
+        df.to_csv(output_path, index=False)
+    print(f"Saved to: {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,312 @@
+"""
+Text normalization for Reddit posts and comments, shared by the notebooks.
+
+clean_texts() gives exactly the same output as the original step-by-step cleaner
+(kept as clean_texts_reference()), but compiles every pattern once, merges the
+single-character replacements into str.translate() passes and skips the emoji and
+date rules when their trigger characters are absent.
+
+Run as a script to check that both versions agree on a corpus and to compare their
+speed:
+
+    python text_clean.py                          # built-in sample corpus
+    python text_clean.py -i comments.csv -c body  # real comments
+"""
+
+import argparse
+import random
+import re
+import time
+
+import emoji
+from emoji import demojize
+
+# Characters that are an emoji on their own, for remove_if_only_emoji()
+_EMOJI_CHARS = frozenset(key for key in emoji.EMOJI_DATA if len(key) == 1)
+
+# Every emoji contains at least one non-ASCII character, so demojize() cannot change a
+# text that has none of these
+_EMOJI_TRIGGERS = frozenset(char for key in emoji.EMOJI_DATA for char in key if not char.isascii())
+
+# From the first to the last non-ASCII character. An emoji starts with at most one ASCII
+# character (the keycaps, e.g. '#️⃣') and never ends with one, so demojize() only has to
+# see this span plus the character before it
+NON_ASCII_SPAN_PATTERN = re.compile(r"[^\x00-\x7f](?:.*[^\x00-\x7f])?", re.DOTALL)
+
+_SPECIAL_CHARS = str.maketrans({'▲': 'increase', '▼': 'decrease', '\n': ' '})
+_SEPARATORS = str.maketrans({'|': ',', '_': ' '})
+_DASHES_AND_COLONS = str.maketrans({'#': ',', '-': ',', ':': ' '})
+_BRACES = str.maketrans({'(': None, ')': None, '<': None, '{': None, '}': None, '>': '.'})
+
+URL_PATTERN = re.compile(r"https?://\S+")
+BRACKET_PATTERN = re.compile(r"\[.*?\]")
+SPACE_PATTERN = re.compile(r"\s+")
+STAR_PATTERN = re.compile(r"\*+")
+DIGIT_PATTERN = re.compile(r"\d")
+LONE_SYMBOL_PATTERN = re.compile(r"\s[^\w\s]\s")
+PUNCTUATION_RUN_PATTERN = re.compile(r"\s[!?.,]+")
+NON_WORD_PATTERN = re.compile(r"[^\w\s]")
+
+# Date-like patterns, applied in this order, each with a character it cannot match without
+DATE_PATTERNS = [
+    (',', re.compile(r'\b[A-Za-z]{3},\s\d{1,2}\s[A-Za-z]{3}\b')),
+    ('—', re.compile(r'\b[A-Za-z]+,\s\d{1,2}\s[A-Za-z]+\s—\s[\d,:]+\s[APM]+\s[A-Z]+\b')),
+    ('—', re.compile(r'\b[A-Za-z]+,\s\d{1,2}\s[A-Za-z]+\s—\s[\d,]{1,5}\s[APM]+\b')),
+    (':', re.compile(r'\b\d{1,2}:\d{2}\s[A-Z]{3}\b')),
+    ('', re.compile(r'\b\d{1,2}\s?[apAP]\.?[mM]\.?')),
+]
+
+
+def remove_if_only_emoji(text):
+    if all(char in emoji.EMOJI_DATA for char in text.strip()):
+        return ""
+    return text
+
+
+def _demojize_span(text):
+    """
+    Same as demojize(text), but leaves the ASCII head and tail of the text to str slicing.
+    """
+    match = NON_ASCII_SPAN_PATTERN.search(text)
+    start = max(match.start() - 1, 0)
+    end = match.end()
+    return text[:start] + demojize(text[start:end]) + text[end:]
+
+
+def clean_texts_reference(text):
+    """
+    The original cleaner from Upsetplot.ipynb, kept unchanged as the reference for
+    clean_texts().
+
+    Args:
+        text (str): The original Reddit text content.
+
+    Returns:
+        str: The cleaned text.
+    """
+    text = remove_if_only_emoji(text)
+    if not text:
+      return text
+
+    # 2. Replace emojis with corresponding text
+    text = demojize(text)
+
+    # 3. Replace special character
+    text = re.sub(r'▲', 'increase', text)
+    text = re.sub(r'▼', 'decrease', text)
+    text = text.replace("\n", " ")
+
+    # 4. Remove hyperlinks
+    text = re.sub(r"https?://\S+", "", text)
+
+    # 5. Remove text in square brackets
+    text = re.sub(r"\s+", " ", re.sub(r"\[.*?\]", "", text)).strip()
+
+    # 6. Replace '|' with ','
+    text = text.replace('|', ',')
+
+    # 7. Deduplicate '*' and replace it with '.'
+    text = re.sub(r'\*+', '.', text)
+
+    # 8. replace _ with space
+    text = re.sub(r'_', ' ', text).strip()
+
+    # 9. Remove date-like patterns
+    text = re.sub(r'\b[A-Za-z]{3},\s\d{1,2}\s[A-Za-z]{3}\b', '', text)
+    text = re.sub(r'\b[A-Za-z]+,\s\d{1,2}\s[A-Za-z]+\s—\s[\d,:]+\s[APM]+\s[A-Z]+\b', '', text)
+    text = re.sub(r'\b[A-Za-z]+,\s\d{1,2}\s[A-Za-z]+\s—\s[\d,]{1,5}\s[APM]+\b', '', text)
+    text = re.sub(r'\b\d{1,2}:\d{2}\s[A-Z]{3}\b', '', text)
+    text = re.sub(r'\b\d{1,2}\s?[apAP]\.?[mM]\.?', '', text)
+
+
+    # # 10. remove # or -
+    text = re.sub(r'[#-]', ',', text)
+
+    # 11. replace : with ,
+    text = re.sub(r':', ' ', text)
+
+    # 12. remove extra space
+    text = re.sub(r'\s+', ' ', text).strip()
+
+    # 13. remove () <> {}
+    text = re.sub(r'[()<{}]', '', text)
+    text = re.sub(r'>', '.', text)
+
+    # 14. Remove extra commas and periods at the beginning
+    text = re.sub(r'^[,.]+', '', text)
+
+    text = re.sub(r'\s[^\w\s]\s', ' ', text)
+
+    # 15. Remove duplicate punctation
+    text = re.sub(r'\s[!?.,]+', ' ', text)
+
+    # 16. Remove extra spaces
+    text = re.sub(r'\s+', ' ', text).strip()
+
+    # 17. Remove all punctation
+    text = re.sub(r'[^\w\s]', '', text)
+    return text
+
+
+def clean_texts(text):
+    """
+    Preprocess a Reddit text by:
+    1. Dropping texts that consist of emojis only.
+    2. Replacing emojis with corresponding text.
+    3. Removing extra spaces and hyperlinks.
+    4. Removing text in square brackets.
+    5. Replacing '|' with ',' and '_' with a space.
+    6. Deduplicating '*' and replacing it with '.'.
+    7. Removing date-like patterns.
+    8. Removing brackets, repeated punctuation and finally all punctuation.
+
+    Same output as clean_texts_reference(), in fewer passes over the text.
+
+    Args:
+        text (str): The original Reddit text content.
+
+    Returns:
+        str: The cleaned text.
+    """
+    stripped = text.strip()
+    if not stripped:
+        return ""
+    if not stripped.isascii():
+        # Same test as remove_if_only_emoji(); no emoji is plain ASCII
+        if _EMOJI_CHARS.issuperset(stripped):
+            return ""
+        if not _EMOJI_TRIGGERS.isdisjoint(text):
+            text = _demojize_span(text)
+
+    text = text.translate(_SPECIAL_CHARS)
+    if 'http' in text:
+        text = URL_PATTERN.sub("", text)
+    if '[' in text:
+        text = BRACKET_PATTERN.sub("", text)
+    text = SPACE_PATTERN.sub(" ", text).strip()
+
+    # '|' and '_' are replaced together; neither can be part of a run of '*'
+    text = text.translate(_SEPARATORS)
+    if '*' in text:
+        text = STAR_PATTERN.sub('.', text)
+    text = text.strip()
+
+    if DIGIT_PATTERN.search(text):
+        for trigger, pattern in DATE_PATTERNS:
+            if trigger in text:
+                text = pattern.sub('', text)
+
+    text = text.translate(_DASHES_AND_COLONS)
+    text = SPACE_PATTERN.sub(' ', text).strip()
+    text = text.translate(_BRACES)
+    text = text.lstrip(',.')
+    text = LONE_SYMBOL_PATTERN.sub(' ', text)
+    text = PUNCTUATION_RUN_PATTERN.sub(' ', text)
+    text = SPACE_PATTERN.sub(' ', text).strip()
+    return NON_WORD_PATTERN.sub('', text)
+
+
+# --------------------------
+# Golden check and benchmark
+# --------------------------
+EXAMPLE_COMMENT = ("Hello world! route\n\nhttps://preview.redd.it/vcig96ctlnbe1.jpeg?width=3024&format=pjpg"
+                   "&auto=webp&s=c66fb87369421455fb10b6f66e5d8ec83eaec033 Saturday, 29 June — 11,00 PM 😊 ## "
+                   "- - 17 p.m. - Check this:\nhttps://example.com [remove this] **Hello** | <>>{test} ▲ ▼ "
+                   "Goodbye, . (Fri, 28 Jun)")
+
+# Fragments that exercise every rule and the boundaries between them
+_PIECES = [
+    "Evacuation order", "for Altadena", "the fire is 35% contained", "stay safe!!", "wow...", "?!",
+    "😊", "🔥🔥", "❤️", "👍🏽", "🇺🇸", "#️⃣", "©", "™", "▲", "▼", "—", " — ", "\n", "\n\n", "\t", "  ",
+    "https://www.latimes.com/california/story-2025-01-08", "http://x.co/a_b|c", "https://",
+    "[deleted]", "[removed]", "[link](https://redd.it/abc)", "[", "]",
+    "|", "||", "*", "**bold**", "***", "_", "__init__", "snake_case",
+    "Fri, 28 Jun", "Saturday, 29 June — 11,00 PM", "Tue, 7 Jan — 10:30 PM PST", "Wed, 8 Jan — 1,200 AM",
+    "10:45 PST", "9:05 pm", "7 p.m.", "11am", "5 PM", "3 A.M", "2025-01-07", "#1", "12", "٣", "½",
+    "#", "-", "--", "- -", ":", "::", "(", ")", "(Eaton)", "<", ">", "->", "<3", "{", "}", "{test}",
+    ",", ".", ",.,", " . ", " , ", " ! ", " & ", "&amp;", "'", "\"quote\"", "don't", "café", "naïve",
+    "Ⅻ", "ß", "İ", "‍", "️", " ", " ", "\r\n",
+]
+
+
+def sample_corpus(n, seed=0):
+    """
+    Builds a deterministic corpus of n texts from the fragments above, plus the edge cases
+    (empty, whitespace and emoji-only texts).
+    """
+    rng = random.Random(seed)
+    texts = ["", " ", "\n", "😊", "😊😊😊😊😊😊😊", " 🔥 ", "❤️", "|", "**", "[x]", EXAMPLE_COMMENT]
+    while len(texts) < n:
+        parts = rng.choices(_PIECES, k=rng.randint(1, 25))
+        texts.append(''.join(part + rng.choice(['', ' ', ' ', ', ', '. ']) for part in parts))
+    return texts[:n]
+
+
+def read_corpus(path, column):
+    import pandas as pd
+
+    texts = pd.read_csv(path, usecols=[column])[column].dropna()
+    return [text if isinstance(text, str) else str(text) for text in texts]
+
+
+def check(texts):
+    """
+    Compares clean_texts() with clean_texts_reference() on every text.
+
+    Returns:
+        list: (text, expected, actual) for every text where they differ.
+    """
+    mismatches = []
+    for text in texts:
+        expected = clean_texts_reference(text)
+        actual = clean_texts(text)
+        if actual != expected:
+            mismatches.append((text, expected, actual))
+    return mismatches
+
+
+def benchmark(function, texts, repeat=3):
+    """
+    Returns the best throughput of a cleaner over `repeat` runs, in texts per second.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            function(text)
+        best = min(best, time.perf_counter() - start)
+    return len(texts) / max(best, 1e-9)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check clean_texts() against the original cleaner and compare their speed"
+    )
+    parser.add_argument("-i", "--input", help="CSV file with texts (default: built-in sample corpus)")
+    parser.add_argument("-c", "--column", default="body", help="Text column of the CSV (default: body)")
+    parser.add_argument("-n", "--samples", type=int, default=20000,
+                        help="Size of the sample corpus (default: 20000)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the sample corpus (default: 0)")
+    parser.add_argument("--repeat", type=int, default=3, help="Benchmark runs, the best counts (default: 3)")
+    args = parser.parse_args()
+
+    texts = read_corpus(args.input, args.column) if args.input else sample_corpus(args.samples, args.seed)
+    print(f"Corpus: {len(texts)} texts")
+
+    mismatches = check(texts)
+    if mismatches:
+        print(f"FAILED: {len(mismatches)} texts differ from the reference, e.g.:")
+        for text, expected, actual in mismatches[:5]:
+            print(f"  text:     {text!r}\n  expected: {expected!r}\n  actual:   {actual!r}")
+        return 1
+    print("Golden check passed: output identical to the reference for every text")
+
+    before = benchmark(clean_texts_reference, texts, args.repeat)
+    after = benchmark(clean_texts, texts, args.repeat)
+    print(f"  reference:   {before:,.0f} comments/sec")
+    print(f"  clean_texts: {after:,.0f} comments/sec ({after / before:.1f}x)")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,596 @@
+"""
+BERTopic hyperparameter sweep of ModelSelect, importable and with cached UMAP reductions.
+
+The UMAP output of a configuration depends only on the UMAP parameters and on the data
+UMAP is fitted on (the embeddings after guided topic modeling, and the seed labels), not
+on the HDBSCAN settings. The original sweep refit UMAP inside the innermost
+min_cluster_size loop: 64 fits where 8 would do. Here every configuration uses a
+CachedUMAP, which stores each reduction on disk under a key made of its UMAP parameters
+and a hash of its input, and only runs UMAP on a cache miss. HDBSCAN, c-TF-IDF and the
+coherence score then run against the cached reduction, so the results are the same as
+in grid_search_results.csv. The c_v scores come from one CoherenceIndex (coherence.py)
+built for the whole sweep instead of a gensim CoherenceModel per configuration.
+
+run_sweep() runs the configurations on a process pool instead, appends every result to
+the results CSV as it completes and skips finished configurations on restart. It can
+prune the grid by successive halving: score every configuration on a subsample of the
+corpus first and run only the best ones on the full corpus. Its models are saved in
+safetensors format in an ArtifactStore, which shares identical files across
+configurations and loads candidates lazily.
+
+In ModelSelect:
+
+    store = EmbeddingStore('embeddings')
+    embeddings = store.get(corpus, 'all-mpnet-base-v2', embedding_model)
+    results_df = run_grid_search(corpus, embedding_model, save_dir, embeddings=embeddings,
+                                 reduction_cache='umap_cache')
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+import gensim.corpora as corpora
+import numpy as np
+import pandas as pd
+from gensim.models import CoherenceModel
+
+from artifacts import ArtifactStore
+from coherence import CoherenceIndex, topic_words
+from embeddings import DEFAULT_MODEL
+
+SEED_TOPIC_LIST = [["watchduty", "calfire", "containment", "drone", "images", "active", "inmate", "wind", "spread", "superscoopers"],
+                   ["air quality", "evacuate", "school", "ash", "smoke", "safety", "health", "selfies", "power", "medical"],
+                   ["water", "temporary", "mask", "pump", "rental", "housing", "eggs", "hydrant", "food", "laundry"],
+                   ["insurance", "law", "community", "relief", "donation", "restore", "clean", "mental", "rebuilding", "benefit"],
+                   ["burned down", "gone", "damage", "structures", "survived", "cars", "destruction", "trails", "victim", "lost"],
+                   ["responsibility", "pro bono", "influencer", "twitter", "trump", "mayor", "concert", "volunteer", "therapy", "celebrity"]
+                   ]
+
+N_NEIGHBORS_VALS = [15, 20, 25, 30]
+MIN_DIST_VALS = [0.0, 0.01]
+MIN_CLUSTER_SIZE_VALS = [50, 100, 150, 200, 250, 300, 350, 400]
+VECTORIZER_PARAMS = {"ngram_range": (1, 2)}
+
+
+def array_hash(embeddings, y=None) -> str:
+    """SHA-256 of an array's shape, type and values, and of the labels y if given."""
+    embeddings = np.ascontiguousarray(embeddings)
+    h = hashlib.sha256(f"{embeddings.shape}|{embeddings.dtype}".encode('utf-8'))
+    h.update(memoryview(embeddings).cast('B'))
+    if y is not None:
+        h.update(np.ascontiguousarray(np.asarray(y, dtype=np.int64)).tobytes())
+    return h.hexdigest()
+
+
+class ReductionCache:
+    """
+    Directory of dimensionality reductions keyed by UMAP parameters and input hash.
+
+    Each entry is `<key>.npy` (the reduced embeddings, as returned by fit() then
+    transform() on the same data), `<key>.json` (parameters) and, if kept,
+    `<key>.joblib` (the fitted UMAP model, needed to transform new documents).
+
+    Args:
+        root (str): Directory of the cache (created if it does not exist).
+        keep_models (bool): Also store the fitted UMAP models.
+    """
+
+    def __init__(self, root: str = 'umap_cache', keep_models: bool = True):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.keep_models = keep_models
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(umap_params: dict, input_hash: str) -> str:
+        params = json.dumps(umap_params, sort_keys=True, default=str)
+        return hashlib.sha256(f"{params}|{input_hash}".encode('utf-8')).hexdigest()[:32]
+
+    def load(self, key: str):
+        path = self.root / f"{key}.npy"
+        if not path.exists():
+            return None
+        return np.load(path)
+
+    def save(self, key: str, reduced, umap_params: dict, input_hash: str, model=None):
+        partial = self.root / f"{key}.partial.npy"
+        np.save(partial, reduced)
+        os.replace(partial, self.root / f"{key}.npy")
+        meta = {'umap_params': umap_params, 'input_hash': input_hash, 'shape': list(reduced.shape)}
+        (self.root / f"{key}.json").write_text(json.dumps(meta, indent=2, default=str))
+        if model is not None and self.keep_models:
+            import joblib
+
+            joblib.dump(model, self.root / f"{key}.joblib")
+
+    def load_model(self, key: str):
+        path = self.root / f"{key}.joblib"
+        if not path.exists():
+            return None
+        import joblib
+
+        return joblib.load(path)
+
+    def reducer(self, **umap_params):
+        """A CachedUMAP with these parameters, backed by this cache."""
+        return CachedUMAP(self, **umap_params)
+
+
+class CachedUMAP:
+    """
+    Drop-in umap_model for BERTopic that reads reductions from a ReductionCache.
+
+    fit() looks the input up in the cache and only fits UMAP on a miss; transform() of the
+    fitted data returns the cached reduction. Transforming other data uses the fitted UMAP
+    model, loaded from the cache or refitted if it was not kept.
+    """
+
+    def __init__(self, cache: ReductionCache, **umap_params):
+        self.cache = cache
+        self.umap_params = umap_params
+        self.key_ = None
+        self.embedding_ = None
+        self.model_ = None
+        self._fit_input = None
+
+    def _fit_umap(self, X, y):
+        from umap import UMAP
+
+        model = UMAP(**self.umap_params)
+        try:
+            model.fit(X, y=y)
+        except TypeError:
+            model.fit(X)
+        return model, model.transform(X)
+
+    def fit(self, X, y=None):
+        input_hash = array_hash(X, y)
+        self.key_ = self.cache.key(self.umap_params, input_hash)
+        self._fit_input = (X, y, input_hash)
+        self.embedding_ = self.cache.load(self.key_)
+        self.model_ = None
+        if self.embedding_ is None:
+            self.cache.misses += 1
+            logging.info(f"UMAP cache miss: {self.umap_params}")
+            self.model_, self.embedding_ = self._fit_umap(X, y)
+            self.cache.save(self.key_, self.embedding_, self.umap_params, input_hash, self.model_)
+        else:
+            self.cache.hits += 1
+            logging.info(f"UMAP cache hit: {self.umap_params}")
+        return self
+
+    def transform(self, X):
+        if self._fit_input is not None and (X is self._fit_input[0] or array_hash(X, self._fit_input[1]) ==
+                                            self._fit_input[2]):
+            return self.embedding_
+        return self._model().transform(X)
+
+    def _model(self):
+        if self.model_ is None:
+            self.model_ = self.cache.load_model(self.key_)
+        if self.model_ is None:
+            if self._fit_input is None:
+                raise RuntimeError("The UMAP model of this reduction was not kept and the fit input is gone")
+            X, y, _ = self._fit_input
+            self.model_, _ = self._fit_umap(X, y)
+        return self.model_
+
+    def __getstate__(self):
+        # Pickled topic models stay self-contained: they carry the fitted UMAP, not the fit input
+        state = self.__dict__.copy()
+        state['model_'] = self._model() if self.key_ is not None else None
+        state['_fit_input'] = None
+        return state
+
+
+def train_topic_model(corpus, embedding_model, umap_params, hdbscan_params, vectorizer_params,
+                      ctfidf_model, representation_model, top_n_words=10, seed_topic_list=SEED_TOPIC_LIST,
+                      embeddings=None, umap_model=None):
+    """
+    Train a BERTopic model given the hyperparameters.
+
+    `embeddings` (e.g. from EmbeddingStore) skips encoding the corpus, and `umap_model`
+    (e.g. a CachedUMAP) replaces the UMAP built from `umap_params`.
+    """
+    from bertopic import BERTopic
+    from hdbscan import HDBSCAN
+    from sklearn.feature_extraction.text import CountVectorizer
+    from umap import UMAP
+
+    # Create UMAP and HDBSCAN models with provided parameters.
+    #Step2
+    umap_model = umap_model if umap_model is not None else UMAP(**umap_params)
+    #Step3
+    hdbscan_model = HDBSCAN(**hdbscan_params)
+    #Step4
+    vectorizer_model = CountVectorizer(**vectorizer_params)
+
+    topic_model = BERTopic(
+        seed_topic_list=seed_topic_list,
+        umap_model=umap_model,
+        hdbscan_model=hdbscan_model,
+        embedding_model=embedding_model,
+        vectorizer_model=vectorizer_model,
+        top_n_words=top_n_words,
+        language='english',
+        calculate_probabilities=True,
+        verbose=True,
+        ctfidf_model=ctfidf_model,
+        representation_model=representation_model
+    )
+
+    if embeddings is not None:
+        # BERTopic modifies the embeddings in place for guided topic modeling
+        embeddings = np.array(embeddings, dtype=np.float32)
+    topics, _ = topic_model.fit_transform(corpus, embeddings=embeddings)
+    topic_info = topic_model.get_topic_info()
+    return topic_model, topics, topic_info, vectorizer_model
+
+
+def compute_coherence(topic_model, corpus, index=None):
+    """
+    Compute the c_v coherence score for a BERTopic model.
+
+    With a CoherenceIndex built from the same corpus and vectorizer, the score is looked
+    up in the index instead of running gensim's CoherenceModel.
+    """
+    if index is not None:
+        return index.score(topic_words(topic_model))
+
+    # Preprocess documents (using the model's internal method; caution as it's private)
+    cleaned_docs = topic_model._preprocess_text(corpus)
+    vectorizer = topic_model.vectorizer_model
+    analyzer = vectorizer.build_analyzer()
+    tokens = [analyzer(doc) for doc in cleaned_docs]
+
+    # Build dictionary and corpus for Gensim coherence computation.
+    dictionary = corpora.Dictionary(tokens)
+    corpus_tuple = [dictionary.doc2bow(token) for token in tokens]
+
+    # Get topics and remove outliers.
+    topics_dict = topic_model.get_topics()
+    topics_dict.pop(-1, None)
+    topic_words = [[word for word, _ in words] for words in topics_dict.values()]
+
+    coherence_model = CoherenceModel(
+        topics=topic_words,
+        texts=tokens,
+        corpus=corpus_tuple,
+        dictionary=dictionary,
+        coherence='c_v'
+    )
+    coherence = coherence_model.get_coherence()
+    return coherence
+
+
+def save_model(topic_model, save_dir, identifier, store=None, embedding_model_name=DEFAULT_MODEL):
+    """
+    Save the model using the given path structure, or in safetensors format in an
+    ArtifactStore (artifacts.py) if one is given.
+    """
+    if store is not None:
+        return store.save(topic_model, identifier, embedding_model_name)
+    if not os.path.exists(save_dir):
+        os.makedirs(save_dir)
+    save_path = os.path.join(save_dir, f"model_{identifier}")
+    topic_model.save(save_path, serialization="pickle")
+    return save_path
+
+
+def run_grid_search(corpus, embedding_model, save_dir, embeddings=None, reduction_cache='umap_cache',
+                    coherence_index=True, n_neighbors_vals=N_NEIGHBORS_VALS, min_dist_vals=MIN_DIST_VALS,
+                    min_cluster_size_vals=MIN_CLUSTER_SIZE_VALS, random_state=42):
+    """
+    Runs grid search over hyperparameters, trains models, evaluates them, saves each model,
+    and logs all information.
+
+    UMAP runs once per (n_neighbors, min_dist); every min_cluster_size reuses the reduction
+    from `reduction_cache` (a ReductionCache or its directory; None disables caching).
+    Coherence is scored with a CoherenceIndex built from the first model's vectorizer
+    (every configuration uses the same vectorizer parameters), or with `coherence_index`
+    if one is given; False falls back to gensim's CoherenceModel for every model.
+    """
+    from bertopic.representation import MaximalMarginalRelevance
+    from bertopic.vectorizers import ClassTfidfTransformer
+
+    if isinstance(reduction_cache, (str, os.PathLike)):
+        reduction_cache = ReductionCache(reduction_cache)
+
+    results = []
+    #Step5
+    ctfidf_model = ClassTfidfTransformer(reduce_frequent_words=True)
+
+    #Step6
+    representation_model = MaximalMarginalRelevance(diversity=0.3)
+
+    # Iterate over n_neighbors, min_dist, and min_cluster_size.
+    for n_neighbors in n_neighbors_vals:
+        for min_dist in min_dist_vals:
+            umap_params = {
+                "n_neighbors": n_neighbors,
+                "n_components": 5,
+                "min_dist": min_dist,
+                "metric": "cosine",
+                "random_state": random_state
+            }
+            for min_cluster_size in min_cluster_size_vals:
+                # Set min_samples as half of min_cluster_size.
+                min_samples = int(min_cluster_size // 2)
+                identifier = f"n{n_neighbors}_d{min_dist}_cs{min_cluster_size}"
+                logging.info(f"Testing: {identifier}")
+
+                hdbscan_params = {
+                    "min_cluster_size": min_cluster_size,
+                    "min_samples": min_samples,
+                    "gen_min_span_tree": True,
+                    "prediction_data": True
+                }
+                umap_model = reduction_cache.reducer(**umap_params) if reduction_cache is not None else None
+
+                # Train the BERTopic model.
+                topic_model, topics, topic_info, vectorizer_model = train_topic_model(
+                    corpus, embedding_model, umap_params, hdbscan_params, VECTORIZER_PARAMS,
+                    ctfidf_model, representation_model, top_n_words=10,
+                    embeddings=embeddings, umap_model=umap_model
+                )
+                num_topics = topic_info[topic_info.Topic != -1].shape[0]
+
+                # Compute coherence score.
+                if coherence_index is True:
+                    coherence_index = CoherenceIndex.from_topic_model(topic_model, corpus)
+                coherence = compute_coherence(topic_model, corpus, coherence_index or None)
+                logging.info(f"Result for {identifier}: num_topics={num_topics}, coherence={coherence:.4f}")
+
+                # Save the model.
+                model_save_path = save_model(topic_model, save_dir, identifier)
+                logging.info(f"Model saved at {model_save_path}")
+
+                results.append({
+                    "identifier": identifier,
+                    "n_neighbors": n_neighbors,
+                    "min_dist": min_dist,
+                    "min_cluster_size": min_cluster_size,
+                    "min_samples": min_samples,
+                    "num_topics": num_topics,
+                    "coherence": coherence,
+                    "save_path": model_save_path
+                })
+
+    if reduction_cache is not None:
+        logging.info(f"UMAP reductions: {reduction_cache.misses} fitted, {reduction_cache.hits} reused")
+    results_df = pd.DataFrame(results)
+    return results_df
+
+
+# --------------------------
+# Parallel, resumable sweep
+# --------------------------
+RESULT_COLUMNS = ["identifier", "n_neighbors", "min_dist", "min_cluster_size", "min_samples", "num_topics",
+                  "coherence", "save_path"]
+
+
+def sweep_configs(n_neighbors_vals=N_NEIGHBORS_VALS, min_dist_vals=MIN_DIST_VALS,
+                  min_cluster_size_vals=MIN_CLUSTER_SIZE_VALS, n_components_vals=(5,), min_samples_ratios=(0.5,),
+                  random_state=42) -> list:
+    """
+    Configurations of the grid, in the order of run_grid_search().
+
+    Identifiers of the original grid (5 components, min_samples at half of
+    min_cluster_size) are unchanged; other values add `_c<n_components>` and
+    `_s<ratio>` suffixes.
+    """
+    configs = []
+    for n_neighbors in n_neighbors_vals:
+        for min_dist in min_dist_vals:
+            for n_components in n_components_vals:
+                for min_cluster_size in min_cluster_size_vals:
+                    for ratio in min_samples_ratios:
+                        min_samples = int(min_cluster_size * ratio)
+                        identifier = f"n{n_neighbors}_d{min_dist}_cs{min_cluster_size}"
+                        if n_components != 5:
+                            identifier += f"_c{n_components}"
+                        if ratio != 0.5:
+                            identifier += f"_s{ratio}"
+                        configs.append({
+                            "identifier": identifier,
+                            "umap_params": {"n_neighbors": n_neighbors, "n_components": n_components,
+                                            "min_dist": min_dist, "metric": "cosine", "random_state": random_state},
+                            "hdbscan_params": {"min_cluster_size": min_cluster_size, "min_samples": min_samples,
+                                               "gen_min_span_tree": True, "prediction_data": True},
+                        })
+    return configs
+
+
+def completed_identifiers(results_path) -> set:
+    if not os.path.exists(results_path):
+        return set()
+    return set(pd.read_csv(results_path, usecols=["identifier"])["identifier"].astype(str))
+
+
+def append_result(results_path, row: dict):
+    """Appends one result row to the results CSV, writing the header if the file is new."""
+    new = not os.path.exists(results_path)
+    pd.DataFrame([row], columns=RESULT_COLUMNS).to_csv(results_path, mode='a', header=new, index=False)
+
+
+def available_memory_gb():
+    """Available memory in GB, from /proc/meminfo or psutil; None if unknown."""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024 ** 2
+    except OSError:
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.virtual_memory().available / 1024 ** 3
+
+
+def coherence_index_for(corpus, vectorizer_params=VECTORIZER_PARAMS, workers: int = 1) -> CoherenceIndex:
+    """CoherenceIndex over the tokens every sweep model's compute_coherence() would use."""
+    from bertopic import BERTopic
+    from sklearn.feature_extraction.text import CountVectorizer
+
+    cleaned_docs = BERTopic(language='english')._preprocess_text(corpus)
+    analyzer = CountVectorizer(**vectorizer_params).build_analyzer()
+    return CoherenceIndex([analyzer(doc) for doc in cleaned_docs], workers=workers)
+
+
+_worker = {}
+
+
+def _init_worker(corpus, embeddings_path, embedding_model_name, reduction_cache_root, save_dir):
+    from sentence_transformers import SentenceTransformer
+
+    _worker['corpus'] = corpus
+    _worker['embeddings'] = np.load(embeddings_path, mmap_mode='r') if embeddings_path else None
+    _worker['embedding_model'] = SentenceTransformer(embedding_model_name)
+    _worker['reduction_cache'] = ReductionCache(reduction_cache_root) if reduction_cache_root else None
+    _worker['store'] = ArtifactStore(save_dir)
+    _worker['embedding_model_name'] = embedding_model_name
+
+
+def _run_config(config: dict, indices=None, save: bool = True) -> dict:
+    """Trains one configuration in a worker; returns its result row and topic words."""
+    from bertopic.representation import MaximalMarginalRelevance
+    from bertopic.vectorizers import ClassTfidfTransformer
+
+    corpus, embeddings = _worker['corpus'], _worker['embeddings']
+    if indices is not None:
+        corpus = [corpus[i] for i in indices]
+        embeddings = embeddings[indices] if embeddings is not None else None
+    cache = _worker['reduction_cache']
+    umap_model = cache.reducer(**config["umap_params"]) if cache is not None else None
+
+    topic_model, topics, topic_info, vectorizer_model = train_topic_model(
+        corpus, _worker['embedding_model'], config["umap_params"], config["hdbscan_params"], VECTORIZER_PARAMS,
+        ClassTfidfTransformer(reduce_frequent_words=True), MaximalMarginalRelevance(diversity=0.3),
+        top_n_words=10, embeddings=embeddings, umap_model=umap_model
+    )
+    row = {
+        "identifier": config["identifier"],
+        "n_neighbors": config["umap_params"]["n_neighbors"],
+        "min_dist": config["umap_params"]["min_dist"],
+        "min_cluster_size": config["hdbscan_params"]["min_cluster_size"],
+        "min_samples": config["hdbscan_params"]["min_samples"],
+        "num_topics": topic_info[topic_info.Topic != -1].shape[0],
+        "save_path": (save_model(topic_model, None, config["identifier"], _worker['store'],
+                                 _worker['embedding_model_name']) if save else ""),
+    }
+    return {"row": row, "topic_words": topic_words(topic_model)}
+
+
+def _umap_group(config: dict) -> str:
+    return json.dumps(config["umap_params"], sort_keys=True)
+
+
+def _run_stage(executor, configs, results_path, index, workers, memory_per_worker_gb, indices=None, save=True):
+    """
+    Runs configurations on the pool and appends each result as it completes, skipping
+    those already in the results file.
+
+    The first configuration of each UMAP setting runs before the others of that setting,
+    so its reduction is computed once and then read from the cache.
+    """
+    from concurrent.futures import FIRST_COMPLETED, wait
+
+    done = completed_identifiers(results_path)
+    todo = [config for config in configs if config["identifier"] not in done]
+    logging.info(f"{len(done)} configurations already in {results_path}, {len(todo)} to run")
+
+    groups = {}
+    for config in todo:
+        groups.setdefault(_umap_group(config), []).append(config)
+    cached = set()  # UMAP settings whose reduction is in the cache
+    ready = [configs_[0] for configs_ in groups.values()]
+    waiting = {key: configs_[1:] for key, configs_ in groups.items()}
+    running = {}
+
+    while ready or running:
+        while ready and len(running) < workers:
+            available = available_memory_gb()
+            if running and available is not None and available < memory_per_worker_gb:
+                break  # Wait for a running configuration to free memory
+            config = ready.pop(0)
+            running[executor.submit(_run_config, config, indices, save)] = config
+        finished, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in finished:
+            config = running.pop(future)
+            result = future.result()
+            row = result["row"]
+            row["coherence"] = index.score(result["topic_words"])
+            append_result(results_path, row)
+            logging.info(f"Result for {row['identifier']}: num_topics={row['num_topics']}, "
+                         f"coherence={row['coherence']:.4f}")
+            key = _umap_group(config)
+            if key not in cached:
+                cached.add(key)
+                ready.extend(waiting.pop(key))
+    return pd.read_csv(results_path)
+
+
+def run_sweep(corpus, save_dir, results_path, embeddings_path=None, embedding_model_name=DEFAULT_MODEL,
+              configs=None, reduction_cache_root='umap_cache', workers: int = 1, memory_per_worker_gb: float = 8.0,
+              halving_fraction: float = None, halving_keep: float = 0.25, seed: int = 42) -> pd.DataFrame:
+    """
+    Runs a sweep on a process pool, appending every result row to `results_path` as soon
+    as its configuration finishes. Restarting with the same results file skips the
+    configurations already in it.
+
+    Args:
+        corpus (list): The documents.
+        save_dir (str): ArtifactStore directory of the saved models.
+        results_path (str): Results CSV (same columns as grid_search_results.csv).
+        embeddings_path (str): .npy embeddings of the corpus, e.g. from EmbeddingStore; each
+            worker memory-maps it. Without it, every model encodes the corpus.
+        embedding_model_name (str): SentenceTransformer loaded by each worker.
+        configs (list): From sweep_configs() (default: the original grid).
+        reduction_cache_root (str): ReductionCache directory shared by the workers.
+        workers (int): Maximum number of configurations trained at once.
+        memory_per_worker_gb (float): Memory one configuration needs; no configuration is
+            started while less is available, and the pool is capped accordingly.
+        halving_fraction (float): Successive halving: score every configuration on this
+            fraction of the corpus first (results in `<results>_subsample.csv`) and run only
+            the best `halving_keep` fraction of them on the full corpus.
+        halving_keep (float): Fraction of configurations promoted to the full corpus.
+        seed (int): Seed of the subsample.
+
+    Returns:
+        pd.DataFrame: All full-corpus results in the results file.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    configs = configs if configs is not None else sweep_configs()
+    available = available_memory_gb()
+    if available is not None:
+        workers = max(1, min(workers, int(available // memory_per_worker_gb)))
+    logging.info(f"Sweep of {len(configs)} configurations on {workers} workers")
+    corpus = list(corpus)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(corpus, embeddings_path, embedding_model_name, reduction_cache_root,
+                                       save_dir)) as executor:
+        if halving_fraction:
+            rng = np.random.default_rng(seed)
+            indices = np.sort(rng.choice(len(corpus), int(len(corpus) * halving_fraction), replace=False))
+            subsample_path = str(Path(results_path).with_name(Path(results_path).stem + "_subsample.csv"))
+            index = coherence_index_for([corpus[i] for i in indices])
+            stage = _run_stage(executor, configs, subsample_path, index, workers, memory_per_worker_gb,
+                               indices, save=False)
+            index.close()
+            ranked = stage.sort_values("coherence", ascending=False)["identifier"].astype(str).tolist()
+            keep = set(ranked[:max(1, int(np.ceil(len(ranked) * halving_keep)))])
+            configs = [config for config in configs if config["identifier"] in keep]
+            logging.info(f"Successive halving: promoting {len(configs)} configurations to the full corpus")
+
+        index = coherence_index_for(corpus)
+        results = _run_stage(executor, configs, results_path, index, workers, memory_per_worker_gb)
+        index.close()
+    return results
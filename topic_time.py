@@ -0,0 +1,330 @@
+"""
+Topics over time and per fire from stored per-(topic, hour, fire) term counts.
+
+ModelFinetune and Temporospatial call topics_over_time() and topics_per_class() on the
+whole corpus for every binning they try (hour or day, per fire, with a cutoff). Each call
+joins the documents of every (topic, bin) pair, tokenizes them again with the model's
+vectorizer and recomputes c-TF-IDF. TopicTimeCounts tokenizes every document once and
+keeps a sparse document-term count matrix per (topic, hour, fire) cell, saved to disk.
+Coarser bins, fire subsets, time windows and sliding windows are then sums of those
+rows (a sparse indicator product), and new comments only add to the cells they fall in.
+The IDs of the counted comments are kept, so comments already counted are skipped:
+
+    counts = TopicTimeCounts.build(model_ft, long_comments['corpus'], model_ft.topics_,
+                                   long_comments['created_utc'], fires=long_comments['fire_name'],
+                                   ids=long_comments['comment_id'])
+    counts.save('topic_time')
+    topics_over_time = counts.topics_over_time(model_ft, freq='D')
+    topics_per_class = counts.topics_per_class(model_ft, end='2025-01-16')
+
+The representations follow BERTopic's: the model's c-TF-IDF transform of the summed
+counts, averaged with the model's global c-TF-IDF (global_tuning), the top 5 words and
+the number of documents. Two differences: counts are taken per document, so bigrams
+across two documents (which BERTopic's " ".join() of a bin's documents creates) are not
+counted; and evolution_tuning is off by default, because BERTopic's own evolution step
+writes into a copy of the matrix (`c_tf_idf.tolil()[...] = ...`) and has no effect.
+"""
+
+import argparse
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sps
+from sklearn.preprocessing import normalize
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+CELL_COLUMNS = ['topic', 'hour', 'fire']
+
+
+def vocabulary_hash(words) -> str:
+    return hashlib.sha256("\n".join(words).encode('utf-8')).hexdigest()
+
+
+def _feature_names(topic_model) -> np.ndarray:
+    return np.asarray(topic_model.vectorizer_model.get_feature_names_out())
+
+
+def _sum_rows(codes: np.ndarray, n_groups: int, rows: np.ndarray, matrix: sps.csr_matrix) -> sps.csr_matrix:
+    """Sums matrix[rows] into n_groups rows, row i going to codes[i]."""
+    indicator = sps.csr_matrix((np.ones(len(rows)), (codes, rows)), shape=(n_groups, matrix.shape[0]))
+    return (indicator @ matrix).tocsr()
+
+
+def _step(freq: str) -> pd.Timedelta:
+    """Length of a fixed frequency such as 'h', '6h' or 'D'."""
+    return pd.Timedelta(freq if freq[:1].isdigit() else f"1{freq}")
+
+
+def top_words(matrix: sps.csr_matrix, words: np.ndarray, n: int = 5) -> list:
+    """The n highest-scoring words of every row, ', '-joined; rows with fewer get '' padding as in BERTopic."""
+    out = []
+    for start, end in zip(matrix.indptr[:-1], matrix.indptr[1:]):
+        data, indices = matrix.data[start:end], matrix.indices[start:end]
+        order = np.argsort(-data, kind='stable')[:n]
+        row = [words[indices[i]] if data[i] > 0 else "" for i in order]
+        out.append(", ".join(row + [""] * (n - len(row))))
+    return out
+
+
+class TopicTimeCounts:
+    """
+    Term counts per (topic, hour, fire) cell.
+
+    Args:
+        cells (pd.DataFrame): One row per cell: topic, hour, fire and the number of documents.
+        counts (sps.csr_matrix): Term counts, one row per cell, columns in the vocabulary of
+            the model's vectorizer.
+        vocabulary (str): vocabulary_hash() of that vocabulary.
+        ids (pd.Index): IDs of the counted documents, or None if they were not given.
+    """
+
+    def __init__(self, cells: pd.DataFrame, counts: sps.csr_matrix, vocabulary: str, ids: pd.Index = None):
+        self.cells = cells
+        self.counts = counts
+        self.vocabulary = vocabulary
+        self.ids = ids
+
+    # --------------------------
+    # Building
+    # --------------------------
+    @staticmethod
+    def _document_cells(topic_model, docs, topics, timestamps, fires):
+        docs = [str(doc) for doc in docs]
+        X = topic_model.vectorizer_model.transform(topic_model._preprocess_text(docs)).tocsr()
+        timestamps = pd.Series(timestamps).reset_index(drop=True)
+        if pd.api.types.is_string_dtype(timestamps) and isinstance(timestamps.iat[0], str):
+            hours = pd.to_datetime(timestamps, format=DATE_FORMAT).dt.floor('h')
+        else:
+            hours = pd.to_datetime(timestamps).dt.floor('h')
+        keys = pd.DataFrame({
+            'topic': np.asarray(topics, dtype=np.int64),
+            'hour': hours.to_numpy(),
+            'fire': np.asarray(fires, dtype=object) if fires is not None else 'all',
+        })
+        return keys, X
+
+    @staticmethod
+    def _combine(keys: pd.DataFrame, documents: np.ndarray, matrix: sps.csr_matrix):
+        """Sums rows with equal (topic, hour, fire) keys."""
+        grouped = keys.groupby(CELL_COLUMNS, sort=True)
+        codes = grouped.ngroup().to_numpy()
+        n_groups = grouped.ngroups
+        cells = keys.drop_duplicates(CELL_COLUMNS).sort_values(CELL_COLUMNS).reset_index(drop=True)
+        cells['documents'] = np.bincount(codes, weights=documents, minlength=n_groups).astype(np.int64)
+        return cells, _sum_rows(codes, n_groups, np.arange(len(keys)), matrix)
+
+    @staticmethod
+    def _select(keep: np.ndarray, docs, topics, timestamps, fires):
+        """The documents where `keep` is True."""
+        rows = np.nonzero(keep)[0]
+        docs = [docs[i] for i in rows] if isinstance(docs, list) else pd.Series(docs).iloc[rows].tolist()
+        timestamps = pd.Series(timestamps).iloc[rows]
+        fires = None if fires is None else np.asarray(fires, dtype=object)[rows]
+        return docs, np.asarray(topics)[rows], timestamps, fires
+
+    @classmethod
+    def build(cls, topic_model, docs, topics, timestamps, fires=None, ids=None) -> 'TopicTimeCounts':
+        """
+        Args:
+            topic_model: The fitted BERTopic model whose vectorizer and c-TF-IDF are used.
+            docs (list): Documents as the model saw them (the `corpus` column).
+            topics (list): Topic of every document, e.g. model_ft.topics_.
+            timestamps: 'YYYY-mm-dd HH:MM:SS' strings or datetimes (created_utc).
+            fires: Fire label of every document (e.g. JoinIndex.fire_names()); 'all' if omitted.
+            ids: ID of every document (comment_id). Kept so that add() skips documents
+                already counted; repeated IDs are counted once.
+        """
+        if ids is not None:
+            ids = pd.Index(pd.Series(ids).astype(str))
+            keep = ~ids.duplicated()
+            docs, topics, timestamps, fires = cls._select(keep, docs, topics, timestamps, fires)
+            ids = ids[keep]
+        keys, X = cls._document_cells(topic_model, docs, topics, timestamps, fires)
+        cells, counts = cls._combine(keys, np.ones(len(keys)), X)
+        return cls(cells, counts, vocabulary_hash(_feature_names(topic_model)), ids)
+
+    def add(self, topic_model, docs, topics, timestamps, fires=None, ids=None) -> 'TopicTimeCounts':
+        """
+        Counts with new documents added; only their cells change. With `ids`, documents
+        whose IDs are already counted are skipped, so a growing comments file can be
+        passed again as a whole.
+        """
+        self._check(topic_model)
+        if (ids is None) != (self.ids is None):
+            raise ValueError("Pass ids to add() if and only if the counts were built with ids")
+        new_ids = None
+        if ids is not None:
+            ids = pd.Index(pd.Series(ids).astype(str))
+            keep = ~ids.isin(self.ids) & ~ids.duplicated()
+            docs, topics, timestamps, fires = self._select(keep, docs, topics, timestamps, fires)
+            new_ids = ids[keep]
+        if not len(topics):
+            return self
+        keys, X = self._document_cells(topic_model, docs, topics, timestamps, fires)
+        new_cells, new_counts = self._combine(keys, np.ones(len(keys)), X)
+        all_keys = pd.concat([self.cells[CELL_COLUMNS], new_cells[CELL_COLUMNS]], ignore_index=True)
+        documents = np.concatenate([self.cells['documents'].to_numpy(), new_cells['documents'].to_numpy()])
+        cells, counts = self._combine(all_keys, documents, sps.vstack([self.counts, new_counts]).tocsr())
+        return TopicTimeCounts(cells, counts, self.vocabulary, None if ids is None else self.ids.append(new_ids))
+
+    def _check(self, topic_model):
+        if vocabulary_hash(_feature_names(topic_model)) != self.vocabulary:
+            raise ValueError("The counts were built with another vectorizer vocabulary")
+
+    def save(self, path: str):
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        self.cells.to_parquet(path / 'cells.parquet', index=False)
+        sps.save_npz(path / 'counts.npz', self.counts)
+        if self.ids is not None:
+            pd.DataFrame({'id': self.ids}).to_parquet(path / 'ids.parquet', index=False)
+        (path / 'meta.json').write_text(json.dumps({'vocabulary': self.vocabulary, 'cells': len(self.cells),
+                                                    'ids': self.ids is not None}))
+
+    @classmethod
+    def load(cls, path: str) -> 'TopicTimeCounts':
+        path = Path(path)
+        meta = json.loads((path / 'meta.json').read_text())
+        ids = pd.Index(pd.read_parquet(path / 'ids.parquet')['id'].astype(str)) if meta.get('ids') else None
+        return cls(pd.read_parquet(path / 'cells.parquet'), sps.load_npz(path / 'counts.npz').tocsr(),
+                   meta['vocabulary'], ids)
+
+    # --------------------------
+    # Aggregation
+    # --------------------------
+    def aggregate(self, freq: str = 'D', by_fire: bool = False, fires=None, start=None, end=None,
+                  window: str = None):
+        """
+        Sums cells into (topic, bin[, fire]) rows.
+
+        Args:
+            freq (str): Bin size, a pandas frequency ('h', 'D', '6h'); None for a single bin.
+            by_fire (bool): Keep fires apart.
+            fires: Only these fire labels.
+            start, end: Only hours in [start, end).
+            window (str): Sliding window: every bin sums the cells of the `window` ending
+                with it (a multiple of `freq`, e.g. '24h' with 'h'). Bins run up to the
+                last one with data (and before `end`).
+
+        Returns:
+            tuple: (keys DataFrame with topic, Timestamp[, fire], documents; csr counts).
+        """
+        cells = self.cells
+        mask = np.ones(len(cells), dtype=bool)
+        if fires is not None:
+            mask &= cells['fire'].isin([fires] if isinstance(fires, str) else fires).to_numpy()
+        if start is not None:
+            mask &= (cells['hour'] >= pd.Timestamp(start)).to_numpy()
+        if end is not None:
+            mask &= (cells['hour'] < pd.Timestamp(end)).to_numpy()
+        rows = np.nonzero(mask)[0]
+        selected = cells.iloc[rows]
+
+        bins = selected['hour'].dt.floor(freq) if freq else pd.Series(pd.NaT, index=selected.index)
+        keys = pd.DataFrame({'topic': selected['topic'].to_numpy(), 'Timestamp': bins.to_numpy()})
+        if by_fire:
+            keys['fire'] = selected['fire'].to_numpy()
+        documents = selected['documents'].to_numpy()
+        if window and len(keys):
+            step = _step(freq)
+            steps = int(_step(window) / step)
+            if steps < 1:
+                raise ValueError(f"window {window} is shorter than freq {freq}")
+            last_bin = keys['Timestamp'].max()
+            repeats = np.repeat(np.arange(len(keys)), steps)
+            shifts = np.tile(np.arange(steps), len(keys))
+            keys = keys.iloc[repeats].reset_index(drop=True)
+            keys['Timestamp'] = keys['Timestamp'] + pd.to_timedelta(shifts * step).to_numpy()
+            rows, documents = rows[repeats], documents[repeats]
+            inside = (keys['Timestamp'] <= last_bin).to_numpy()
+            if end is not None:
+                inside = inside & (keys['Timestamp'] < pd.Timestamp(end)).to_numpy()
+            keys, rows, documents = keys[inside].reset_index(drop=True), rows[inside], documents[inside]
+
+        group_columns = list(keys.columns)
+        grouped = keys.groupby(group_columns, sort=True, dropna=False)
+        codes = grouped.ngroup().to_numpy()
+        out = keys.drop_duplicates(group_columns).sort_values(group_columns).reset_index(drop=True)
+        out['documents'] = np.bincount(codes, weights=documents, minlength=grouped.ngroups).astype(np.int64)
+        return out, _sum_rows(codes, grouped.ngroups, rows, self.counts)
+
+    # --------------------------
+    # Representations
+    # --------------------------
+    def _representations(self, topic_model, keys: pd.DataFrame, counts: sps.csr_matrix, global_tuning: bool,
+                         evolution_tuning: bool = False) -> list:
+        """Top words of every row: c-TF-IDF of its counts, tuned as BERTopic does."""
+        self._check(topic_model)
+        c_tf_idf = topic_model.ctfidf_model.transform(counts.astype(np.float64)).tocsr()
+        if global_tuning or evolution_tuning:
+            c_tf_idf = normalize(c_tf_idf, axis=1, norm="l1", copy=False)
+        if evolution_tuning:
+            c_tf_idf = c_tf_idf.tolil()
+            timestamps = np.sort(keys['Timestamp'].unique())
+            previous_bin = dict(zip(timestamps[1:], timestamps[:-1]))
+            row_of = {(topic, ts): i for i, (topic, ts) in enumerate(zip(keys['topic'], keys['Timestamp']))}
+            for i in np.argsort(keys['Timestamp'].to_numpy(), kind='stable'):
+                topic, ts = keys['topic'].iat[i], keys['Timestamp'].iat[i]
+                j = row_of.get((topic, previous_bin.get(ts)))
+                if j is not None:
+                    c_tf_idf[i] = (c_tf_idf[i] + c_tf_idf[j]) / 2.0
+            c_tf_idf = c_tf_idf.tocsr()
+        if global_tuning:
+            global_c_tf_idf = normalize(topic_model.c_tf_idf_, axis=1, norm="l1", copy=True)
+            c_tf_idf = ((global_c_tf_idf[keys['topic'].to_numpy() + topic_model._outliers] + c_tf_idf) / 2.0).tocsr()
+        return top_words(c_tf_idf, _feature_names(topic_model))
+
+    def topics_over_time(self, topic_model, freq: str = 'D', fires=None, start=None, end=None, window: str = None,
+                         global_tuning: bool = True, evolution_tuning: bool = False, by_fire: bool = False) -> pd.DataFrame:
+        """BERTopic's topics_over_time() frame (Topic, Words, Frequency, Timestamp[, fire]) from the stored counts."""
+        keys, counts = self.aggregate(freq, by_fire, fires, start, end, window)
+        words = self._representations(topic_model, keys, counts, global_tuning, evolution_tuning and not by_fire)
+        result = pd.DataFrame({'Topic': keys['topic'], 'Words': words, 'Frequency': keys['documents'],
+                               'Timestamp': keys['Timestamp']})
+        if by_fire:
+            result['fire'] = keys['fire']
+        return result.sort_values(['Timestamp', 'Topic']).reset_index(drop=True)
+
+    def topics_per_class(self, topic_model, fires=None, start=None, end=None, global_tuning: bool = True) -> pd.DataFrame:
+        """BERTopic's topics_per_class() frame (Topic, Words, Frequency, Class) with the fires as classes."""
+        keys, counts = self.aggregate(None, True, fires, start, end)
+        words = self._representations(topic_model, keys, counts, global_tuning)
+        return pd.DataFrame({'Topic': keys['topic'], 'Words': words, 'Frequency': keys['documents'],
+                             'Class': keys['fire']})
+
+
+def main():
+    from preprocess import add_min_length_argument, long_comments, read_comments
+
+    parser = argparse.ArgumentParser(description="Build or extend the per-(topic, hour, fire) term counts")
+    parser.add_argument("model", help="Saved BERTopic model, e.g. models/safetensor")
+    parser.add_argument("comments", help="Comments file with comment_id, corpus, created_utc, topic_id and "
+                                         "fire_name columns, e.g. from join_index.py")
+    parser.add_argument("-o", "--output", default="topic_time", help="Counts directory (default: topic_time)")
+    parser.add_argument("--append", action="store_true",
+                        help="Add the comments whose comment_id is not counted yet to the existing counts")
+    add_min_length_argument(parser)
+    args = parser.parse_args()
+
+    from bertopic import BERTopic
+
+    topic_model = BERTopic.load(args.model)
+    comments = long_comments(read_comments(args.comments), args.min_length)
+    fires = comments['fire_name'].astype(str) if 'fire_name' in comments.columns else None
+    columns = (comments['corpus'], comments['topic_id'], comments['created_utc'], fires, comments['comment_id'])
+    if args.append:
+        previous = TopicTimeCounts.load(args.output)
+        counts = previous.add(topic_model, *columns)
+        print(f"Added {len(counts.ids) - len(previous.ids)} of {len(comments)} comments (the others were counted)")
+    else:
+        counts = TopicTimeCounts.build(topic_model, *columns)
+    counts.save(args.output)
+    print(f"{len(counts.cells)} cells, {counts.counts.nnz} non-zero counts -> {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
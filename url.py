@@ -1,16 +1,38 @@
 import csv
 from collections import Counter
+from functools import lru_cache
+from itertools import islice
+from multiprocessing import Pool
 import tldextract
 import re
 import urllib.parse
 
 
+URL_PATTERN = re.compile(r'https?://[^\s<>"]+|www\.[^\s<>"]+')
+GOV_HOST_PATTERN = re.compile(r"https?://([^/]+)")
+DOMAIN_REGEX = re.compile(
+    r"^(?=.{1,253}$)(?!-)[A-Za-z0-9-]{1,63}(?<!-)"
+    r"(?:\.(?!-)[A-Za-z0-9-]{1,63}(?<!-))*$"
+)
+GOV_DOMAINS = {"lacounty.gov", "lacity.gov", "ca.gov"}
+BLACKLISTED_TERMS = {'file', 'www', 'http', 'https'}
+
+DOMAIN_MAPPINGS = {
+    'youtu.be': 'youtube.com',
+    'redd.it': 'reddit.com',
+    'gofundme.org': 'gofundme.com',
+    'bbc.co.uk': 'bbc.com',
+    'dailymail.co.uk': 'dailymail.com',
+    'businessinsider.in': 'businessinsider.com',
+    'goo.gl': 'google.com'
+}
+
+
 def extract_urls_from_text(text):
     """
     Extracts all URLs (http/https or www) from a given text string.
     """
-    url_pattern = r'https?://[^\s<>"]+|www\.[^\s<>"]+'
-    return re.findall(url_pattern, text)
+    return URL_PATTERN.findall(text)
 
 
 def is_valid_url(url):
@@ -28,7 +50,20 @@ def is_valid_url(url):
         return False
 
 
-def normalize_domain_to_com(domain, domain_mappings):
+def build_com_index(domain_mappings):
+    """
+    Precomputes {name: mapped .com domain} for normalize_domain_to_com, where name is the
+    first label of the mapped domain. The first mapping wins, as in the original scan.
+    """
+    com_index = {}
+    for existing_domain in domain_mappings.values():
+        existing_domain_lower = existing_domain.lower()
+        if existing_domain_lower.endswith('.com'):
+            com_index.setdefault(existing_domain_lower.split('.')[0], existing_domain)
+    return com_index
+
+
+def normalize_domain_to_com(domain, domain_mappings, com_index=None):
     """
     Normalizes a domain name to its .com equivalent if possible.
     """
@@ -42,14 +77,9 @@ def normalize_domain_to_com(domain, domain_mappings):
 
     parts = domain.split('.')
     if len(parts) >= 2:
-        name = parts[0].lower()
-
-        for existing_domain in domain_mappings.values():
-            existing_domain_lower = existing_domain.lower()
-            existing_name = existing_domain_lower.split('.')[0]
-
-            if existing_name == name and existing_domain_lower.endswith('.com'):
-                return existing_domain
+        if com_index is None:
+            com_index = build_com_index(domain_mappings)
+        return com_index.get(parts[0].lower(), domain)
 
     return domain
 
@@ -60,8 +90,8 @@ def extract_full_domain(url, extracted):
     """
     registered_domain = f"{extracted.domain}.{extracted.suffix}"
 
-    if registered_domain in {"lacounty.gov", "lacity.gov", "ca.gov"}:
-        match = re.search(r"https?://([^/]+)", url)
+    if registered_domain in GOV_DOMAINS:
+        match = GOV_HOST_PATTERN.search(url)
         if match:
             return match.group(1).replace("www.", "")
 
@@ -75,62 +105,137 @@ def is_valid_domain(domain):
     if ')' in domain:
         return False
 
-    blacklisted_terms = {'file', 'www', 'http', 'https'}
-    if domain.lower() in blacklisted_terms:
+    if domain.lower() in BLACKLISTED_TERMS:
         return False
 
-    domain_regex = re.compile(
-        r"^(?=.{1,253}$)(?!-)[A-Za-z0-9-]{1,63}(?<!-)"
-        r"(?:\.(?!-)[A-Za-z0-9-]{1,63}(?<!-))*$"
-    )
+    return bool(DOMAIN_REGEX.match(domain))
 
-    return bool(domain_regex.match(domain))
 
+def netloc_key(url):
+    """
+    Returns the part of a URL that tldextract looks at (the authority), used as cache key.
+    """
+    if url.startswith(('http://', 'https://')):
+        rest = url.partition('://')[2]
+    elif '//' in url:
+        return url  # Unusual URL: do not share its cache entry with others
+    else:
+        rest = url
+    return rest.partition('/')[0].partition('?')[0].partition('#')[0]
 
-def main(input_csv, output_unique_domains, output_sorted_domains_count):
+
+class DomainResolver:
     """
-    Main execution logic to read comments, extract, normalize, and count domains.
+    Resolves URLs to normalized domains exactly like main() did for each URL, with caches.
+
+    tldextract results are cached by netloc, and normalization plus validation by domain,
+    so repeated hosts cost a dictionary lookup. The .com normalization uses a precomputed
+    reverse index instead of scanning all mappings.
+
+    Args:
+        domain_mappings (dict): Domain aliases, e.g. {'youtu.be': 'youtube.com'}.
+        cache_size (int): Maximum number of cached netlocs and domains.
     """
-    domain_mappings = {
-        'youtu.be': 'youtube.com',
-        'redd.it': 'reddit.com',
-        'gofundme.org': 'gofundme.com',
-        'bbc.co.uk': 'bbc.com',
-        'dailymail.co.uk': 'dailymail.com',
-        'businessinsider.in': 'businessinsider.com',
-        'goo.gl': 'google.com'
-    }
 
-    unique_domains_set = set()
-    all_domains = []
+    def __init__(self, domain_mappings=DOMAIN_MAPPINGS, cache_size=100000):
+        self.domain_mappings = domain_mappings
+        self.com_index = build_com_index(domain_mappings)
+        self._extract = lru_cache(maxsize=cache_size)(self._extract_netloc)
+        self._finalize = lru_cache(maxsize=cache_size)(self._finalize_domain)
 
-    try:
-        with open(input_csv, 'r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                body = row.get('body', '')
-                urls = extract_urls_from_text(body)
+    @staticmethod
+    def _extract_netloc(netloc):
+        # tldextract only looks at the netloc, so extracting it gives the same result as the URL
+        extracted = tldextract.extract(netloc)
+        return f"{extracted.domain}.{extracted.suffix}", extracted.domain, bool(extracted.suffix)
+
+    def _finalize_domain(self, domain):
+        domain = normalize_domain_to_com(domain, self.domain_mappings, self.com_index)
+        return domain if is_valid_domain(domain) else None
 
-                for url in urls:
-                    if not is_valid_url(url):
-                        continue
+    def resolve(self, url):
+        """
+        Returns the normalized domain of a URL, or None if the URL or domain is invalid.
+        """
+        if not is_valid_url(url):
+            return None
 
-                    decoded_url = urllib.parse.unquote(url)
-                    extracted = tldextract.extract(decoded_url)
-                    domain = extract_full_domain(decoded_url, extracted)
+        decoded_url = urllib.parse.unquote(url)
+        registered_domain, name, has_suffix = self._extract(netloc_key(decoded_url))
 
-                    if domain:
-                        domain = normalize_domain_to_com(domain, domain_mappings)
+        if registered_domain in GOV_DOMAINS:
+            # The government host is taken from the URL text itself, as in extract_full_domain
+            match = GOV_HOST_PATTERN.search(decoded_url)
+            if match:
+                return self._finalize(match.group(1).replace("www.", ""))
 
-                        if is_valid_domain(domain):
-                            unique_domains_set.add(domain)
-                            all_domains.append(domain)
+        domain = registered_domain if has_suffix else name
+        if not domain:
+            return None
+        return self._finalize(domain)
+
+    def count_domains(self, bodies):
+        """
+        Counts the domains linked in comment bodies, in order of first appearance.
+        """
+        counts = Counter()
+        for body in bodies:
+            for url in extract_urls_from_text(body):
+                domain = self.resolve(url)
+                if domain is not None:
+                    counts[domain] += 1
+        return counts
+
+
+_resolver = None
+
+
+def _init_worker(domain_mappings):
+    global _resolver
+    _resolver = DomainResolver(domain_mappings)
+
+
+def _count_chunk(bodies):
+    return _resolver.count_domains(bodies)
+
+
+def iter_body_chunks(input_csv, chunk_rows):
+    """
+    Yields lists of comment bodies, chunk_rows rows at a time.
+    """
+    with open(input_csv, 'r', encoding='utf-8') as file:
+        bodies = (row.get('body', '') for row in csv.DictReader(file))
+        while True:
+            chunk = list(islice(bodies, chunk_rows))
+            if not chunk:
+                return
+            yield chunk
+
+
+def main(input_csv, output_unique_domains, output_sorted_domains_count, workers=1, chunk_rows=5000):
+    """
+    Main execution logic to read comments, extract, normalize, and count domains.
+
+    Comments are read in chunks of chunk_rows rows; with workers > 1 the chunks are
+    processed in a process pool and their Counters merged in input order.
+    """
+    try:
+        chunks = iter_body_chunks(input_csv, chunk_rows)
+        domain_counts = Counter()
+        if workers > 1:
+            with Pool(workers, initializer=_init_worker, initargs=(DOMAIN_MAPPINGS,)) as pool:
+                for counts in pool.imap(_count_chunk, chunks):
+                    domain_counts.update(counts)
+        else:
+            resolver = DomainResolver(DOMAIN_MAPPINGS)
+            for chunk in chunks:
+                domain_counts.update(resolver.count_domains(chunk))
 
     except FileNotFoundError:
         print(f"Error: The input file was not found: {input_csv}")
         return
 
-    domain_counts = Counter(all_domains)
+    unique_domains_set = set(domain_counts)
     sorted_domain_counts = sorted(
         domain_counts.items(),
         key=lambda item: item[1],
@@ -169,5 +274,6 @@ def main(input_csv, output_unique_domains, output_sorted_domains_count):
 #     main(
 #         INPUT_CSV,
 #         OUTPUT_UNIQUE_DOMAINS,
-#         OUTPUT_SORTED_DOMAINS_COUNT
+#         OUTPUT_SORTED_DOMAINS_COUNT,
+#         workers=4
 #     )